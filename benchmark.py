@@ -0,0 +1,348 @@
+"""
+Benchmark that replays recorded inputs headlessly and measures frame time of every stage.
+Record inputs with: python main.py save1.json --record inputs.json
+Then run:           python benchmark.py save1.json --inputs inputs.json --output result.json
+Without --inputs a scripted run (run right, jump, double jump) is used,
+level "synthetic" generates a big procedural level instead of loading one.
+With --threaded frames are drawn on render thread from snapshots (main.py --threaded),
+latency (inputs read to frame on screen) and frames/s are reported in both modes.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import subprocess
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import main as game_main
+import data.world_data as world_data
+from data.tile_map import TileMap
+from data.world import TIMESTEP
+from data.present import Presenter
+from data.render_thread import RenderThread
+
+
+STAGES = ("background", "render_tiles", "collision", "player.move", "enemies", "simulation", "enemies.render", "entities", "effects", "present")
+THREADED_STAGES = ("collision", "player.move", "enemies", "simulation", "snapshot", "render", "present")
+
+
+def make_synthetic_level(width=600, height=40):
+
+    """
+    Generates long level with ground, floating platforms, background walls and ramps.
+    Returns (tile_map, spawn, borders, finish) like level_compiler.load_level.
+    """
+
+    tile_map = TileMap(0, 0, 0, 0)
+    ground = height - 4
+
+    for x in range(width):
+        for y in range(ground, height):
+            tile_map.add_tile(x, y, 0, "tileset_grassland", 1 if y == ground else 7)
+
+        for y in range(ground - 12, ground):
+            if (x // 8) % 3 == 0:
+                tile_map.add_tile(x, y, -1, "tileset_rock_background", 4)
+
+        if x % 12 in (4, 5, 6, 7):
+            tile_map.add_tile(x, ground - 4 - (x // 12) % 3, 0, "tileset_grassland", 1)
+
+        if x % 30 == 20:
+            tile_map.add_tile(x, ground - 1, 0, "tileset_grassland", 0)
+
+    tile_map.add_tile(2, ground - 1, 0, "spawn", 0)
+    tile_map.add_tile(width - 3, ground - 1, 0, "finish", 0)
+
+    spawn, borders, finish = world_data.get_world_data(tile_map)
+    return tile_map, spawn, borders, finish
+
+
+def scripted_inputs(frames):
+
+    """
+    Holds right and jumps twice every 40 frames, turning around every 600 frames.
+    """
+
+    result = []
+    for frame in range(frames):
+        inputs = []
+        if frame % 600 == 0:
+            direction = "right" if (frame // 600) % 2 == 0 else "left"
+            other = "left" if direction == "right" else "right"
+            inputs += [[other, False], [direction, True]]
+        if frame % 40 in (0, 8):
+            inputs.append(["jump", True])
+        result.append([TIMESTEP, inputs])
+    return result
+
+
+def spawn_enemies(world, amount, seed=1):
+
+    """
+    Drops amount of enemies at random places above the level, walking in random directions.
+    """
+
+    random.seed(seed)
+    borders = world.borders
+    for i in range(amount):
+        width, height = random.choice(((20, 20), (15, 24), (30, 20), (14, 43)))
+        world.enemies.spawn(random.uniform(borders[0], borders[2] - width), random.uniform(-400, 0), width, height,
+                            direction=random.choice((-1, 1)))
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if ordered == []:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def summarize(values):
+    return {"p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000,
+            "mean": sum(values) / max(len(values), 1) * 1000}
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=game_main.MAIN_PATH,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer(object):
+
+    """
+    Collects time spent in each stage during one frame.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.current = {stage: 0 for stage in stages}
+
+    def wrap(self, stage, function):
+
+        """
+        Returns function that adds its run time to stage.
+        """
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.current[stage] += time.perf_counter() - start
+            return result
+
+        return timed
+
+    def reset(self):
+        for stage in self.current:
+            self.current[stage] = 0
+
+
+def run_benchmark(level_name, frames, screen_size=(960, 540), game_size=(480, 270), allocations=False, enemies=0, threaded=False):
+
+    """
+    Replays frames ([elapsed, inputs] per frame) and returns result dict with per stage percentiles in ms.
+    With allocations, memory each frame allocated on top of what it started with is measured too (slow).
+    Enemies adds that many randomly placed enemies to the level.
+    With threaded, render stage is time render thread spent on the frame and present is
+    how long main thread waited for it, latency of a frame ends when it is shown one frame later.
+    """
+
+    screen = pygame.display.set_mode(screen_size)
+    surface = pygame.Surface(game_size)
+    presenter = Presenter(screen, game_size)
+
+    level = make_synthetic_level() if level_name == "synthetic" else None
+    load_start = time.perf_counter()
+    game = game_main.load_game(surface, level_name, level)
+    load_time = time.perf_counter() - load_start
+
+    world = game["world"]
+    stages = THREADED_STAGES if threaded else STAGES
+    timer = StageTimer(stages)
+
+    # player.move includes collision queries, they are subtracted below
+    world.player.move = timer.wrap("player.move", world.player.move)
+    world.collision_grid.get_solid_cells = timer.wrap("collision", world.collision_grid.get_solid_cells)
+    world.collision_grid.get_ramp_cells = timer.wrap("collision", world.collision_grid.get_ramp_cells)
+
+    if world.enemies != None:
+        spawn_enemies(world, enemies)
+        world.enemies.step = timer.wrap("enemies", world.enemies.step)
+
+    samples = {stage: [] for stage in stages}
+    samples["latency"] = []
+    samples["total"] = []
+    allocated = []
+    culled = []
+
+    renderer = None
+    if threaded:
+        renderer = RenderThread(surface, presenter, lambda surface, snapshot: game_main.render_snapshot(surface, game, snapshot))
+
+    if allocations:
+        tracemalloc.start()
+
+    run_start = time.perf_counter()
+    for elapsed, inputs in frames:
+
+        timer.reset()
+        if allocations:
+            tracemalloc.reset_peak()
+            allocation_base = tracemalloc.get_traced_memory()[0]
+        frame_start = time.perf_counter()
+
+        start = time.perf_counter()
+        game_main.update_streaming(surface, game)
+        world.advance(elapsed, [tuple(event) for event in inputs])
+        simulation = time.perf_counter() - start
+
+        if renderer != None:
+            start = time.perf_counter()
+            snapshot = game_main.take_snapshot(game, game_size, None, frame_start)
+            timer.current["snapshot"] = time.perf_counter() - start
+
+            # previous frame, drawn while this one was simulated
+            start = time.perf_counter()
+            drawn = renderer.wait()
+            if drawn != None:
+                presenter.flip()
+                samples["latency"].append(time.perf_counter() - drawn.time)
+                samples["render"].append(renderer.render_time)
+                culled.append(game["chunk_cache"].culled + game["background_cache"].culled)
+            renderer.submit(snapshot)
+            timer.current["present"] = time.perf_counter() - start
+
+            total = time.perf_counter() - frame_start
+            timer.current["player.move"] -= timer.current["collision"]
+            timer.current["simulation"] = simulation - timer.current["player.move"] - timer.current["collision"] - timer.current["enemies"]
+
+            for stage in stages:
+                if stage != "render":
+                    samples[stage].append(timer.current[stage])
+            samples["total"].append(total)
+            continue
+
+        camera_offset = world.get_camera_offset()
+
+        start = time.perf_counter()
+        game_main.render_background(surface, camera_offset, game["background"])
+        timer.current["background"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        game_main.render_tiles(surface, game["chunk_cache"], camera_offset)
+        timer.current["render_tiles"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        game_main.render_enemies(surface, world, camera_offset, game["enemy_images"])
+        timer.current["enemies.render"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        game_main.render_entities(surface, world, camera_offset)
+        timer.current["entities"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        game_main.render_effects(surface, world, camera_offset)
+        timer.current["effects"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        presenter.present(surface)
+        timer.current["present"] += time.perf_counter() - start
+
+        total = time.perf_counter() - frame_start
+        samples["latency"].append(total)
+        culled.append(game["chunk_cache"].culled + game["background_cache"].culled)
+
+        if allocations:
+            allocated.append(tracemalloc.get_traced_memory()[1] - allocation_base)
+
+        timer.current["player.move"] -= timer.current["collision"]
+        timer.current["simulation"] = simulation - timer.current["player.move"] - timer.current["collision"] - timer.current["enemies"]
+
+        for stage in STAGES:
+            samples[stage].append(timer.current[stage])
+        samples["total"].append(total)
+
+    if renderer != None: # last frame
+        drawn = renderer.wait()
+        presenter.flip()
+        samples["latency"].append(time.perf_counter() - drawn.time)
+        samples["render"].append(renderer.render_time)
+        renderer.close()
+    run_time = time.perf_counter() - run_start
+    if game["streamed_map"] != None:
+        game["streamed_map"].close()
+
+    result = {"level": level_name,
+              "commit": get_commit(),
+              "mode": "threaded" if threaded else "serial",
+              "frames": len(frames),
+              "frames_per_second": len(frames) / max(run_time, 1e-9),
+              "ticks": world.ticks,
+              "enemies": 0 if world.enemies == None else world.enemies.count,
+              "load_time_ms": load_time * 1000,
+              "culled_tiles_per_frame": sum(culled) / max(len(culled), 1),
+              "stages_ms": {stage: summarize(values) for stage, values in samples.items()}}
+
+    if allocations:
+        tracemalloc.stop()
+        result["allocated_bytes"] = {"p50": percentile(allocated, 50),
+                                     "p99": percentile(allocated, 99),
+                                     "mean": sum(allocated) / max(len(allocated), 1)}
+
+    return result
+
+
+def print_result(result):
+    print(f"{result['level']}: {result['frames']} frames, {result['ticks']} ticks, {result['enemies']} enemies, commit {result['commit']}")
+    print(f"{result['mode']} mode: {result['frames_per_second']:.1f} frames/s, latency p50 {result['stages_ms']['latency']['p50']:.3f} ms")
+    print(f"tile blits saved by culling: {result['culled_tiles_per_frame']:.1f} per frame")
+    print(f"{'stage':<14}{'p50':>9}{'p95':>9}{'p99':>9}  ms")
+    for stage, values in result["stages_ms"].items():
+        print(f"{stage:<14}{values['p50']:9.3f}{values['p95']:9.3f}{values['p99']:9.3f}")
+    if "allocated_bytes" in result:
+        allocated = result["allocated_bytes"]
+        print(f"allocated per frame: p50 {allocated['p50']} B, p99 {allocated['p99']} B, mean {allocated['mean']:.0f} B")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Replay inputs headlessly and measure frame time per stage.")
+    parser.add_argument("level", nargs="?", default="save1.json", help="level file in data/ or 'synthetic'")
+    parser.add_argument("--inputs", help="recording made with main.py --record")
+    parser.add_argument("--frames", type=int, default=1200, help="frames of scripted input when no recording is given")
+    parser.add_argument("--output", help="write result as json to this file")
+    parser.add_argument("--enemies", type=int, default=0, help="add this many randomly placed enemies")
+    parser.add_argument("--allocations", action="store_true", help="measure python memory allocated per frame (slow)")
+    parser.add_argument("--threaded", action="store_true", help="draw frames on render thread like main.py --threaded")
+    arguments = parser.parse_args()
+
+    pygame.init()
+
+    if arguments.inputs != None:
+        with open(arguments.inputs) as file:
+            frames = json.load(file)["frames"]
+    else:
+        frames = scripted_inputs(arguments.frames)
+
+    result = run_benchmark(arguments.level, frames, allocations=arguments.allocations, enemies=arguments.enemies, threaded=arguments.threaded)
+    print_result(result)
+
+    if arguments.output != None:
+        with open(arguments.output, "w") as file:
+            json.dump(result, file, indent=4)
+
+    pygame.quit()
+    sys.exit()
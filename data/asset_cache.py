@@ -0,0 +1,189 @@
+"""
+Persistent cache of decoded and sliced images.
+Pixel data of every cached image is stored raw, so next start only rebuilds
+surfaces from bytes instead of decoding and scanning png files again.
+Entries are invalidated when size or mtime of any of their source files change.
+
+Usage: python -m data.asset_cache [--clear]   (warms the cache ahead of time)
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+import os
+import sys
+import pickle
+
+
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "assets.cache")
+
+cache = None
+
+
+class AssetCache(object):
+
+    """
+    Maps key to a list of images plus any extra picklable data (like animation speed).
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = pickle.load(file)
+            if data["version"] == VERSION:
+                self.entries = data["entries"]
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            self.entries = {}
+
+    def save(self):
+
+        """
+        Writes cache to disk when anything changed since it was loaded.
+        """
+
+        if self.dirty == False:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump({"version": VERSION, "entries": self.entries}, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def clear(self):
+        self.entries = {}
+        self.dirty = True
+
+    def is_valid(self, entry):
+        for path, stamp in entry["stamps"].items():
+            if get_stamp(path) != stamp:
+                return False
+        return True
+
+    def lookup(self, key):
+
+        """
+        Returns (image records, data) of up to date entry or None, without changing the cache,
+        so it can be called from loader threads.
+        """
+
+        entry = self.entries.get(key)
+        if entry != None and self.is_valid(entry):
+            return entry["images"], entry["data"]
+        return None
+
+    def store(self, key, images, data, sources):
+        self.entries[key] = {
+            "stamps": {path: get_stamp(path) for path in sources},
+            "images": [surface_to_record(image) for image in images],
+            "data": data
+        }
+        self.dirty = True
+
+    def get(self, key, build):
+
+        """
+        Returns (images, data) stored under key. When key is missing or stale
+        build() is called, it has to return (images, data, source paths).
+        """
+
+        cached = self.lookup(key)
+
+        if cached != None:
+            self.hits += 1
+            return [surface_from_record(record) for record in cached[0]], cached[1]
+
+        self.misses += 1
+        images, data, sources = build()
+        self.store(key, images, data, sources)
+
+        return images, data
+
+
+def get_stamp(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def surface_to_record(image):
+    return (image.get_size(), pygame.image.tobytes(image, "RGB"), image.get_colorkey(), image.get_alpha())
+
+
+def surface_from_record(record):
+    size, pixels, colorkey, alpha = record
+    image = pygame.image.frombuffer(pixels, size, "RGB").convert()
+    if colorkey != None:
+        image.set_colorkey(colorkey)
+    if alpha != None:
+        image.set_alpha(alpha)
+    return image
+
+
+def open_cache(path=DEFAULT_PATH):
+
+    """
+    Opens cache that is used by get_images, loaders work without it too.
+    """
+
+    global cache
+    cache = AssetCache(path)
+    return cache
+
+
+def get_images(key, build):
+
+    """
+    Returns (images, data) from opened cache, or straight from build() when no cache is open.
+    """
+
+    if cache == None:
+        images, data, sources = build()
+        return images, data
+
+    return cache.get(key, build)
+
+
+def save():
+    if cache != None:
+        cache.save()
+
+
+if __name__ == "__main__":
+
+    main_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    sys.path.insert(0, main_path)
+
+    # loaders import data.asset_cache, which is a different module object than __main__
+    import data.asset_cache as asset_cache
+    import data.world_data as world_data
+    import data.entities as entities
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    warm_cache = asset_cache.open_cache()
+    if "--clear" in sys.argv:
+        warm_cache.clear()
+
+    world_data.load_tilesets(f"{main_path}/data/images/tilesets/")
+    entities.load_animations(f"{main_path}/data/images/animations/")
+    for sequence, base_path in entities.get_player_sequences(f"{main_path}/data/images").values():
+        entities.animation_sequence(sequence, base_path)
+
+    asset_cache.save()
+    print(f"{warm_cache.path}: {len(warm_cache.entries)} entries, {warm_cache.hits} up to date, {warm_cache.misses} rebuilt")
+    pygame.quit()
@@ -0,0 +1,145 @@
+"""
+Startup asset loading on a thread pool.
+Decoding and slicing run on worker threads (pygame releases the GIL while decoding png),
+converting to display format and setting colorkeys runs on the main thread when
+an asset is collected. Jobs listed in priority are submitted first, so assets
+needed for the first screen are ready first.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import asset_cache
+except ImportError:
+    import data.asset_cache as asset_cache
+
+
+class AssetLoader(object):
+
+    """
+    Jobs are added with add or add_images, start submits them and get returns
+    finished asset, waiting for its job when needed.
+    Times of every job are kept in milliseconds since start for get_report.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.jobs = OrderedDict()
+        self.futures = {}
+        self.assets = {}
+        self.times = {}
+        self.executor = None
+        self.start_time = None
+
+    def add(self, key, decode, finish=None):
+
+        """
+        Adds job, decode() runs on worker thread and finish(result) on main thread.
+        """
+
+        self.jobs[key] = [decode, finish]
+
+    def add_images(self, key, cache_key, decode, prepare):
+
+        """
+        Adds job loading images through asset cache. decode() returns unconverted
+        (images, data, sources) like asset cache build, prepare(images) converts them.
+        Up to date cache entries skip decoding, their surfaces are rebuilt on main thread.
+        Asset is (images, data).
+        """
+
+        def decode_cached():
+            if asset_cache.cache != None:
+                cached = asset_cache.cache.lookup(cache_key)
+                if cached != None:
+                    return True, cached
+            return False, decode()
+
+        def finish(result):
+            cached, loaded = result
+
+            if cached:
+                asset_cache.cache.hits += 1
+                return [asset_cache.surface_from_record(record) for record in loaded[0]], loaded[1]
+
+            images, data, sources = loaded
+            images = prepare(images)
+            if asset_cache.cache != None:
+                asset_cache.cache.misses += 1
+                asset_cache.cache.store(cache_key, images, data, sources)
+            return images, data
+
+        self.add(key, decode_cached, finish)
+
+    def start(self, priority=()):
+
+        """
+        Submits all jobs, the ones in priority first and in its order.
+        """
+
+        self.start_time = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        keys = [key for key in priority if key in self.jobs]
+        keys += [key for key in self.jobs if key not in keys]
+
+        for key in keys:
+            self.futures[key] = self.executor.submit(self.run, key)
+
+    def get_time(self):
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def run(self, key):
+
+        """
+        Runs decode part of a job on worker thread.
+        """
+
+        started = self.get_time()
+        result = self.jobs[key][0]()
+        self.times[key] = {"started": started, "decoded": self.get_time()}
+        return result
+
+    def get(self, key):
+
+        """
+        Returns asset of job, waiting for it and finishing it on this thread the first time.
+        """
+
+        if key not in self.assets:
+            result = self.futures[key].result()
+
+            finish_start = self.get_time()
+            finish = self.jobs[key][1]
+            self.assets[key] = result if finish == None else finish(result)
+            self.times[key]["finish"] = self.get_time() - finish_start
+            self.times[key]["ready"] = self.get_time()
+
+        return self.assets[key]
+
+    def close(self):
+        if self.executor != None:
+            self.executor.shutdown()
+
+    def get_report(self):
+
+        """
+        Returns [key, started, decode ms, finish ms, ready] of collected jobs, in order they got ready.
+        """
+
+        report = []
+        for key, times in self.times.items():
+            if "ready" in times:
+                report.append([key, times["started"], times["decoded"] - times["started"], times["finish"], times["ready"]])
+        return sorted(report, key=lambda row: row[4])
+
+    def print_report(self, first_frame=None):
+        print(f"{'asset':<40}{'start':>9}{'decode':>9}{'finish':>9}{'ready':>9}  ms")
+        for key, started, decode, finish, ready in self.get_report():
+            print(f"{key[-40:]:<40}{started:9.1f}{decode:9.1f}{finish:9.1f}{ready:9.1f}")
+        if first_frame != None:
+            print(f"time to first frame: {first_frame:.1f} ms")
@@ -0,0 +1,92 @@
+"""
+Texture atlas: many small images packed into one or a few big surfaces at load time.
+Every image is then a source rect in an atlas page, so drawing a whole list of images
+is a single Surface.blits call and only a handful of surfaces stay alive.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+
+
+class TextureAtlas(object):
+
+    """
+    Packs images into pages of at most page_size pixels, in rows (shelves) of images
+    sorted by height so little space is wasted. Pages keep the flags of the first image,
+    so all images should share pixel format (like SRCALPHA tiles).
+    """
+
+    def __init__(self, images, page_size=(1024, 1024), padding=1):
+        self.page_size = page_size
+        self.padding = padding
+        self.pages = []
+        self.rects = {}
+        self.pack(images)
+
+    def pack(self, images):
+
+        """
+        Places images (dict of key: surface) and copies them into pages.
+        """
+
+        if images == {}:
+            return
+
+        order = sorted(images, key=lambda key: (-images[key].get_height(), -images[key].get_width()))
+        flags = images[order[0]].get_flags() & pygame.SRCALPHA
+        padding = self.padding
+
+        # shelf packing: fill row left to right, start new row (or page) when the image doesn't fit
+        placements = []
+        page, x, y, row_height = 0, 0, 0, 0
+        page_width, page_height = self.page_size
+
+        # rows about as long as the atlas is tall, one long row wastes space above short images
+        area = sum((image.get_width() + padding) * (image.get_height() + padding) for image in images.values())
+        widest = max(image.get_width() for image in images.values())
+        page_width = min(page_width, max(widest, int(area ** 0.5 * 1.5)))
+
+        for key in order:
+            width, height = images[key].get_size()
+            if width > page_width or height > page_height:
+                raise ValueError(f"image {key} of size {width}x{height} doesn't fit atlas page {page_width}x{page_height}")
+
+            if x + width > page_width:
+                x, y, row_height = 0, y + row_height + padding, 0
+            if y + height > page_height:
+                page, x, y, row_height = page + 1, 0, 0, 0
+
+            placements.append((key, page, x, y))
+            x += width + padding
+            row_height = max(row_height, height)
+
+        # pages are only as big as what was placed into them
+        sizes = [[1, 1] for i in range(page + 1)]
+        for key, page, x, y in placements:
+            width, height = images[key].get_size()
+            sizes[page][0] = max(sizes[page][0], x + width)
+            sizes[page][1] = max(sizes[page][1], y + height)
+
+        self.pages = [pygame.Surface(size, flags) for size in sizes]
+        for page in self.pages:
+            page.fill((0, 0, 0, 0))
+
+        for key, page, x, y in placements:
+            image = images[key]
+            self.pages[page].blit(image, (x, y), special_flags=pygame.BLEND_RGBA_ADD if flags else 0)
+            self.rects[key] = (self.pages[page], pygame.Rect(x, y, image.get_width(), image.get_height()))
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def get(self, key):
+
+        """
+        Returns (page surface, source rect) of image.
+        """
+
+        return self.rects[key]
+
+    def nbytes(self):
+        return sum(page.get_width() * page.get_height() * page.get_bytesize() for page in self.pages)
@@ -0,0 +1,201 @@
+"""
+Collision grid built from tile map once, so physics only looks at
+the cells a moving rect overlaps instead of lists of tile rects.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+from array import array
+
+try:
+    import world_data
+except ImportError:
+    import data.world_data as world_data
+
+
+EMPTY = 0
+SOLID = 1
+
+
+def get_ramp_peaks(ramp_heights):
+
+    """
+    Returns peaks[ramp][first][last], the highest surface between pixel columns first and last of ramp,
+    so the floor under a box is one lookup for ramps of any shape (not only straight slopes).
+    """
+
+    peaks = []
+    for heights in ramp_heights:
+        columns = len(heights)
+        table = [[0] * columns for column in range(columns)]
+        for first in range(columns):
+            highest = heights[first]
+            for last in range(first, columns):
+                highest = max(highest, heights[last])
+                table[first][last] = highest
+        peaks.append(table)
+    return peaks
+
+
+class CollisionGrid(object):
+
+    """
+    Stores for every cell whether it is solid and which ramp type it has (0 = no ramp).
+    Cells outside of the map are empty, cells of a streamed map that aren't loaded yet are solid.
+    ramp_heights from world_data.compile_ramp_heights give surface height of every ramp type.
+    """
+
+    def __init__(self, tile_map, tile_flags, tile_size=20, ramp_heights=None):
+        self.tile_map = tile_map
+        self.tile_flags = tile_flags
+        self.tile_size = tile_size
+        if ramp_heights == None:
+            ramp_heights = world_data.compile_ramp_heights({}, tile_size)
+        self.ramp_heights = ramp_heights
+        self.ramp_peaks = get_ramp_peaks(ramp_heights)
+        self.rebuild()
+
+    def rebuild(self):
+
+        """
+        Recomputes collision data of the whole tile map.
+        """
+
+        self.min_x = self.tile_map.min_x
+        self.min_y = self.tile_map.min_y
+        self.width = self.tile_map.width
+        self.height = self.tile_map.height
+        self.solid = array('b', bytes(self.width * self.height))
+        self.ramps = array('b', bytes(self.width * self.height))
+
+        tile_flags = world_data.get_tile_flags(self.tile_flags, self.tile_map.tileset_names)
+
+        for x, y in self.tile_map.cells():
+            self.set_cell(x, y, tile_flags)
+
+        for area in self.tile_map.get_pending_areas():
+            self.update_area(*area)
+
+    def update_cell(self, x, y):
+
+        """
+        Recomputes collision data of one cell, call it after changing tiles in tile map.
+        """
+
+        if not self.in_bounds(x, y):
+            self.rebuild()
+            return
+
+        self.set_cell(x, y, world_data.get_tile_flags(self.tile_flags, self.tile_map.tileset_names))
+
+    def update_area(self, x1, y1, x2, y2):
+
+        """
+        Recomputes collision data of cells x1 <= x < x2, y1 <= y < y2,
+        like after a region of streamed map was loaded or dropped.
+        """
+
+        tile_flags = world_data.get_tile_flags(self.tile_flags, self.tile_map.tileset_names)
+
+        for y in range(max(y1, self.min_y), min(y2, self.min_y + self.height)):
+            for x in range(max(x1, self.min_x), min(x2, self.min_x + self.width)):
+                self.set_cell(x, y, tile_flags)
+
+    def set_cell(self, x, y, tile_flags):
+        cell = self.cell_index(x, y)
+
+        if not self.tile_map.is_ready(x, y):
+            self.solid[cell] = SOLID
+            self.ramps[cell] = 0
+            return
+
+        solid = EMPTY
+        ramp = 0
+
+        for depth, tileset, tile in self.tile_map.get_tiles(x, y):
+            flags = tile_flags[tileset][0]
+            flags = flags[tile] if tile < len(flags) else 0
+
+            if flags & world_data.NO_COLLIDE:
+                continue
+            if flags >> world_data.RAMP_SHIFT:
+                if ramp == 0:
+                    ramp = flags >> world_data.RAMP_SHIFT
+            else:
+                solid = SOLID
+
+        self.solid[cell] = solid
+        self.ramps[cell] = ramp
+
+    def in_bounds(self, x, y):
+        return self.min_x <= x < self.min_x + self.width and self.min_y <= y < self.min_y + self.height
+
+    def cell_index(self, x, y):
+        return (y - self.min_y) * self.width + x - self.min_x
+
+    def is_solid(self, x, y):
+        return self.in_bounds(x, y) and self.solid[self.cell_index(x, y)] == SOLID
+
+    def get_ramp(self, x, y):
+        if self.in_bounds(x, y):
+            return self.ramps[self.cell_index(x, y)]
+        return 0
+
+    def get_cells(self, rect, sweep_x=0, sweep_y=0):
+
+        """
+        Returns range of cells overlapped by rect as (x1, y1, x2, y2), end exclusive.
+        With sweep, range also covers the gap between leading edge of rect before it moved
+        by sweep and the rect, which is empty unless the move was longer than the rect.
+        """
+
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+
+        if sweep_x > 0:
+            left = min(left, right - sweep_x)
+        elif sweep_x < 0:
+            right = max(right, left - sweep_x)
+
+        if sweep_y > 0:
+            top = min(top, bottom - sweep_y)
+        elif sweep_y < 0:
+            bottom = max(bottom, top - sweep_y)
+
+        return (left // self.tile_size, top // self.tile_size,
+                (right - 1) // self.tile_size + 1, (bottom - 1) // self.tile_size + 1)
+
+    def get_solid_cells(self, rect, sweep_x=0, sweep_y=0):
+
+        """
+        Returns positions of solid cells overlapped by rect, or by the area it swept
+        when it just moved by sweep_x, sweep_y pixels, so fast objects can't skip a cell.
+        """
+
+        x1, y1, x2, y2 = self.get_cells(rect, sweep_x, sweep_y)
+        return [(x, y) for y in range(y1, y2) for x in range(x1, x2) if self.is_solid(x, y)]
+
+    def get_ramp_cells(self, rect):
+
+        """
+        Returns [x, y, ramp type] of ramp cells overlapped by rect.
+        """
+
+        x1, y1, x2, y2 = self.get_cells(rect)
+        ramps = []
+        for y in range(y1, y2):
+            for x in range(x1, x2):
+                ramp = self.get_ramp(x, y)
+                if ramp != 0:
+                    ramps.append([x, y, ramp])
+        return ramps
+
+    def get_ramp_floor(self, ramp, ramp_x, ramp_y, left, right):
+
+        """
+        Returns y of ramp surface under a box spanning left to right pixels,
+        the highest point of the slope the box covers.
+        """
+
+        tile_size = self.tile_size
+        height = self.ramp_peaks[ramp][min(max(left - ramp_x, 0), tile_size)][min(max(right - ramp_x, 0), tile_size)]
+        return ramp_y + tile_size - height
@@ -1,9 +1,204 @@
+"""
+Hot path instrumentation: named timers and counters collected into a ring buffer
+of the last frames, plus an overlay that draws them with cached glyphs.
+When profiler is disabled, begin/end/count return right away.
+Render thread records into the same profiler, so changes are made under a lock.
+Allocation tracking (tracemalloc) is slow, so it has its own switch. It only sees python
+memory, pixels of SDL surfaces are allocated outside of it.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
 import pygame
+import time
+import json
+import threading
+import tracemalloc
+from array import array
+
+
+class Profiler(object):
+
+    """
+    Timers and counters are summed during a frame, end_frame stores them
+    into ring buffer of the last `size` frames.
+    """
+
+    def __init__(self, size=240, enabled=False):
+        self.size = size
+        self.enabled = enabled
+        self.frame = 0
+        self.current = {}
+        self.history = {}
+        self.allocation_base = 0
+        self.lock = threading.RLock()
+
+    def begin(self):
+        if self.enabled:
+            return time.perf_counter()
+        return 0
+
+    def end(self, name, start):
+        if self.enabled:
+            with self.lock:
+                self.current[name] = self.current.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.current[name] = self.current.get(name, 0) + amount
+
+    def end_frame(self):
+
+        """
+        Moves values of finished frame into ring buffer.
+        """
+
+        if self.enabled == False:
+            return
+
+        with self.lock:
+            if tracemalloc.is_tracing():
+                # highest memory above the level at frame start, which is what the frame allocated and threw away
+                current, peak = tracemalloc.get_traced_memory()
+                self.current["alloc.kb"] = max(peak - self.allocation_base, 0) / 1024
+                tracemalloc.reset_peak()
+                self.allocation_base = current
+
+            slot = self.frame % self.size
+            for name in self.current.keys() | self.history.keys():
+                if name not in self.history:
+                    self.history[name] = array('d', [0]) * self.size
+                self.history[name][slot] = self.current.get(name, 0)
+
+            self.current.clear()
+            self.frame += 1
+
+    def get_history(self, name):
+
+        """
+        Returns values of name from oldest to newest frame.
+        """
+
+        with self.lock:
+            values = self.history.get(name)
+            if values == None:
+                return []
+
+            frames = min(self.frame, self.size)
+            start = (self.frame - frames) % self.size
+            return [values[(start + i) % self.size] for i in range(frames)]
+
+    def get_average(self, name, frames=60):
+        values = self.get_history(name)[-frames:]
+        if values == []:
+            return 0
+        return sum(values) / len(values)
+
+    def dump(self, path):
+
+        """
+        Writes ring buffer to json file, oldest frame first.
+        """
+
+        with self.lock:
+            data = {"frames": min(self.frame, self.size),
+                    "last_frame": self.frame,
+                    "values": {name: self.get_history(name) for name in sorted(self.history)}}
+
+        with open(path, "w") as file:
+            json.dump(data, file)
+
+    def track_allocations(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.allocation_base = tracemalloc.get_traced_memory()[0]
+        elif enabled == False and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        with self.lock:
+            self.frame = 0
+            self.current.clear()
+            self.history.clear()
+
+
+profiler = Profiler()
+
+
+class ProfilerOverlay(object):
+
+    """
+    Draws text lines and frame time graph. Glyphs are rendered once per character
+    and a line is only redrawn when its text changes.
+    """
+
+    def __init__(self, font, color=(240, 240, 240), graph_size=(120, 30), graph_max=33.3):
+        self.font = font
+        self.color = color
+        self.glyphs = {}
+        self.lines = []
+        self.line_height = font.get_linesize()
+        self.graph = pygame.Surface(graph_size)
+        self.graph.set_colorkey((0, 0, 0))
+        self.graph_max = graph_max
+        self.last_graph_frame = 0
+
+    def get_glyph(self, character):
+        if character not in self.glyphs:
+            self.glyphs[character] = self.font.render(character, False, self.color)
+        return self.glyphs[character]
+
+    def render_line(self, text):
+        glyphs = [self.get_glyph(character) for character in text]
+        line = pygame.Surface((max(sum(glyph.get_width() for glyph in glyphs), 1), self.line_height))
+        line.set_colorkey((0, 0, 0))
+        x = 0
+        for glyph in glyphs:
+            line.blit(glyph, (x, 0))
+            x += glyph.get_width()
+        return line
+
+    def set_lines(self, texts):
+
+        """
+        Updates displayed lines, re-rendering only the ones that changed.
+        """
+
+        while len(self.lines) > len(texts):
+            self.lines.pop()
+
+        for i, text in enumerate(texts):
+            if i == len(self.lines):
+                self.lines.append([text, self.render_line(text)])
+            elif self.lines[i][0] != text:
+                self.lines[i] = [text, self.render_line(text)]
+
+    def update_graph(self, profiler, name="frame"):
+
+        """
+        Scrolls graph and draws one column for every frame since last update.
+        """
+
+        if profiler.frame < self.last_graph_frame: # profiler was reset
+            self.last_graph_frame = 0
+
+        values = profiler.get_history(name)
+        new_frames = min(profiler.frame - self.last_graph_frame, len(values))
+        self.last_graph_frame = profiler.frame
+
+        width, height = self.graph.get_size()
+        for value in values[len(values) - new_frames:]:
+            self.graph.scroll(-1, 0)
+            self.graph.fill((0, 0, 0), (width - 1, 0, 1, height))
+            bar = min(int(value / self.graph_max * height), height)
+            color = (90, 220, 90) if value < 1000 / 60 else (230, 80, 60)
+            self.graph.fill(color, (width - 1, height - bar, 1, bar))
+
+    def draw(self, surface, pos=(10, 10)):
+        x, y = pos
+        for text, line in self.lines:
+            surface.blit(line, (x, y))
+            y += self.line_height
+        surface.blit(self.graph, (x, y + 2))
 
-def debug(surface, font, *args):
-    debug_surface = pygame.Surface((100, 8 + 16 * (len(args) - 1)))
-    debug_surface.set_colorkey((0, 0, 0))
-    for i, arg in enumerate(args):
-        text_object = font.render(f"{arg}", True, (240,240,240))
-        debug_surface.blit(text_object, (0, i * 16))
-    surface.blit(debug_surface, (10, 10))
\ No newline at end of file
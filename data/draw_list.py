@@ -0,0 +1,195 @@
+"""
+Tiles in draw order, sorted once per band of rows instead of every time they are drawn.
+Every band keeps one set of flat arrays per depth, sorted by (y, x, tileset index, tile),
+so tiles of an area come out in (depth, y, x, tileset index, tile) order just by walking
+depths of the band in order and slicing rows out of the arrays.
+Tiles completely hidden under an opaque tile drawn later in the same cell are left out.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+from array import array
+from bisect import bisect_left
+
+try:
+    import world_data
+except ImportError:
+    import data.world_data as world_data
+
+
+def get_tile_coverage(tilesets, tile_flags, tile_size):
+
+    """
+    Returns two sets of (tileset_id, tile): opaque tiles that cover their whole cell
+    (no colorkey pixels, no alpha like tileset_muck) and tiles drawn only inside their cell.
+    A tile from the second set is hidden when a tile from the first one is drawn after it.
+    """
+
+    opaque = set()
+    inside = set()
+
+    for tileset_id, tileset in tilesets.items():
+        flags, offset_x, offset_y = tile_flags.get(tileset_id, [[], [], []])
+        for tile, image in enumerate(tileset):
+            x, y = 0, 0
+            if tile < len(flags):
+                if flags[tile] & world_data.INVISIBLE:
+                    continue
+                x, y = offset_x[tile], offset_y[tile]
+            width, height = image.get_size()
+
+            if x >= 0 and y >= 0 and x + width <= tile_size and y + height <= tile_size:
+                inside.add((tileset_id, tile))
+
+            if x > 0 or y > 0 or x + width < tile_size or y + height < tile_size:
+                continue
+            if image.get_alpha() not in (None, 255):
+                continue
+            # mask leaves out colorkey pixels and, with threshold 254, any per pixel transparency
+            if pygame.mask.from_surface(image, 254).count() == width * height:
+                opaque.add((tileset_id, tile))
+
+    return opaque, inside
+
+
+class DrawList(object):
+
+    """
+    Draw order of tile map, split into bands of band_size rows. A band is built the first time
+    its tiles are queried and kept until invalidated, call invalidate or invalidate_area
+    whenever tiles of the map change (like when regions of streamed map are loaded).
+    With coverage from get_tile_coverage, hidden tiles are culled, query_hidden returns them.
+    """
+
+    def __init__(self, tile_map, band_size=16, coverage=None):
+        self.tile_map = tile_map
+        self.band_size = band_size
+        self.coverage = coverage
+        self.bands = {}
+        self.hidden = {}
+
+    def get_cell_key(self, x, y):
+
+        """
+        Returns number that sorts cells by y first and x second, used to find rows in sorted arrays.
+        It doesn't depend on map bounds, so bands stay valid when the map grows.
+        """
+
+        return (y << 32) + x
+
+    def build_band(self, band):
+
+        """
+        Sorts tiles of band into {depth: [cell keys, ys, xs, tileset indexes, tiles]},
+        hidden tiles are kept separately in self.hidden as [cell keys, depths, tileset indexes].
+        """
+
+        tile_map = self.tile_map
+        y1 = band * self.band_size
+        tiles = tile_map.query(tile_map.min_x, y1, tile_map.min_x + tile_map.width, y1 + self.band_size)
+        tiles.sort()
+
+        hidden = sorted((self.get_cell_key(tiles[i][2], tiles[i][1]), tiles[i][0], tiles[i][3]) for i in self.get_hidden(tiles))
+        self.hidden[band] = [array('q', [key for key, depth, tileset in hidden]),
+                             array('h', [depth for key, depth, tileset in hidden]),
+                             array('h', [tileset for key, depth, tileset in hidden])]
+
+        layers = {}
+        for i, (depth, y, x, tileset, tile) in enumerate(tiles):
+            if i in hidden:
+                continue
+            if depth not in layers:
+                layers[depth] = [array('q'), array('i'), array('i'), array('h'), array('h')]
+            keys, ys, xs, tilesets, tile_ids = layers[depth]
+            keys.append(self.get_cell_key(x, y))
+            ys.append(y)
+            xs.append(x)
+            tilesets.append(tileset)
+            tile_ids.append(tile)
+
+        return layers
+
+    def get_hidden(self, tiles):
+
+        """
+        Returns indexes of sorted tiles covered by an opaque tile later in the same cell.
+        """
+
+        if self.coverage == None:
+            return set()
+
+        opaque, inside = self.coverage
+        names = self.tile_map.tileset_names
+
+        last_cover = {}
+        for i, (depth, y, x, tileset, tile) in enumerate(tiles):
+            if (names[tileset], tile) in opaque:
+                last_cover[(x, y)] = i
+
+        return {i for i, (depth, y, x, tileset, tile) in enumerate(tiles)
+                if i < last_cover.get((x, y), -1) and (names[tileset], tile) in inside}
+
+    def get_band(self, band):
+        if band not in self.bands:
+            self.bands[band] = self.build_band(band)
+        return self.bands[band]
+
+    def query(self, x1, y1, x2, y2):
+
+        """
+        Returns tiles in cells x1 <= x < x2, y1 <= y < y2 as [depth, y, x, tileset index, tile]
+        in the order they have to be drawn, same as sorted TileMap.query.
+        """
+
+        first_band = y1 // self.band_size
+        last_band = (y2 - 1) // self.band_size
+        bands = [self.get_band(band) for band in range(first_band, last_band + 1)]
+
+        # depths are few small numbers, walking them in order is all the merging needed
+        depths = sorted({depth for layers in bands for depth in layers})
+        result = []
+
+        for depth in depths:
+            for layers in bands:
+                if depth not in layers:
+                    continue
+
+                keys, ys, xs, tilesets, tiles = layers[depth]
+                for y in range(max(y1, ys[0]), min(y2, ys[-1] + 1)):
+                    start = bisect_left(keys, self.get_cell_key(x1, y))
+                    end = bisect_left(keys, self.get_cell_key(x2, y), start)
+                    for i in range(start, end):
+                        result.append([depth, y, xs[i], tilesets[i], tiles[i]])
+
+        return result
+
+    def query_hidden(self, x1, y1, x2, y2):
+
+        """
+        Returns hidden tiles in cells x1 <= x < x2, y1 <= y < y2 as (x, y, depth, tileset index).
+        """
+
+        result = []
+        for band in range(y1 // self.band_size, (y2 - 1) // self.band_size + 1):
+            self.get_band(band)
+            keys, depths, tilesets = self.hidden[band]
+            for y in range(max(y1, band * self.band_size), min(y2, (band + 1) * self.band_size)):
+                end = bisect_left(keys, self.get_cell_key(x2, y))
+                for i in range(bisect_left(keys, self.get_cell_key(x1, y), 0, end), end):
+                    result.append((keys[i] - (y << 32), y, depths[i], tilesets[i]))
+
+        return result
+
+    def invalidate(self, x, y):
+        self.bands.pop(y // self.band_size, None)
+        self.hidden.pop(y // self.band_size, None)
+
+    def invalidate_area(self, x1, y1, x2, y2):
+        for band in range(y1 // self.band_size, (y2 - 1) // self.band_size + 1):
+            self.bands.pop(band, None)
+            self.hidden.pop(band, None)
+
+    def clear(self):
+        self.bands.clear()
+        self.hidden.clear()
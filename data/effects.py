@@ -0,0 +1,119 @@
+"""
+One-shot animation effects (turn, jump, explosions...).
+All animations are loaded up front and effect objects are recycled from a pool.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+try:
+    import entities
+    from debug import profiler
+except ImportError:
+    import data.entities as entities
+    from data.debug import profiler
+
+
+class effect(object):
+
+    __slots__ = ("x", "y", "timer", "flip", "speed", "frames", "length")
+
+    def setup(self, x, y, animation, flip):
+        self.speed = animation[0]
+        self.frames = animation[1]
+        self.length = len(self.frames) * self.speed
+        self.timer = 0
+        self.x = x - int(self.frames[0].get_width() / 2)
+        self.y = y - int(self.frames[0].get_height() / 2)
+        self.flip = flip
+
+    def get_image(self):
+
+        """
+        Returns current image in animation.
+        """
+
+        frame_num = int(self.timer / self.speed)
+
+        try:
+            return self.frames[frame_num]
+        except IndexError:
+            return self.frames[0]
+
+
+class EffectManager(object):
+
+    """
+    Keeps active effects in one list, finished ones are swap-removed
+    and put back to the pool for next spawn.
+    """
+
+    def __init__(self, animations):
+        self.animations = animations
+        self.active = []
+        self.pool = []
+
+    def spawn(self, x, y, animation_id, flip=False):
+
+        """
+        Starts animation centered on x, y.
+        """
+
+        if self.pool != []:
+            new_effect = self.pool.pop()
+        else:
+            new_effect = effect()
+
+        new_effect.setup(x, y, self.animations[animation_id], flip)
+        self.active.append(new_effect)
+        return new_effect
+
+    def update(self, amount=1):
+
+        """
+        Moves all effects forward in one pass, removing finished ones.
+        """
+
+        active = self.active
+        i = 0
+
+        while i < len(active):
+            current = active[i]
+            current.timer += amount
+
+            if current.timer >= current.length:
+                active[i] = active[-1]
+                active.pop()
+                self.pool.append(current)
+            else:
+                i += 1
+
+    def render(self, surface, offset):
+
+        """
+        Renders properly fliped images of all effects.
+        """
+
+        surface.blits(self.get_blits(offset), False)
+
+    def get_blits(self, offset):
+
+        """
+        Returns (image, position) of every active effect, in the order render draws them.
+        """
+
+        get_transformed = entities.transform_cache.get
+        to_render = []
+
+        profiler.count("effects.active", len(self.active))
+
+        for current in self.active:
+            image = current.get_image()
+            if current.flip == True:
+                image = get_transformed(image, True)
+            to_render.append((image, (current.x - offset[0], current.y - offset[1])))
+
+        return to_render
+
+    def clear(self):
+        self.pool.extend(self.active)
+        self.active = []
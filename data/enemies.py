@@ -0,0 +1,316 @@
+"""
+Enemies stored as struct of arrays: positions, momentum, boxes and collision flags
+live in numpy arrays, so gravity, movement and tile collision are resolved for
+all enemies at once instead of one PhysicsObject at a time.
+Collision follows PhysicsObject.move: x axis first, then y axis (both swept), then ramps.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from debug import profiler
+except ImportError:
+    from data.debug import profiler
+
+
+# Collision flags -------------------------------------------------------------------------------------------
+TOP = 1
+BOTTOM = 2
+RIGHT = 4
+LEFT = 8
+SLANT_BOTTOM = 16
+
+
+class EnemyStore(object):
+
+    """
+    Holds up to capacity enemies, the first `count` entries of every array are alive.
+    Killed enemies are swap-removed, so indexes of other enemies can change.
+    Enemies walk in their direction and turn around when they hit a wall.
+    """
+
+    def __init__(self, capacity=256, speed=1, gravity=0.45, max_fall=7, friction=0.25):
+
+        if numpy == None:
+            raise ImportError("EnemyStore needs numpy")
+
+        self.speed = speed
+        self.gravity = gravity
+        self.max_fall = max_fall
+        self.friction = friction
+        self.count = 0
+        self.ramp_peaks = None # numpy copy of collision_grid.ramp_peaks, made on first use
+        self.ramp_peaks_source = None
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+
+        """
+        Creates arrays of given capacity, keeping alive enemies.
+        """
+
+        old = getattr(self, "x", None)
+        fields = {"x": numpy.float64, "y": numpy.float64,
+                  "momentum_x": numpy.float64, "momentum_y": numpy.float64,
+                  "width": numpy.int64, "height": numpy.int64,
+                  "direction": numpy.int8, "kind": numpy.int16, "collisions": numpy.uint8}
+
+        for name, dtype in fields.items():
+            array = numpy.zeros(capacity, dtype)
+            if old is not None:
+                array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+
+        self.capacity = capacity
+
+    def spawn(self, x, y, width, height, kind=0, direction=1):
+
+        """
+        Adds enemy with top left corner at x, y, returns its index.
+        """
+
+        if self.count == self.capacity:
+            self.allocate(self.capacity * 2)
+
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.momentum_x[i] = 0
+        self.momentum_y[i] = 0
+        self.width[i] = width
+        self.height[i] = height
+        self.direction[i] = direction
+        self.kind[i] = kind
+        self.collisions[i] = 0
+        self.count += 1
+        return i
+
+    def kill(self, i):
+        last = self.count - 1
+        for name in ("x", "y", "momentum_x", "momentum_y", "width", "height", "direction", "kind", "collisions"):
+            array = getattr(self, name)
+            array[i] = array[last]
+        self.count = last
+
+    def clear(self):
+        self.count = 0
+
+    def get_box_cells(self, collision_grid, cells, rect_x, rect_y, width, height, span_x, span_y):
+
+        """
+        Returns values of cells (solid or ramps array of collision grid) overlapped by every box
+        as array of shape (span_y, span_x, enemies). Cells past the box or outside of the grid are 0.
+        Also returns first cell column and row of every box.
+        Enemies are the last axis, so every operation runs over long contiguous rows.
+        """
+
+        tile_size = collision_grid.tile_size
+        x1 = rect_x // tile_size
+        y1 = rect_y // tile_size
+        x2 = (rect_x + width - 1) // tile_size
+        y2 = (rect_y + height - 1) // tile_size
+
+        # columns and rows are checked separately, only their combination is full size
+        cell_x = x1 + numpy.arange(span_x)[:, None]
+        cell_y = y1 + numpy.arange(span_y)[:, None]
+        grid_x = cell_x - collision_grid.min_x
+        grid_y = cell_y - collision_grid.min_y
+        valid_x = (cell_x <= x2) & (grid_x >= 0) & (grid_x < collision_grid.width)
+        valid_y = (cell_y <= y2) & (grid_y >= 0) & (grid_y < collision_grid.height)
+
+        index = (numpy.clip(grid_y, 0, collision_grid.height - 1) * collision_grid.width)[:, None, :] + numpy.clip(grid_x, 0, collision_grid.width - 1)[None, :, :]
+        values = numpy.frombuffer(cells, numpy.int8).take(index)
+        values *= valid_y[:, None, :] & valid_x[None, :, :]
+
+        return values, x1, y1
+
+    def get_spans(self, tile_size, width, height):
+
+        """
+        Returns how many cells at most any box overlaps in each axis.
+        """
+
+        return int(width.max()) // tile_size + 2, int(height.max()) // tile_size + 2
+
+    def step(self, collision_grid=None):
+
+        """
+        Moves all enemies by one tick.
+        """
+
+        count = self.count
+        profiler.count("enemies.active", count)
+        if count == 0:
+            return
+
+        x = self.x[:count]
+        y = self.y[:count]
+        momentum_x = self.momentum_x[:count]
+        momentum_y = self.momentum_y[:count]
+        width = self.width[:count]
+        height = self.height[:count]
+        direction = self.direction[:count]
+        collisions = self.collisions[:count]
+
+        # Momentum, same as player movement in World.step
+        movement_x = momentum_x.copy()
+        movement_y = momentum_y.copy()
+
+        numpy.copyto(momentum_x, numpy.sign(momentum_x) * numpy.maximum(numpy.abs(momentum_x) - self.friction, 0))
+        movement_x += numpy.where(numpy.abs(momentum_x) < self.speed, direction * self.speed, 0)
+
+        momentum_y += self.gravity
+        numpy.minimum(momentum_y, self.max_fall, out=momentum_y)
+
+        collisions[:] = 0
+
+        # X axis
+        start_x = x.astype(numpy.int64)
+        x += movement_x
+        rect_x = x.astype(numpy.int64)
+        rect_y = y.astype(numpy.int64)
+
+        if collision_grid != None:
+            tile_size = collision_grid.tile_size
+            span_x, span_y = self.get_spans(tile_size, width, height)
+
+            box_x, box_width = self.get_swept_box(rect_x, width, rect_x - start_x)
+            swept_x, swept_y = self.get_spans(tile_size, box_width, height)
+            hit, first_hit, last_hit = self.get_hits(collision_grid, box_x, rect_y, box_width, height, swept_x, swept_y, True)
+
+            right = hit & (movement_x > 0)
+            left = hit & (movement_x < 0)
+            rect_x = numpy.where(right, first_hit * tile_size - width, rect_x)
+            rect_x = numpy.where(left, (last_hit + 1) * tile_size, rect_x)
+            collisions[right] |= RIGHT
+            collisions[left] |= LEFT
+            x[hit] = rect_x[hit]
+
+            direction[right | left] *= -1
+
+        # Y axis
+        start_y = rect_y
+        y += movement_y
+        rect_y = y.astype(numpy.int64)
+
+        if collision_grid != None:
+            box_y, box_height = self.get_swept_box(rect_y, height, rect_y - start_y)
+            swept_x, swept_y = self.get_spans(tile_size, width, box_height)
+            hit, first_hit, last_hit = self.get_hits(collision_grid, rect_x, box_y, width, box_height, swept_x, swept_y, False)
+
+            bottom = hit & (movement_y > 0)
+            top = hit & (movement_y < 0)
+            rect_y = numpy.where(bottom, first_hit * tile_size - height, rect_y)
+            rect_y = numpy.where(top, (last_hit + 1) * tile_size, rect_y)
+            collisions[bottom] |= BOTTOM
+            collisions[top] |= TOP
+            y[hit] = rect_y[hit]
+
+            self.resolve_ramps(collision_grid, x, y, rect_x, rect_y, width, height, collisions, span_x, span_y)
+
+        landed = (collisions & BOTTOM) != 0
+        momentum_y[landed] = 0
+
+    def get_swept_box(self, start, size, sweep):
+
+        """
+        Returns start and size of boxes in one axis grown back to their leading edge
+        before moving by sweep, same as CollisionGrid.get_cells.
+        """
+
+        gap = numpy.maximum(numpy.abs(sweep) - size, 0)
+        return numpy.where(sweep > 0, start - gap, start), size + gap
+
+    def get_hits(self, collision_grid, rect_x, rect_y, width, height, span_x, span_y, columns):
+
+        """
+        Returns bool array of boxes overlapping any solid cell, and first and last column
+        (or row) with a solid cell, which are only valid where box overlaps one.
+        """
+
+        solid, x1, y1 = self.get_box_cells(collision_grid, collision_grid.solid, rect_x, rect_y, width, height, span_x, span_y)
+
+        if columns:
+            line_hits = (solid == 1).any(axis=0)
+            first_line = x1
+        else:
+            line_hits = (solid == 1).any(axis=1)
+            first_line = y1
+
+        hit = numpy.zeros(len(rect_x), bool)
+        first_hit = numpy.zeros(len(rect_x), numpy.int64)
+        last_hit = numpy.zeros(len(rect_x), numpy.int64)
+
+        for i, line_hit in enumerate(line_hits):
+            first_hit[line_hit & ~hit] = i
+            last_hit[line_hit] = i
+            hit |= line_hit
+
+        return hit, first_line + first_hit, first_line + last_hit
+
+    def resolve_ramps(self, collision_grid, x, y, rect_x, rect_y, width, height, collisions, span_x, span_y):
+
+        """
+        Pushes boxes up onto ramp surface from height tables of collision grid,
+        checking cells in the same order as PhysicsObject.move.
+        Only enemies touching a ramp cell are processed.
+        """
+
+        ramps, x1, y1 = self.get_box_cells(collision_grid, collision_grid.ramps, rect_x, rect_y, width, height, span_x, span_y)
+        on_ramp = numpy.flatnonzero(ramps.any(axis=(0, 1)))
+        if len(on_ramp) == 0:
+            return
+
+        tile_size = collision_grid.tile_size
+        if self.ramp_peaks_source is not collision_grid.ramp_peaks:
+            self.ramp_peaks = numpy.array(collision_grid.ramp_peaks)
+            self.ramp_peaks_source = collision_grid.ramp_peaks
+        ramp_peaks = self.ramp_peaks
+        ramps = ramps[:, :, on_ramp]
+        x1 = x1[on_ramp]
+        y1 = y1[on_ramp]
+        left = rect_x[on_ramp]
+        right = left + width[on_ramp]
+        height = height[on_ramp]
+        bottom = rect_y[on_ramp] + height
+        slant = numpy.zeros(len(on_ramp), bool)
+
+        for offset_y in range(span_y):
+            for offset_x in range(span_x):
+                ramp = ramps[offset_y, offset_x]
+                if not ramp.any():
+                    continue
+
+                ramp_x = (x1 + offset_x) * tile_size
+                ramp_y = (y1 + offset_y) * tile_size
+                overlaps = (right > ramp_x) & (left < ramp_x + tile_size) & (bottom > ramp_y) & (bottom - height < ramp_y + tile_size)
+
+                surface = ramp_peaks[ramp, numpy.clip(left - ramp_x, 0, tile_size), numpy.clip(right - ramp_x, 0, tile_size)]
+                floor = ramp_y + tile_size - surface
+
+                pushed = overlaps & (ramp != 0) & (bottom > floor)
+                bottom = numpy.where(pushed, floor, bottom)
+
+                slant |= pushed
+
+        moved = on_ramp[slant]
+        y[moved] = (bottom - height)[slant]
+        collisions[moved] |= SLANT_BOTTOM
+
+    def get_visible(self, camera_offset, view_size):
+
+        """
+        Returns indexes of enemies overlapping the view.
+        """
+
+        count = self.count
+        x = self.x[:count]
+        y = self.y[:count]
+        visible = ((x + self.width[:count] > camera_offset[0]) & (x < camera_offset[0] + view_size[0]) &
+                   (y + self.height[:count] > camera_offset[1]) & (y < camera_offset[1] + view_size[1]))
+        return numpy.flatnonzero(visible)
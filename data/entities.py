@@ -1,5 +1,16 @@
 import pygame
+import os
 from pygame.locals import *
+from collections import OrderedDict
+
+try:
+    import asset_cache
+    import global_functions as functions
+    from debug import profiler
+except ImportError:
+    import data.asset_cache as asset_cache
+    import data.global_functions as functions
+    from data.debug import profiler
 
 animation_database = {}
 
@@ -18,6 +29,58 @@ def flip(img, boolean=True):
     return pygame.transform.flip(img, boolean, False)
 
 
+class TransformCache(object):
+
+    """
+    Keeps flipped and rotated versions of frames, shared by all entities,
+    so frames that didn't change since last time aren't transformed again.
+    Angles are rounded to angle_step degrees, least recently used entries
+    are dropped above max_size.
+    """
+
+    def __init__(self, max_size=512, angle_step=1):
+        self.max_size = max_size
+        self.angle_step = angle_step
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image, flip_x=False, angle=0):
+
+        angle = int(round(angle / self.angle_step)) * self.angle_step % 360
+
+        if flip_x == False and angle == 0:
+            return image
+
+        key = (id(image), flip_x, angle)
+        entry = self.images.get(key)
+
+        # id() can be reused by a new surface once the old one is gone
+        if entry != None and entry[0] is image:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        transformed = image
+        if flip_x == True:
+            transformed = pygame.transform.flip(transformed, True, False)
+        if angle != 0:
+            transformed = pygame.transform.rotate(transformed, angle)
+
+        self.images[key] = (image, transformed)
+        while len(self.images) > self.max_size:
+            self.images.popitem(last=False)
+
+        return transformed
+
+    def clear(self):
+        self.images.clear()
+
+
+transform_cache = TransformCache()
+
+
 def blit_center(surface, surface2, pos):
 
     x = surface2.get_width() // 2
@@ -25,7 +88,28 @@ def blit_center(surface, surface2, pos):
     surface.blit(surface2, (pos[0] - x, pos[1] - y))
 
 
-def animation_sequence(sequence, base_path, colorkey=(255, 255, 255), transparency=255):
+def get_player_sequences(images_path, main_hero="player"):
+
+    """
+    Returns (sequence, base path) of every animation of the hero, keyed by name.
+    Sequence is list of [frame, ticks], like animation_sequence takes.
+    """
+
+    return {"idle": [[[0, 40], [1, 20]], f"{images_path}/{main_hero}/idle/stand_"],
+            "run": [[[0, 4], [1, 4], [2, 4], [3, 4], [4, 4], [5, 4]], f"{images_path}/{main_hero}/run/run_"]}
+
+
+def get_sequence_paths(sequence, base_path):
+    return [base_path + str(frame[0]) + ".png" for frame in sequence]
+
+
+def animation_sequence(sequence, base_path, colorkey=(255, 255, 255), transparency=255, frames=None):
+
+    """
+    Registers frames of sequence in animation database and returns list of frame ids, one per tick.
+    Frames already loaded elsewhere can be given as dict of path: image.
+    """
+
     global animation_database
     
     result = []
@@ -33,10 +117,10 @@ def animation_sequence(sequence, base_path, colorkey=(255, 255, 255), transparen
     for frame in sequence:
     
         image_id = base_path + str(frame[0])
-        image = pygame.image.load(image_id + ".png").convert()
-        image.set_colorkey(colorkey)
-        image.set_alpha(transparency)
-        animation_database[image_id] = image.copy()
+        if frames != None:
+            animation_database[image_id] = frames[image_id + ".png"]
+        else:
+            animation_database[image_id] = load_frame(image_id + ".png", colorkey, transparency)
     
         for i in range(frame[1]):
             result.append(image_id)
@@ -44,6 +128,95 @@ def animation_sequence(sequence, base_path, colorkey=(255, 255, 255), transparen
     return result
 
 
+def get_frame_job(path, colorkey=(255, 255, 255), transparency=255):
+
+    """
+    Returns (cache key, decode, prepare) of one animation frame. Decode can run on
+    loader threads, prepare converts decoded images on the main thread.
+    """
+
+    def decode():
+        return [pygame.image.load(path)], None, [path]
+
+    def prepare(images):
+        return functions.convert_images(images, colorkey, transparency)
+
+    return f"frame:{path}:{colorkey}:{transparency}", decode, prepare
+
+
+def load_frame(path, colorkey=(255, 255, 255), transparency=255):
+
+    """
+    Loads one animation frame, through asset cache when it is open.
+    """
+
+    key, decode, prepare = get_frame_job(path, colorkey, transparency)
+
+    def build():
+        images, data, sources = decode()
+        return prepare(images), data, sources
+
+    return asset_cache.get_images(key, build)[0][0]
+
+
+def get_animation_job(path):
+
+    """
+    Returns (cache key, decode, prepare) of one-shot animation folder,
+    decode reads every png in name order plus speed.txt.
+    """
+
+    def decode():
+        image_list = sorted(image for image in os.listdir(path) if image[-4:] == '.png')
+
+        with open(os.path.join(path, "speed.txt")) as file:
+            speed = int(file.read())
+
+        frames = [pygame.image.load(os.path.join(path, image)) for image in image_list]
+        sources = [path, os.path.join(path, "speed.txt")] + [os.path.join(path, image) for image in image_list]
+        return frames, speed, sources
+
+    return f"animation:{path}", decode, functions.convert_images
+
+
+def load_animation(path):
+
+    """
+    Loads one-shot animation folder: every png in name order plus speed.txt.
+    Returns [speed, frames].
+    """
+
+    key, decode, prepare = get_animation_job(path)
+
+    def build():
+        frames, speed, sources = decode()
+        return prepare(frames), speed, sources
+
+    frames, speed = asset_cache.get_images(key, build)
+    return [speed, frames]
+
+
+def get_animation_paths(path):
+
+    """
+    Returns [name, folder] of every animation folder in path.
+    """
+
+    return [[name, os.path.join(path, name)] for name in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, name))]
+
+
+def load_animations(path):
+
+    """
+    Loads every animation folder in path, returns dict of name: [speed, frames].
+    """
+
+    animations = {}
+    for name, folder in get_animation_paths(path):
+        animations[name] = load_animation(folder)
+    return animations
+
+
 def get_frame(id):
 
     global animation_database
@@ -76,8 +249,8 @@ class entity(object):
         self.obj.rect.x = x
         self.obj.rect.y = y    
 
-    def move(self, momentum, platforms, ramps):
-        collisions = self.obj.move(momentum, platforms, ramps)
+    def move(self, momentum, collision_grid=None):
+        collisions = self.obj.move(momentum, collision_grid)
         self.x = self.obj.x
         self.y = self.obj.y
         return collisions
@@ -124,24 +297,34 @@ class entity(object):
     def get_current_img(self):
         if self.animation == None:
             if self.image != None:
-                return flip(self.image, self.flip)
+                return transform_cache.get(self.image, self.flip)
             else:
                 return None
         else:
-            return flip(animation_database[self.animation[self.animation_frame]], self.flip)            
+            return transform_cache.get(animation_database[self.animation[self.animation_frame]], self.flip)
+
+    def get_blit(self, scroll, pos=None):
+
+        """
+        Returns (image, position) that display would blit, for drawing it later (like on render thread).
+        """
 
-    def display(self, surface, scroll):
+        if pos == None:
+            pos = [self.x, self.y]
         if self.animation == None:
             if self.image != None:
-                image_to_render = flip(self.image, self.flip).copy()
+                image_to_render = self.image
         else:
-            image_to_render = flip(animation_database[self.animation[self.animation_frame]], self.flip).copy()
+            image_to_render = animation_database[self.animation[self.animation_frame]]
         center_x = image_to_render.get_width() / 2
         center_y = image_to_render.get_height() / 2
-        image_to_render = pygame.transform.rotate(image_to_render, self.rotation)
-        blit_center(surface, image_to_render, 
-            (int(self.x) - scroll[0] + self.offset[0] + center_x,
-             int(self.y) - scroll[1] + self.offset[1] + center_y))
+        image_to_render = transform_cache.get(image_to_render, self.flip, self.rotation)
+        return (image_to_render,
+            (int(pos[0]) - scroll[0] + self.offset[0] + center_x - image_to_render.get_width() // 2,
+             int(pos[1]) - scroll[1] + self.offset[1] + center_y - image_to_render.get_height() // 2))
+
+    def display(self, surface, scroll, pos=None):
+        surface.blit(*self.get_blit(scroll, pos))
 
 class PhysicsObject(object):
 
@@ -159,13 +342,16 @@ class PhysicsObject(object):
     def get_hitbox(self):
         return pygame.Rect(self.x + self.hitbox[0], self.y + self.hitbox[1], self.hitbox[2], self.hitbox[3])
 
-    def move(self, movement, platforms, ramps):
+    def move(self, movement, collision_grid=None):
 
-        tile_size = 20
+        """
+        Moves object and resolves collisions against cells of collision grid
+        it overlaps. Without collision grid object moves freely.
+        Cells are checked along the whole way the rect moved, so it stops at the first
+        solid cell even when one move is longer than a cell.
+        """
 
-        self.x += movement[0]
-        self.rect.x = int(self.x)
-        block_hit_list = collision_test(self.rect, platforms)
+        profiler.count("physics.moves")
 
         collision_types = {"top": False,
                            "bottom": False,
@@ -173,51 +359,58 @@ class PhysicsObject(object):
                            "left": False,
                            "slant_bottom": False}
 
-        for block in block_hit_list:
+        start_x = self.rect.x
+        self.x += movement[0]
+        self.rect.x = int(self.x)
+
+        if collision_grid != None:
+            tile_size = collision_grid.tile_size
+            block_hit_list = collision_grid.get_solid_cells(self.rect, self.rect.x - start_x, 0)
 
-            if movement[0] > 0:
-                self.rect.right = block.left
-                collision_types['right'] = True
+            if block_hit_list != []:
 
-            elif movement[0] < 0:
-                self.rect.left = block.right
-                collision_types['left'] = True
+                if movement[0] > 0:
+                    self.rect.right = min(block[0] for block in block_hit_list) * tile_size
+                    collision_types['right'] = True
 
-            self.x = self.rect.x
+                elif movement[0] < 0:
+                    self.rect.left = (max(block[0] for block in block_hit_list) + 1) * tile_size
+                    collision_types['left'] = True
 
+                self.x = self.rect.x
+
+        start_y = self.rect.y
         self.y += movement[1]
         self.rect.y = int(self.y)
-        block_hit_list = collision_test(self.rect, platforms)
 
-        for block in block_hit_list:
+        if collision_grid != None:
+            block_hit_list = collision_grid.get_solid_cells(self.rect, 0, self.rect.y - start_y)
 
-            if movement[1] > 0:
-                self.rect.bottom = block.top
-                collision_types['bottom'] = True
+            if block_hit_list != []:
 
-            elif movement[1] < 0:
-                self.rect.top = block.bottom
-                collision_types['top'] = True
+                if movement[1] > 0:
+                    self.rect.bottom = min(block[1] for block in block_hit_list) * tile_size
+                    collision_types['bottom'] = True
 
-            self.change_y = 0
-            self.y = self.rect.y
+                elif movement[1] < 0:
+                    self.rect.top = (max(block[1] for block in block_hit_list) + 1) * tile_size
+                    collision_types['top'] = True
 
-        for ramp in ramps:
+                self.change_y = 0
+                self.y = self.rect.y
 
-            ramp_rectangle = pygame.Rect(ramp[0], ramp[1], tile_size, tile_size)
+            for ramp_x, ramp_y, ramp in collision_grid.get_ramp_cells(self.rect):
 
-            if self.rect.colliderect(ramp_rectangle):
+                ramp_x *= tile_size
+                ramp_y *= tile_size
+                rect = self.rect
 
-                if ramp[2] == 1:
-                    if self.rect.right - ramp[0] + self.rect.bottom - ramp[1] > tile_size:
-                        self.rect.bottom = ramp[1] + tile_size - (self.rect.right - ramp[0])
-                        self.y = self.rect.y
-                        collision_types['slant_bottom'] = True
+                if rect.right > ramp_x and rect.left < ramp_x + tile_size and rect.bottom > ramp_y and rect.top < ramp_y + tile_size:
 
-                if ramp[2] == 2:
-                    if ramp[0] + tile_size - self.rect.left + self.rect.bottom - ramp[1] > tile_size:
-                        self.rect.bottom = ramp[1] + tile_size - (ramp[0] + tile_size - self.rect.left)
-                        self.y = self.rect.y
+                    floor = collision_grid.get_ramp_floor(ramp, ramp_x, ramp_y, rect.left, rect.right)
+                    if rect.bottom > floor:
+                        rect.bottom = floor
+                        self.y = rect.y
                         collision_types['slant_bottom'] = True
 
-        return collision_types
\ No newline at end of file
+        return collision_types
@@ -20,4 +20,16 @@ def clip(surf, x, y, x_size, y_size):
     clipped_rectangle = pygame.Rect(x, y, x_size, y_size)
     surf.set_clip(clipped_rectangle)
     image = surf.subsurface(surf.get_clip())
-    return image.copy()
\ No newline at end of file
+    return image.copy()
+
+# Converts decoded images to display format with colorkey, has to run on main thread -----------------------
+def convert_images(images, colorkey=(255,255,255), alpha=None):
+
+    converted = []
+    for image in images:
+        image = image.convert()
+        image.set_colorkey(colorkey)
+        if alpha != None:
+            image.set_alpha(alpha)
+        converted.append(image)
+    return converted
@@ -0,0 +1,380 @@
+"""
+Compiles levels saved by level editor (json or legacy save.txt) into packed
+binary files, that are read in one go on load instead of being parsed.
+With --regions the level is split into a directory of region files plus
+an index, which data.streaming loads around the camera.
+
+Usage: python -m data.level_compiler [--regions] data/save1.json [data/test1.json ...]
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import json
+import struct
+from array import array
+
+try:
+    import world_data
+    from tile_map import TileMap
+except ImportError:
+    import data.world_data as world_data
+    from data.tile_map import TileMap
+
+
+MAGIC = b"PLVL"
+VERSION = 1
+
+# magic, version, tileset count, source size, source mtime, spawn, finish, borders, min x/y, width, height, layers
+HEADER = struct.Struct("<4sHHqq2i2i3i2i3i")
+
+INDEX_MAGIC = b"PRGI"
+REGION_MAGIC = b"PRGN"
+REGION_SIZE = 32
+
+# magic, version, tileset count, region size, source size, source mtime, spawn, finish, borders, min x/y, width, height, region count
+INDEX_HEADER = struct.Struct("<4sHHHqq2i2i3i2i2iI")
+
+# magic, min x/y, width, height, layers
+REGION_HEADER = struct.Struct("<4s2i2iH")
+
+
+def get_compiled_path(path):
+
+    """
+    Returns path of compiled level next to its source file.
+    """
+
+    return os.path.splitext(path)[0] + ".lvl"
+
+
+def get_region_path(path):
+
+    """
+    Returns directory of region files next to level source file.
+    """
+
+    return os.path.splitext(path)[0] + ".regions"
+
+
+def get_source_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def little_endian(data):
+
+    """
+    Returns array stored in little endian, levels are always saved that way.
+    """
+
+    if sys.byteorder == "big":
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data
+
+
+def write_names(file, names):
+    for name in names:
+        encoded = name.encode("utf-8")
+        file.write(struct.pack("<B", len(encoded)) + encoded)
+
+
+def read_names(data, position, count):
+
+    """
+    Returns tileset names and position after them.
+    """
+
+    names = []
+    for i in range(count):
+        length = data[position]
+        names.append(data[position + 1:position + 1 + length].decode("utf-8"))
+        position += 1 + length
+    return names, position
+
+
+def write_tile_arrays(file, tile_map):
+    for data in (tile_map.counts, tile_map.depths, tile_map.tilesets, tile_map.tiles):
+        little_endian(data).tofile(file)
+
+
+def get_tile_arrays_size(width, height, layers):
+
+    """
+    Returns size in bytes of tile map arrays written by write_tile_arrays.
+    """
+
+    cells = width * height
+    return cells + 3 * cells * layers * 2
+
+
+def read_tile_arrays(data, position, tile_map):
+
+    """
+    Fills arrays of tile map (with width, height and layers already set) from data.
+    Blocks are copied straight from a memoryview of data, without slicing it first.
+    """
+
+    view = memoryview(data)
+    cells = tile_map.width * tile_map.height
+    layers = tile_map.layers
+    for name, typecode, length in (("counts", "B", cells), ("depths", "h", cells * layers),
+                                   ("tilesets", "h", cells * layers), ("tiles", "h", cells * layers)):
+        block = array(typecode)
+        end = position + block.itemsize * length
+        block.frombytes(view[position:end])
+        if sys.byteorder == "big":
+            block.byteswap()
+        setattr(tile_map, name, block)
+        position = end
+
+    return position
+
+
+def read_source_level(path):
+
+    """
+    Reads level editor save, either json dict or legacy "x;y;depth;tileset;tile+..." text.
+    """
+
+    if path.endswith(".txt"):
+
+        tile_map = TileMap(0, 0, 0, 0)
+
+        with open(path) as file:
+            data = file.read()
+
+        for n, entry in enumerate(data.strip().split("+")):
+            if entry != "":
+                try:
+                    x, y, depth, tileset, tile = entry.split(";")
+                    tile_map.add_tile(int(x), int(y), int(depth), tileset, int(tile))
+                except ValueError:
+                    raise ValueError(f"{path}: malformed tile #{n}: {entry!r}")
+
+        return tile_map
+
+    with open(path) as file:
+        return TileMap.from_dict(json.load(file))
+
+
+def compile_level(path, target=None, tile_size=20):
+
+    """
+    Writes compiled level: fixed size header, tileset name table and then
+    the tile map arrays (cell counts, depths, tileset indexes, tile ids).
+    """
+
+    if target == None:
+        target = get_compiled_path(path)
+
+    tile_map = read_source_level(path)
+    spawn, borders, finish = world_data.get_world_data(tile_map, tile_size)
+    size, mtime = get_source_stamp(path)
+
+    header = HEADER.pack(MAGIC, VERSION, len(tile_map.tileset_names), size, mtime,
+                         *spawn, *finish, *borders,
+                         tile_map.min_x, tile_map.min_y, tile_map.width, tile_map.height, tile_map.layers)
+
+    # written next to target and moved over it, so interrupted compile never leaves a truncated level
+    temp_path = target + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(header)
+        write_names(file, tile_map.tileset_names)
+        write_tile_arrays(file, tile_map)
+    os.replace(temp_path, target)
+
+    return target
+
+
+def compile_regions(path, target=None, region_size=REGION_SIZE, tile_size=20):
+
+    """
+    Splits level into region_size x region_size tile regions. Writes one file per
+    region that has tiles and an index with spawn, finish, borders, level bounds,
+    tileset names and list of regions, so nothing has to walk all tiles on load.
+    """
+
+    if target == None:
+        target = get_region_path(path)
+
+    tile_map = read_source_level(path)
+    spawn, borders, finish = world_data.get_world_data(tile_map, tile_size)
+    size, mtime = get_source_stamp(path)
+
+    os.makedirs(target, exist_ok=True)
+    for name in os.listdir(target):
+        if name.endswith(".bin"):
+            os.remove(os.path.join(target, name))
+
+    regions = sorted({(x // region_size, y // region_size) for x, y in tile_map.cells()})
+
+    for region_x, region_y in regions:
+        region = tile_map.get_region(region_x * region_size, region_y * region_size, region_size, region_size)
+        with open(os.path.join(target, f"{region_x}_{region_y}.bin"), "wb") as file:
+            file.write(REGION_HEADER.pack(REGION_MAGIC, region.min_x, region.min_y, region.width, region.height, region.layers))
+            write_tile_arrays(file, region)
+
+    header = INDEX_HEADER.pack(INDEX_MAGIC, VERSION, len(tile_map.tileset_names), region_size, size, mtime,
+                               *spawn, *finish, *borders,
+                               tile_map.min_x, tile_map.min_y, tile_map.width, tile_map.height, len(regions))
+
+    # index is written last, so half written region directory is never seen as valid
+    with open(os.path.join(target, "index.tmp"), "wb") as file:
+        file.write(header)
+        write_names(file, tile_map.tileset_names)
+        for region in regions:
+            file.write(struct.pack("<2i", *region))
+    os.replace(os.path.join(target, "index.tmp"), os.path.join(target, "index"))
+
+    return target
+
+
+def load_region_index(path, source_path=None):
+
+    """
+    Loads index of region directory. Returns None when it is missing, has other
+    version or is older than its source file, otherwise dict with names, region_size,
+    spawn, finish, borders, bounds (min x, min y, width, height) and set of regions.
+    """
+
+    index_path = os.path.join(path, "index")
+    if not os.path.exists(index_path):
+        return None
+
+    with open(index_path, "rb") as file:
+        data = file.read()
+
+    if len(data) < INDEX_HEADER.size:
+        return None
+
+    header = INDEX_HEADER.unpack_from(data, 0)
+    if header[0] != INDEX_MAGIC or header[1] != VERSION:
+        return None
+
+    if source_path != None and os.path.exists(source_path):
+        if get_source_stamp(source_path) != (header[4], header[5]):
+            return None
+
+    names, position = read_names(data, INDEX_HEADER.size, header[2])
+    regions = set(struct.iter_unpack("<2i", data[position:position + header[17] * 8]))
+
+    return {"names": names,
+            "region_size": header[3],
+            "spawn": list(header[6:8]),
+            "finish": list(header[8:10]),
+            "borders": list(header[10:13]),
+            "bounds": list(header[13:17]),
+            "regions": regions}
+
+
+def load_region(path, names):
+
+    """
+    Loads one region file as tile map using tileset names from the index.
+    """
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < REGION_HEADER.size:
+        raise ValueError(f"{path}: truncated region file")
+
+    magic, min_x, min_y, width, height, layers = REGION_HEADER.unpack_from(data, 0)
+    if magic != REGION_MAGIC:
+        raise ValueError(f"{path}: not a region file")
+
+    if len(data) - REGION_HEADER.size != get_tile_arrays_size(width, height, layers):
+        raise ValueError(f"{path}: truncated region file")
+
+    tile_map = TileMap(min_x, min_y, 0, 0, layers, names)
+    tile_map.width = width
+    tile_map.height = height
+    read_tile_arrays(data, REGION_HEADER.size, tile_map)
+
+    return tile_map
+
+
+def load_compiled_level(path, source_path=None):
+
+    """
+    Loads compiled level. Returns None when file is missing, has other version
+    or is older than its source file.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < HEADER.size:
+        return None
+
+    header = HEADER.unpack_from(data, 0)
+    if header[0] != MAGIC or header[1] != VERSION:
+        return None
+
+    if source_path != None and os.path.exists(source_path):
+        if get_source_stamp(source_path) != (header[3], header[4]):
+            return None
+
+    spawn = list(header[5:7])
+    finish = list(header[7:9])
+    borders = list(header[9:12])
+    min_x, min_y, width, height, layers = header[12:17]
+
+    try:
+        names, position = read_names(data, HEADER.size, header[2])
+    except (IndexError, UnicodeDecodeError): # truncated name table
+        return None
+
+    if len(data) - position != get_tile_arrays_size(width, height, layers):
+        return None
+
+    tile_map = TileMap(min_x, min_y, 0, 0, layers, names)
+    tile_map.width = width
+    tile_map.height = height
+    read_tile_arrays(data, position, tile_map)
+
+    return tile_map, spawn, borders, finish
+
+
+def load_level(path, tile_size=20):
+
+    """
+    Loads level from compiled file when it is up to date,
+    otherwise falls back to reading the source save.
+    Returns tile_map, spawn, borders, finish.
+    """
+
+    level = load_compiled_level(get_compiled_path(path), path)
+
+    if level == None:
+        tile_map = read_source_level(path)
+        spawn, borders, finish = world_data.get_world_data(tile_map, tile_size)
+        level = tile_map, spawn, borders, finish
+
+    return level
+
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:]
+    regions = "--regions" in arguments
+    if regions:
+        arguments.remove("--regions")
+
+    if len(arguments) < 1:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    for source in arguments:
+        if regions:
+            target = compile_regions(source)
+            print(f"{source} -> {target} ({len(os.listdir(target)) - 1} regions)")
+        else:
+            target = compile_level(source)
+            print(f"{source} -> {target} ({os.path.getsize(source)} -> {os.path.getsize(target)} bytes)")
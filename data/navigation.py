@@ -0,0 +1,511 @@
+"""
+Navigation graph for AI entities, built from the tile map when first needed.
+Floors and ramps an entity can stand on are joined into segments it can walk along,
+segments are connected by fall and jump edges found by simulating moves with the player
+movement constants and PhysicsObject collisions (ramps included), so every edge is a move
+the physics really allows. Graph is cached next to the level file (level.nav) and rebuilt
+when collision data of the level changes. Paths are found with A* over edges.
+
+Usage: python -m data.navigation data/save1.json [...]   (builds graphs, times path queries)
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import time
+import zlib
+import heapq
+import pickle
+from collections import OrderedDict
+
+try:
+    import entities
+    from world import TILE_SIZE, SPEED, JUMPS, JUMP_MOMENTUM, GRAVITY, MAX_FALL
+except ImportError:
+    import data.entities as entities
+    from data.world import TILE_SIZE, SPEED, JUMPS, JUMP_MOMENTUM, GRAVITY, MAX_FALL
+
+
+VERSION = 1
+
+# Simulated moves, direction is held the whole move ---------------------------------------------------------
+SECOND_JUMP_DELAYS = (6, 12, 18)
+MAX_MOVE_TICKS = 240
+WALK_OFF_TICKS = 12 # walking off an edge is given up when agent is still on its segment after this many ticks
+LOCATE_DEPTH = 3 # rows under a position searched for a surface to stand on
+
+AGENT_SIZE = (12, 15) # collision box of the player
+
+
+def get_nav_path(path):
+
+    """
+    Returns path of navigation graph next to level source file.
+    """
+
+    return os.path.splitext(path)[0] + ".nav"
+
+
+def get_grid_stamp(collision_grid, borders, agent_size):
+
+    """
+    Returns checksum of everything a graph is built from, cached graph is rebuilt when it changes.
+    """
+
+    settings = (VERSION, agent_size, collision_grid.tile_size, collision_grid.min_x, collision_grid.min_y, collision_grid.width,
+                collision_grid.height, list(borders), SPEED, JUMPS, JUMP_MOMENTUM, GRAVITY, MAX_FALL, SECOND_JUMP_DELAYS,
+                MAX_MOVE_TICKS, [list(heights) for heights in collision_grid.ramp_heights])
+    stamp = zlib.crc32(repr(settings).encode())
+    stamp = zlib.crc32(collision_grid.solid.tobytes(), stamp)
+    return zlib.crc32(collision_grid.ramps.tobytes(), stamp)
+
+
+def find_surfaces(collision_grid, agent_size):
+
+    """
+    Returns {(x, y): (left floor, right floor)} of cells an agent can stand in,
+    floors are pixel y of the surface at left and right edge of the cell.
+    A cell is standing cell when it is a ramp or has a solid cell under it, and agent fits above it.
+    """
+
+    grid = collision_grid
+    tile_size = grid.tile_size
+    rows = -(-agent_size[1] // tile_size)
+    surfaces = {}
+
+    for y in range(grid.min_y - 1, grid.min_y + grid.height):
+        for x in range(grid.min_x, grid.min_x + grid.width):
+
+            if grid.is_solid(x, y):
+                continue
+
+            ramp = grid.get_ramp(x, y)
+            if ramp == 0 and not grid.is_solid(x, y + 1):
+                continue
+
+            if any(grid.is_solid(x, y - i) for i in range(1, rows)):
+                continue
+
+            bottom = (y + 1) * tile_size
+            if ramp == 0:
+                surfaces[(x, y)] = (bottom, bottom)
+            else:
+                heights = grid.ramp_heights[ramp]
+                surfaces[(x, y)] = (bottom - heights[0], bottom - heights[tile_size])
+
+    return surfaces
+
+
+def build_segments(surfaces):
+
+    """
+    Joins standing cells into segments, lists of cells from left to right where the floor
+    of every cell continues at the same height in the next one (flat floors and ramps).
+    """
+
+    right = {}
+    claimed = set()
+
+    for (x, y), (left_floor, right_floor) in sorted(surfaces.items()):
+        for next_y in (y - 1, y, y + 1):
+            other = surfaces.get((x + 1, next_y))
+            if other != None and other[0] == right_floor and (x + 1, next_y) not in claimed:
+                right[(x, y)] = (x + 1, next_y)
+                claimed.add((x + 1, next_y))
+                break
+
+    segments = []
+    for cell in sorted(surfaces):
+        if cell in claimed:
+            continue
+        cells = [cell]
+        while cells[-1] in right:
+            cells.append(right[cells[-1]])
+        segments.append(cells)
+
+    return segments
+
+
+class NavGraph(object):
+
+    """
+    Segments are lists of standing cells (x, y), edges are tuples of
+    (segment, cell, target segment, target cell, kind, move, ticks): agent standing in the middle
+    of cell that does move ("fall" or "jump" kind) lands in target cell after ticks.
+    Move is (direction, jump) with jump None for walking off, 0 for a single jump,
+    other values for a double jump after that many ticks.
+    find_path keeps the last max_paths results, budget_ms limits time of every query.
+    """
+
+    def __init__(self, segments, edges, tile_size=TILE_SIZE, max_paths=64, budget_ms=None):
+        self.segments = segments
+        self.edges = edges
+        self.tile_size = tile_size
+        self.max_paths = max_paths
+        self.budget_ms = budget_ms
+
+        self.segment_of = {cell: i for i, cells in enumerate(segments) for cell in cells}
+        self.outgoing = [[] for i in range(len(segments))]
+        for edge in edges:
+            self.outgoing[edge[0]].append(edge)
+
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def locate(self, x, y):
+
+        """
+        Returns standing cell under pixel position x, y (like bottom center of an entity), or None.
+        Cell next to x counts too when x is over a gap, for entities standing on an edge.
+        """
+
+        column = int(x) // self.tile_size
+        row = (int(y) - 1) // self.tile_size
+        nearest = column - 1 if int(x) % self.tile_size < self.tile_size // 2 else column + 1
+        for i in range(LOCATE_DEPTH + 1):
+            for cell_x in (column, nearest):
+                if (cell_x, row + i) in self.segment_of:
+                    return (cell_x, row + i)
+        return None
+
+    def get_walk_ticks(self, cell, other):
+        return abs(cell[0] - other[0]) * self.tile_size / SPEED
+
+    def find_path(self, start, goal, budget_ms=None):
+
+        """
+        Finds fastest way from pixel position start to goal. Returns (status, steps), status is
+        "found", "unreachable", "no_surface" (start or goal isn't above any surface) or "budget"
+        when search ran out of time, then steps lead to the place closest to goal found so far.
+        Steps are (kind, cell, target cell, move) with kind "walk", "fall" or "jump".
+        """
+
+        start = self.locate(*start)
+        goal = self.locate(*goal)
+        if start == None or goal == None:
+            return "no_surface", None
+
+        key = (start, goal)
+        if key in self.paths:
+            self.hits += 1
+            self.paths.move_to_end(key)
+            return self.paths[key]
+        self.misses += 1
+
+        if budget_ms == None:
+            budget_ms = self.budget_ms
+        result = self.search(start, goal, budget_ms)
+
+        if result[0] != "budget":
+            self.paths[key] = result
+            while len(self.paths) > self.max_paths:
+                self.paths.popitem(last=False)
+
+        return result
+
+    def search(self, start, goal, budget_ms=None):
+
+        """
+        A* from start to goal cell, cost is ticks. Heuristic is horizontal distance at full speed,
+        nothing moves sideways faster. Nodes are landing cells of edges, goal is reached by walking along its segment.
+        """
+
+        deadline = None
+        if budget_ms != None:
+            deadline = time.perf_counter() + budget_ms / 1000
+
+        goal_segment = self.segment_of[goal]
+        walk = self.get_walk_ticks
+        segment_of = self.segment_of
+        outgoing = self.outgoing
+
+        costs = {start: 0}
+        came_from = {start: None}
+        queue = [(walk(start, goal), 0, 0, start)]
+        closest = start
+        closest_distance = walk(start, goal)
+        pushed = 1
+        expanded = 0
+
+        while queue:
+            estimate, cost, order, cell = heapq.heappop(queue)
+            if cost > costs[cell]:
+                continue
+
+            if cell == goal:
+                return "found", self.get_steps(came_from, goal)
+
+            if deadline != None and expanded % 16 == 0 and time.perf_counter() > deadline:
+                return "budget", self.get_steps(came_from, closest)
+            expanded += 1
+
+            if walk(cell, goal) < closest_distance:
+                closest, closest_distance = cell, walk(cell, goal)
+
+            neighbours = [(edge[3], cost + walk(cell, edge[1]) + edge[6], (cell, edge)) for edge in outgoing[segment_of[cell]]]
+            if segment_of[cell] == goal_segment:
+                neighbours.append((goal, cost + walk(cell, goal), (cell, None)))
+
+            for target, target_cost, step in neighbours:
+                if target_cost < costs.get(target, float("inf")):
+                    costs[target] = target_cost
+                    came_from[target] = step
+                    heapq.heappush(queue, (target_cost + walk(target, goal), target_cost, pushed, target))
+                    pushed += 1
+
+        return "unreachable", None
+
+    def get_steps(self, came_from, cell):
+
+        """
+        Walks came_from back from cell, returns steps in the order they are done.
+        """
+
+        steps = []
+        while came_from[cell] != None:
+            previous, edge = came_from[cell]
+            if edge == None:
+                steps.append(("walk", previous, cell, None))
+            else:
+                steps.append((edge[4], edge[1], edge[3], edge[5]))
+                if previous != edge[1]:
+                    steps.append(("walk", previous, edge[1], None))
+            cell = previous
+        steps.reverse()
+        return steps
+
+    def clear_paths(self):
+        self.paths.clear()
+
+
+def simulate_move(collision_grid, borders, agent_size, cell, floor, move, segment_of, surfaces):
+
+    """
+    Plays move of agent standing in the middle of cell with its feet at floor (pixel y),
+    the same way World.step moves the player. Returns (target cell, ticks) of the first
+    landing on another segment, or None when agent dies, lands on its own segment or never lands.
+    """
+
+    direction, jump = move
+    width, height = agent_size
+    tile_size = collision_grid.tile_size
+    source = segment_of[cell]
+
+    agent = entities.entity(cell[0] * tile_size + (tile_size - width) // 2, floor - height, width, height)
+    momentum = JUMP_MOMENTUM if jump != None else 0
+
+    for tick in range(1, MAX_MOVE_TICKS + 1):
+
+        if jump != None and jump > 0 and tick == jump:
+            momentum = JUMP_MOMENTUM
+
+        movement = [direction * SPEED, momentum]
+        momentum = min(momentum + GRAVITY, MAX_FALL)
+
+        collisions = agent.move(movement, collision_grid)
+        if collisions["bottom"] == True:
+            momentum = 0
+
+        if agent.y > borders[1]:
+            return None
+        if agent.x < borders[0]:
+            agent.set_pos(borders[0], agent.y)
+        if agent.x + width > borders[2]:
+            agent.set_pos(borders[2] - width, agent.y)
+
+        if collisions["bottom"] == False and collisions["slant_bottom"] == False:
+            continue
+
+        rect = agent.obj.rect
+        row = (rect.bottom - 1) // tile_size
+        target = None
+        for column in (rect.centerx // tile_size, rect.left // tile_size, (rect.right - 1) // tile_size):
+            if (column, row) in surfaces:
+                target = (column, row)
+                break
+
+        if target == None or segment_of[target] == source:
+            if jump == None and tick < WALK_OFF_TICKS:
+                continue
+            return None
+
+        return target, tick
+
+    return None
+
+
+def build_nav_graph(collision_grid, borders, agent_size=AGENT_SIZE, **kwargs):
+
+    """
+    Builds navigation graph of collision grid. From every standing cell a single jump and double
+    jumps are tried in every direction, from both ends of every segment the agent also walks off.
+    Only the fastest edge from a cell to each other segment is kept.
+    """
+
+    tile_size = collision_grid.tile_size
+    width = agent_size[0]
+    surfaces = find_surfaces(collision_grid, agent_size)
+    segments = build_segments(surfaces)
+    segment_of = {cell: i for i, cells in enumerate(segments) for cell in cells}
+
+    jump_moves = [(direction, jump) for direction in (-1, 0, 1) for jump in (0,) + SECOND_JUMP_DELAYS]
+    edges = []
+
+    for i, cells in enumerate(segments):
+        for cell in cells:
+
+            moves = list(jump_moves)
+            if cell == cells[0]:
+                moves.append((-1, None))
+            if cell == cells[-1]:
+                moves.append((1, None))
+
+            left = cell[0] * tile_size + (tile_size - width) // 2
+            ramp = collision_grid.get_ramp(*cell)
+            if ramp == 0:
+                floor = (cell[1] + 1) * tile_size
+            else:
+                floor = collision_grid.get_ramp_floor(ramp, cell[0] * tile_size, cell[1] * tile_size, left, left + width)
+
+            fastest = {}
+            for move in moves:
+                landing = simulate_move(collision_grid, borders, agent_size, cell, floor, move, segment_of, surfaces)
+                if landing == None:
+                    continue
+                target, ticks = landing
+                kind = "fall" if move[1] == None else "jump"
+                target_segment = segment_of[target]
+                if target_segment not in fastest or ticks < fastest[target_segment][6]:
+                    fastest[target_segment] = (i, cell, target_segment, target, kind, move, ticks)
+
+            edges.extend(fastest[target_segment] for target_segment in sorted(fastest))
+
+    return NavGraph(segments, edges, tile_size, **kwargs)
+
+
+def load_nav_graph(path, stamp, **kwargs):
+
+    """
+    Loads cached graph, returns None when file is missing or was built from other collision data.
+    """
+
+    try:
+        with open(path, "rb") as file:
+            data = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if data.get("version") != VERSION or data.get("stamp") != stamp:
+        return None
+    return NavGraph(data["segments"], data["edges"], data["tile_size"], **kwargs)
+
+
+def save_nav_graph(graph, path, stamp):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump({"version": VERSION,
+                     "stamp": stamp,
+                     "tile_size": graph.tile_size,
+                     "segments": graph.segments,
+                     "edges": graph.edges}, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def get_nav_graph(level_path, collision_grid, borders, agent_size=AGENT_SIZE, **kwargs):
+
+    """
+    Returns navigation graph of level, loaded from level.nav next to level file when it is
+    up to date, otherwise built and saved there.
+    """
+
+    stamp = get_grid_stamp(collision_grid, borders, agent_size)
+    path = get_nav_path(level_path)
+
+    graph = load_nav_graph(path, stamp, **kwargs)
+    if graph == None:
+        graph = build_nav_graph(collision_grid, borders, agent_size, **kwargs)
+        try:
+            save_nav_graph(graph, path, stamp)
+        except OSError: # read only level directory, graph just isn't cached
+            pass
+
+    return graph
+
+
+class LazyNavGraph(object):
+
+    """
+    Navigation graph of level that is loaded (or built) on the first query instead of at load time,
+    so levels nothing navigates in never wait for it. Queries are the ones of NavGraph.
+    """
+
+    def __init__(self, level_path, collision_grid, borders, agent_size=AGENT_SIZE, **kwargs):
+        self.level_path = level_path
+        self.collision_grid = collision_grid
+        self.borders = borders
+        self.agent_size = agent_size
+        self.kwargs = kwargs
+        self.graph = None
+
+    def get_graph(self):
+        if self.graph == None:
+            self.graph = get_nav_graph(self.level_path, self.collision_grid, self.borders, self.agent_size, **self.kwargs)
+        return self.graph
+
+    def locate(self, x, y):
+        return self.get_graph().locate(x, y)
+
+    def find_path(self, start, goal, budget_ms=None):
+        return self.get_graph().find_path(start, goal, budget_ms)
+
+
+if __name__ == "__main__":
+
+    import random
+
+    main_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, main_path)
+    import data.world as world_module
+
+    for level_path in sys.argv[1:] or [f"{main_path}/data/save1.json"]:
+        world = world_module.load_world(main_path, os.path.relpath(os.path.abspath(level_path), f"{main_path}/data"))
+
+        start = time.perf_counter()
+        graph = build_nav_graph(world.collision_grid, world.borders)
+        build_time = time.perf_counter() - start
+        save_nav_graph(graph, get_nav_path(level_path), get_grid_stamp(world.collision_grid, world.borders, AGENT_SIZE))
+
+        start = time.perf_counter()
+        graph = get_nav_graph(level_path, world.collision_grid, world.borders)
+        load_time = time.perf_counter() - start
+
+        kinds = [edge[4] for edge in graph.edges]
+        print(f"{level_path}: {len(graph.segments)} segments, {len(graph.segment_of)} cells, "
+              f"{kinds.count('jump')} jump and {kinds.count('fall')} fall edges")
+        print(f"built in {build_time * 1000:.0f} ms, loaded from {get_nav_path(level_path)} in {load_time * 1000:.1f} ms")
+
+        # queries between random standing cells, then the same ones again from path cache
+        random.seed(1)
+        cells = sorted(graph.segment_of)
+        tile_size = graph.tile_size
+        queries = [[((cell[0] + 0.5) * tile_size, (cell[1] + 1) * tile_size) for cell in random.sample(cells, 2)] for i in range(200)]
+
+        statuses = {}
+        start = time.perf_counter()
+        for query_start, query_goal in queries:
+            status = graph.find_path(query_start, query_goal)[0]
+            statuses[status] = statuses.get(status, 0) + 1
+        search_time = time.perf_counter() - start
+
+        graph.max_paths = len(queries)
+        for query_start, query_goal in queries:
+            graph.find_path(query_start, query_goal)
+        start = time.perf_counter()
+        for query_start, query_goal in queries:
+            graph.find_path(query_start, query_goal)
+        cached_time = time.perf_counter() - start
+
+        print(f"{len(queries)} queries {statuses}: {search_time / len(queries) * 1000:.3f} ms per search, "
+              f"{cached_time / len(queries) * 1000:.4f} ms per cached path")
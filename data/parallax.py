@@ -0,0 +1,135 @@
+"""
+Parallax background made of layers drawn back to front, every layer has its own scroll factor.
+Repeating images are pre-composited into one wrap-around strip at load time, so a layer
+costs a single blit per frame, and layers outside of the view are skipped.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+
+try:
+    from debug import profiler
+except ImportError:
+    from data.debug import profiler
+
+
+class ColorLayer(object):
+
+    """
+    Solid color filling the whole view, like the sky.
+    """
+
+    def __init__(self, color):
+        self.color = color
+
+    def render(self, surface, camera_offset):
+        surface.fill(self.color)
+        return True
+
+
+class ImageLayer(object):
+
+    """
+    Image repeated horizontally. Anchor is the world position where the image
+    lies when camera is at it, factor is how fast it scrolls compared to camera.
+    """
+
+    def __init__(self, image, factor, anchor=(0, 0), view_width=480):
+        self.image = image
+        self.factor = factor
+        self.anchor = anchor
+        self.width = image.get_width()
+        self.height = image.get_height()
+        self.strip = self.build_strip(view_width)
+
+    def build_strip(self, view_width):
+
+        """
+        Tiles image into strip wide enough that view always fits into it
+        after wrapping, no matter where the image starts.
+        """
+
+        copies = view_width // self.width + 2
+        strip = pygame.Surface((self.width * copies, self.height)).convert(self.image)
+
+        colorkey = self.image.get_colorkey()
+        if colorkey != None:
+            strip.fill(colorkey)
+            strip.set_colorkey(colorkey)
+
+        for copy in range(copies):
+            strip.blit(self.image, (copy * self.width, 0))
+
+        return strip
+
+    def render(self, surface, camera_offset):
+        x = -(((camera_offset[0] - self.anchor[0]) * self.factor) % self.width)
+        y = (self.anchor[1] - camera_offset[1]) * self.factor
+
+        if y >= surface.get_height() or y + self.height <= 0:
+            return False
+
+        surface.blit(self.strip, (x, y))
+        return True
+
+
+class TileLayer(object):
+
+    """
+    Pre-rendered tiles of a ChunkCache scrolled by factor.
+    """
+
+    def __init__(self, chunk_cache, factor=1):
+        self.chunk_cache = chunk_cache
+        self.factor = factor
+
+    def render(self, surface, camera_offset):
+        self.chunk_cache.render(surface, (int(camera_offset[0] * self.factor), int(camera_offset[1] * self.factor)))
+        return True
+
+
+def get_background_tiles(tile_map, background_ids, margin):
+
+    """
+    Returns set of (x, y, depth, tileset_id) of background tileset tiles that can be drawn
+    in a layer behind all other tiles without changing how the level looks, which means
+    every other tile they can overlap (within margin cells) has higher depth.
+    """
+
+    tiles = set()
+    for depth, y, x, tileset, tile in tile_map.query(tile_map.min_x, tile_map.min_y, tile_map.min_x + tile_map.width, tile_map.min_y + tile_map.height):
+        tileset_id = tile_map.tileset_names[tileset]
+        if tileset_id in background_ids:
+            tiles.add((x, y, depth, tileset_id))
+
+    # removing a tile can block its neighbours, so repeat until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        for x, y, depth, tileset_id in list(tiles):
+            for other in tile_map.query(x - margin, y - margin, x + margin + 1, y + margin + 1):
+                other_key = (other[2], other[1], other[0], tile_map.tileset_names[other[3]])
+                if other_key not in tiles and other[0] <= depth:
+                    tiles.remove((x, y, depth, tileset_id))
+                    changed = True
+                    break
+
+    return tiles
+
+
+class Parallax(object):
+
+    """
+    Draws layers from the farthest to the nearest one.
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+
+    def render(self, surface, camera_offset):
+        drawn = 0
+        for layer in self.layers:
+            if layer.render(surface, camera_offset):
+                drawn += 1
+        profiler.count("parallax.layers", drawn)
@@ -0,0 +1,103 @@
+"""
+Final present stage: scales game surface onto the window without allocating per frame.
+Game surface is scaled straight into a subsurface of the window, so the scaled copy
+is never created. Window of any size is supported, the rest is letterboxed.
+Counter present.surfaces counts surfaces this stage creates (the window subsurface after
+a resize), surfaces created by the rest of the frame aren't counted.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+
+try:
+    from debug import profiler
+except ImportError:
+    from data.debug import profiler
+
+
+class Presenter(object):
+
+    """
+    With integer_scale the game is scaled by the biggest whole multiple that fits the window,
+    so every game pixel becomes an exact square, otherwise it is stretched as much as aspect allows.
+    When window is an exact multiple of game size, the whole window is the target and no borders are drawn.
+    """
+
+    def __init__(self, screen, game_size, integer_scale=True, border_color=(0, 0, 0)):
+        self.game_size = game_size
+        self.integer_scale = integer_scale
+        self.border_color = border_color
+        self.surfaces = 0
+        self.resize(screen)
+
+    def get_scale(self, screen_size):
+        scale = min(screen_size[0] / self.game_size[0], screen_size[1] / self.game_size[1])
+        if self.integer_scale and scale >= 1:
+            return int(scale)
+        return scale
+
+    def resize(self, screen):
+
+        """
+        Prepares target area for window surface, call it again after window size changes.
+        """
+
+        screen_width, screen_height = screen.get_size()
+        self.screen = screen
+        self.scale = self.get_scale((screen_width, screen_height))
+
+        width = max(int(self.game_size[0] * self.scale), 1)
+        height = max(int(self.game_size[1] * self.scale), 1)
+        self.rect = pygame.Rect((screen_width - width) // 2, (screen_height - height) // 2, width, height)
+        self.exact = self.rect.size == (screen_width, screen_height)
+
+        if self.exact:
+            self.target = screen
+        else:
+            self.target = screen.subsurface(self.rect)
+            self.surfaces += 1
+
+        # borders never change, so they are drawn once and only the game area is updated after that
+        screen.fill(self.border_color)
+        self.full_update = True
+
+    def present(self, surface):
+
+        """
+        Scales surface into window and updates the display.
+        """
+
+        self.scale_to_window(surface)
+        self.flip()
+
+    def scale_to_window(self, surface):
+
+        """
+        Scales surface into window without updating the display, can run on render thread.
+        """
+
+        pygame.transform.scale(surface, self.rect.size, self.target)
+
+    def flip(self):
+
+        """
+        Shows scaled game area (whole window after resize), has to run on the main thread.
+        """
+
+        profiler.count("present.surfaces", self.surfaces)
+        self.surfaces = 0
+
+        if self.full_update or self.exact:
+            pygame.display.update()
+            self.full_update = False
+        else:
+            pygame.display.update(self.rect)
+
+    def to_game_pos(self, pos):
+
+        """
+        Transforms window position (like mouse position) to game surface position.
+        """
+
+        return (int((pos[0] - self.rect.x) / self.scale), int((pos[1] - self.rect.y) / self.scale))
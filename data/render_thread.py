@@ -0,0 +1,117 @@
+"""
+Pipelined rendering: simulation runs on the main thread and publishes immutable snapshots
+of what is to be drawn, a render thread draws the previous snapshot and scales it
+into the window meanwhile. pygame blits and scaling release the GIL, so on more than
+one core drawing frame n overlaps with simulating frame n + 1, for one frame of extra latency.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import time
+import threading
+from collections import namedtuple
+
+try:
+    from debug import profiler
+except ImportError:
+    from data.debug import profiler
+
+
+# camera offset, (image, position) of every sprite in draw order, overlay text lines or None
+# and perf_counter time when inputs of the frame were read, for measuring latency
+Snapshot = namedtuple("Snapshot", ("camera_offset", "sprites", "overlay", "time"))
+
+
+class RenderThread(object):
+
+    """
+    Double buffered snapshots: main thread fills the back buffer while the worker draws
+    the front one, submit swaps them. draw(surface, snapshot) draws into surface, the worker then
+    scales it into the window with presenter.scale_to_window. Display is updated by the main thread
+    with presenter.flip after wait returns, as some platforms only allow that on the main thread.
+    Anything draw uses (chunk caches, background) belongs to the worker while it runs.
+    """
+
+    def __init__(self, surface, presenter, draw):
+        self.surface = surface
+        self.presenter = presenter
+        self.draw = draw
+        self.buffers = [None, None]
+        self.front = 0
+        self.pending = False
+        self.drawing = False
+        self.running = True
+        self.error = None
+        self.drawn = None
+        self.render_time = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot):
+
+        """
+        Publishes next snapshot. When the worker didn't start the previous one yet, it is replaced.
+        """
+
+        with self.condition:
+            back = 1 - self.front
+            self.buffers[back] = snapshot
+            self.front = back
+            self.pending = True
+            self.condition.notify_all()
+
+    def wait(self):
+
+        """
+        Waits until every submitted snapshot is drawn and scaled, returns the last one drawn (or None).
+        """
+
+        with self.condition:
+            while (self.pending or self.drawing) and self.error == None:
+                self.condition.wait()
+
+            if self.error != None:
+                raise self.error
+            return self.drawn
+
+    def run(self):
+
+        """
+        Worker loop, draws front snapshot whenever a new one is submitted.
+        """
+
+        while True:
+            with self.condition:
+                while self.pending == False and self.running:
+                    self.condition.wait()
+                if self.running == False:
+                    return
+
+                snapshot = self.buffers[self.front]
+                self.pending = False
+                self.drawing = True
+
+            start = time.perf_counter()
+            try:
+                self.draw(self.surface, snapshot)
+                self.presenter.scale_to_window(self.surface)
+            except Exception as error:
+                with self.condition:
+                    self.error = error
+                    self.drawing = False
+                    self.condition.notify_all()
+                return
+            self.render_time = time.perf_counter() - start
+            profiler.end("render", start)
+
+            with self.condition:
+                self.drawn = snapshot
+                self.drawing = False
+                self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
@@ -0,0 +1,264 @@
+"""
+Spatial hash for overlap queries between entities, triggers and hazards.
+Objects are kept in buckets of a uniform grid keyed by cell, so a query only tests
+objects sharing a cell with it instead of every object, which keeps finding all
+overlaps of n objects close to O(n). Moving objects change buckets only when
+they cross a cell border.
+
+Usage: python -m data.spatial_hash [objects] [frames]   (benchmark against pairwise colliderect)
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+
+
+ALL_LAYERS = 0xFFFFFFFF
+
+
+class SpatialHash(object):
+
+    """
+    Holds rects under any hashable key. Every object has layer bits and
+    queries only return objects whose layer matches the query mask.
+    Triggers are objects with a mask and callbacks, on_enter(trigger, key) is called
+    when an object starts overlapping them and on_exit(trigger, key) when it stops.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+        self.layers = {}
+        self.spans = {}
+        self.triggers = {}
+
+    def get_span(self, rect):
+
+        """
+        Returns cells covered by rect as (x1, y1, x2, y2), end inclusive.
+        """
+
+        cell_size = self.cell_size
+        return (rect[0] // cell_size, rect[1] // cell_size,
+                (rect[0] + max(rect[2], 1) - 1) // cell_size, (rect[1] + max(rect[3], 1) - 1) // cell_size)
+
+    def add_to_cells(self, key, span):
+        cells = self.cells
+        for cell_y in range(span[1], span[3] + 1):
+            for cell_x in range(span[0], span[2] + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if bucket == None:
+                    cells[(cell_x, cell_y)] = bucket = set()
+                bucket.add(key)
+
+    def remove_from_cells(self, key, span):
+        cells = self.cells
+        for cell_y in range(span[1], span[3] + 1):
+            for cell_x in range(span[0], span[2] + 1):
+                bucket = cells[(cell_x, cell_y)]
+                bucket.discard(key)
+                if not bucket:
+                    del cells[(cell_x, cell_y)]
+
+    def insert(self, key, rect, layer=1):
+
+        """
+        Adds object, rect is copied so the caller can keep changing its own.
+        """
+
+        if key in self.rects:
+            self.remove(key)
+
+        span = self.get_span(rect)
+        self.rects[key] = pygame.Rect(rect)
+        self.layers[key] = layer
+        self.spans[key] = span
+        self.add_to_cells(key, span)
+
+    def update(self, key, rect):
+
+        """
+        Moves object to rect, buckets change only when it covers different cells than before.
+        """
+
+        self.rects[key].update(rect)
+        span = self.get_span(rect)
+        old_span = self.spans[key]
+
+        if span != old_span:
+            self.remove_from_cells(key, old_span)
+            self.add_to_cells(key, span)
+            self.spans[key] = span
+
+    def remove(self, key):
+        self.remove_from_cells(key, self.spans.pop(key))
+        del self.rects[key]
+        del self.layers[key]
+        self.triggers.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def __len__(self):
+        return len(self.rects)
+
+    def get_rect(self, key):
+        return self.rects[key]
+
+    def query(self, rect, mask=ALL_LAYERS, exclude=None):
+
+        """
+        Returns keys of objects overlapping rect whose layer matches mask.
+        """
+
+        cells = self.cells
+        rects = self.rects
+        layers = self.layers
+        x1, y1, x2, y2 = self.get_span(rect)
+
+        if x1 == x2 and y1 == y2:
+            candidates = cells.get((x1, y1), ())
+        else:
+            candidates = set()
+            for cell_y in range(y1, y2 + 1):
+                for cell_x in range(x1, x2 + 1):
+                    bucket = cells.get((cell_x, cell_y))
+                    if bucket != None:
+                        candidates.update(bucket)
+
+        return [key for key in candidates
+                if layers[key] & mask and key != exclude and rects[key].colliderect(rect)]
+
+    def get_pairs(self, mask=ALL_LAYERS):
+
+        """
+        Returns set of (key, key) pairs of overlapping objects whose layers match mask.
+        Key with smaller repr goes first, so every pair comes once even when it shares several cells.
+        """
+
+        rects = self.rects
+        layers = self.layers
+        pairs = set()
+
+        for bucket in self.cells.values():
+            if len(bucket) < 2:
+                continue
+            keys = [key for key in bucket if layers[key] & mask]
+            for i, key in enumerate(keys):
+                rect = rects[key]
+                for other in keys[i + 1:]:
+                    if rect.colliderect(rects[other]):
+                        pairs.add((key, other) if repr(key) < repr(other) else (other, key))
+
+        return pairs
+
+    def add_trigger(self, key, rect, mask, on_enter, on_exit=None, layer=0):
+
+        """
+        Adds trigger area, by default on layer 0 so other queries don't find it.
+        """
+
+        self.insert(key, rect, layer)
+        self.triggers[key] = [mask, on_enter, on_exit, set()]
+
+    def update_triggers(self):
+
+        """
+        Calls enter and exit callbacks of all triggers, call it after objects moved.
+        """
+
+        for key, (mask, on_enter, on_exit, inside) in list(self.triggers.items()):
+            if key not in self.triggers:
+                continue
+
+            overlapping = self.query(self.rects[key], mask, key)
+            if not overlapping and not inside:
+                continue
+
+            overlapping = set(overlapping)
+
+            for other in overlapping - inside:
+                on_enter(key, other)
+            for other in inside - overlapping:
+                if on_exit != None:
+                    on_exit(key, other)
+
+            # callbacks can remove the trigger or move objects around
+            if key in self.triggers:
+                self.triggers[key][3] = overlapping
+
+    def save_triggers(self):
+
+        """
+        Returns which objects every trigger is overlapping, restore_triggers puts it back.
+        """
+
+        return {key: set(trigger[3]) for key, trigger in self.triggers.items()}
+
+    def restore_triggers(self, state):
+        for key, inside in state.items():
+            if key in self.triggers:
+                self.triggers[key][3] = set(inside)
+
+
+def get_pairs_naive(rects):
+
+    """
+    Returns the same pairs as SpatialHash.get_pairs by testing every pair of {key: rect}.
+    """
+
+    items = list(rects.items())
+    pairs = set()
+    for i, (key, rect) in enumerate(items):
+        for other, other_rect in items[i + 1:]:
+            if rect.colliderect(other_rect):
+                pairs.add((key, other) if repr(key) < repr(other) else (other, key))
+    return pairs
+
+
+if __name__ == "__main__":
+
+    import sys
+    import time
+    import random
+
+    # Objects wander around an area that grows with their count, so density stays the same
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    size = int((count * 2000) ** 0.5)
+
+    random.seed(1)
+    rects = {i: pygame.Rect(random.randrange(size), random.randrange(size), random.randint(8, 30), random.randint(8, 30)) for i in range(count)}
+    velocities = {i: (random.uniform(-3, 3), random.uniform(-3, 3)) for i in range(count)}
+
+    spatial_hash = SpatialHash()
+    for key, rect in rects.items():
+        spatial_hash.insert(key, rect)
+
+    hash_time = 0
+    naive_time = 0
+    overlaps = 0
+
+    for frame in range(frames):
+        for key, rect in rects.items():
+            rect.x = (rect.x + int(velocities[key][0])) % size
+            rect.y = (rect.y + int(velocities[key][1])) % size
+
+        start = time.perf_counter()
+        for key, rect in rects.items():
+            spatial_hash.update(key, rect)
+        pairs = spatial_hash.get_pairs()
+        hash_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        naive_pairs = get_pairs_naive(rects)
+        naive_time += time.perf_counter() - start
+
+        if pairs != naive_pairs:
+            raise SystemExit(f"frame {frame}: spatial hash found {len(pairs)} pairs, pairwise check {len(naive_pairs)}")
+        overlaps += len(pairs)
+
+    print(f"{count} objects, {frames} frames, {overlaps / frames:.0f} overlapping pairs per frame")
+    print(f"spatial hash (update + pairs): {hash_time / frames * 1000:8.2f} ms per frame")
+    print(f"pairwise colliderect:          {naive_time / frames * 1000:8.2f} ms per frame")
@@ -0,0 +1,199 @@
+"""
+Streamed tile map for levels compiled into regions (python -m data.level_compiler --regions).
+Regions around the camera are read by a background thread, the main thread only picks up
+finished ones, so a frame never waits for the disk. Least recently needed regions are
+dropped when loaded regions take more memory than the budget.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+try:
+    import level_compiler
+except ImportError:
+    import data.level_compiler as level_compiler
+
+
+class StreamedTileMap(object):
+
+    """
+    Read only tile map with the query interface of TileMap, made of region tile maps.
+    Cells of regions that exist but aren't loaded yet are reported by is_ready
+    and get_pending_areas, collision grid treats them as solid.
+    """
+
+    def __init__(self, path, index, memory_budget=4 * 1024 * 1024, load_radius=1):
+        self.path = path
+        self.region_size = index["region_size"]
+        self.available = index["regions"]
+        self.min_x, self.min_y, self.width, self.height = index["bounds"]
+        self.layers = 1
+        self.tileset_names = index["names"]
+        self.tileset_ids = {name: i for i, name in enumerate(self.tileset_names)}
+
+        self.memory_budget = memory_budget
+        self.load_radius = load_radius
+        self.regions = OrderedDict()
+        self.loaded_bytes = 0
+        self.requested = set()
+
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.load_regions, daemon=True)
+        self.thread.start()
+
+    def get_region_file(self, key):
+        return os.path.join(self.path, f"{key[0]}_{key[1]}.bin")
+
+    def load_regions(self):
+
+        """
+        Loader thread, reads requested regions until None is requested.
+        """
+
+        while True:
+            key = self.requests.get()
+            if key == None:
+                break
+            try:
+                self.results.put((key, level_compiler.load_region(self.get_region_file(key), self.tileset_names)))
+            except (OSError, ValueError) as error:
+                self.results.put((key, error))
+
+    def close(self):
+
+        """
+        Stops the loader thread, waiting for the region it is loading.
+        """
+
+        self.requests.put(None)
+        self.thread.join()
+
+    def get_region_key(self, x, y):
+        return x // self.region_size, y // self.region_size
+
+    def get_region_area(self, key):
+
+        """
+        Returns cells of region as (x1, y1, x2, y2), end exclusive.
+        """
+
+        return (key[0] * self.region_size, key[1] * self.region_size,
+                (key[0] + 1) * self.region_size, (key[1] + 1) * self.region_size)
+
+    def get_region_keys(self, x1, y1, x2, y2):
+
+        """
+        Returns keys of regions overlapping cells x1 <= x < x2, y1 <= y < y2.
+        """
+
+        first_x, first_y = self.get_region_key(x1, y1)
+        last_x, last_y = self.get_region_key(x2 - 1, y2 - 1)
+        return [(region_x, region_y) for region_y in range(first_y, last_y + 1) for region_x in range(first_x, last_x + 1)]
+
+    def add_region(self, key, region):
+        self.regions[key] = region
+        self.loaded_bytes += region.nbytes()
+
+    def remove_region(self, key):
+        self.loaded_bytes -= self.regions.pop(key).nbytes()
+
+    def load_area(self, x1, y1, x2, y2):
+
+        """
+        Loads regions overlapping the cells right away on this thread, used before the first frame.
+        """
+
+        for key in self.get_region_keys(x1, y1, x2, y2):
+            if key in self.available and key not in self.regions:
+                self.add_region(key, level_compiler.load_region(self.get_region_file(key), self.tileset_names))
+
+    def update(self, x1, y1, x2, y2):
+
+        """
+        Requests regions around cells x1 <= x < x2, y1 <= y < y2 (the view), takes over
+        finished ones and evicts regions over memory budget. Never waits for the loader.
+        Returns areas (x1, y1, x2, y2) of regions that were loaded or evicted.
+        """
+
+        margin = self.load_radius * self.region_size
+        wanted = [key for key in self.get_region_keys(x1 - margin, y1 - margin, x2 + margin, y2 + margin) if key in self.available]
+
+        for key in wanted:
+            if key in self.regions:
+                self.regions.move_to_end(key)
+            elif key not in self.requested:
+                self.requested.add(key)
+                self.requests.put(key)
+
+        changed = []
+
+        while True:
+            try:
+                key, region = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.requested.discard(key)
+            if isinstance(region, Exception):
+                raise region
+            if key not in self.regions:
+                self.add_region(key, region)
+                changed.append(self.get_region_area(key))
+
+        # regions around the view are the most recently used ones, so they go last
+        wanted = set(wanted)
+        for key in list(self.regions):
+            if self.loaded_bytes <= self.memory_budget:
+                break
+            if key not in wanted:
+                self.remove_region(key)
+                changed.append(self.get_region_area(key))
+
+        return changed
+
+    def is_ready(self, x, y):
+        key = self.get_region_key(x, y)
+        return key in self.regions or key not in self.available
+
+    def get_pending_areas(self):
+        return [self.get_region_area(key) for key in self.available if key not in self.regions]
+
+    def in_bounds(self, x, y):
+        return self.min_x <= x < self.min_x + self.width and self.min_y <= y < self.min_y + self.height
+
+    def cells(self):
+
+        """
+        Yields positions of all loaded cells that have at least one tile.
+        """
+
+        for region in list(self.regions.values()):
+            yield from region.cells()
+
+    def get_tiles(self, x, y):
+        region = self.regions.get(self.get_region_key(x, y))
+        if region == None:
+            return []
+        return region.get_tiles(x, y)
+
+    def query(self, x1, y1, x2, y2):
+
+        """
+        Same as TileMap.query, but tiles come region by region
+        and regions that aren't loaded have no tiles.
+        """
+
+        result = []
+        for key in self.get_region_keys(x1, y1, x2, y2):
+            region = self.regions.get(key)
+            if region != None:
+                result.extend(region.query(x1, y1, x2, y2))
+        return result
+
+    def nbytes(self):
+        return self.loaded_bytes
@@ -0,0 +1,344 @@
+"""
+Chunk cache for tile rendering.
+Tiles are baked into off-screen chunk surfaces once, so every frame only
+needs a few chunk blits instead of one blit per tile. Tiles come from one
+texture atlas and a whole chunk is drawn with a single Surface.blits call.
+Translucent tiles (like muck) aren't baked, they are blitted onto the screen
+in their place between chunk layers, so they blend exactly like direct blits.
+
+Usage: python -m data.tile_cache [level.json]   (compares atlas with separate tile surfaces)
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import pygame
+from collections import OrderedDict
+
+try:
+    import world_data
+    from atlas import TextureAtlas
+    from draw_list import DrawList, get_tile_coverage
+    from debug import profiler
+except ImportError:
+    import data.world_data as world_data
+    from data.atlas import TextureAtlas
+    from data.draw_list import DrawList, get_tile_coverage
+    from data.debug import profiler
+
+
+class ChunkCache(object):
+
+    """
+    Lazily builds chunk surfaces of chunk_size x chunk_size tiles and keeps
+    at most max_chunks of them alive, dropping the least recently used ones.
+    tile_filter(x, y, depth, tileset_id) can limit which tiles are drawn.
+    Caches drawing the same tile map can share one draw_list, caches with the same tilesets one atlas.
+    culled is the number of hidden tiles left out of the chunks drawn by the last render.
+    """
+
+    def __init__(self, tile_map, tilesets, tile_flags, tile_size=20, chunk_size=16, max_chunks=32, tile_filter=None, draw_list=None, atlas=None):
+        self.tile_map = tile_map
+        self.draw_list = draw_list if draw_list != None else DrawList(tile_map, chunk_size, get_tile_coverage(tilesets, tile_flags, tile_size))
+        self.tile_filter = tile_filter
+        self.tilesets = tilesets
+        self.tile_flags = tile_flags
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.chunk_pixels = tile_size * chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.culled = 0
+        self.margin = self.get_margin()
+        self.atlas = atlas if atlas != None else self.build_atlas()
+
+    def get_margin(self):
+
+        """
+        Returns how many cells around a chunk can still draw into it,
+        based on the biggest tile and offset in all tilesets.
+        """
+
+        extent = self.tile_size
+        for tileset_id, tileset in self.tilesets.items():
+            flags, offset_x, offset_y = self.tile_flags.get(tileset_id, [[], [], []])
+            for tile, image in enumerate(tileset):
+                offset = 0
+                if tile < len(flags):
+                    offset = max(abs(offset_x[tile]), abs(offset_y[tile]))
+                extent = max(extent, image.get_width() + offset, image.get_height() + offset)
+
+        return extent // self.tile_size + 1
+
+    def is_translucent(self, tileset_id, tile):
+        return self.tilesets[tileset_id][tile].get_alpha() not in (None, 255)
+
+    def get_tile_image(self, tileset_id, tile):
+
+        """
+        Returns tile image converted to per-pixel alpha, colorkey pixels become transparent.
+        Pixels are fully opaque or fully transparent, so blending them into a chunk and the chunk
+        onto the screen gives exactly the pixels of a direct blit.
+        """
+
+        opaque = self.tilesets[tileset_id][tile].copy()
+        opaque.set_alpha(None)
+        baked = pygame.Surface(opaque.get_size(), pygame.SRCALPHA)
+        baked.blit(opaque, (0, 0))
+        return baked
+
+    def build_atlas(self):
+
+        """
+        Packs images of every tile that is baked into chunks (markers included) into a texture atlas,
+        source rects are keyed by (tileset_id, tile).
+        """
+
+        return TextureAtlas({(tileset_id, tile): self.get_tile_image(tileset_id, tile)
+                             for tileset_id, tileset in self.tilesets.items() for tile in range(len(tileset))
+                             if not self.is_translucent(tileset_id, tile)})
+
+    def get_chunk_blits(self, chunk_x, chunk_y):
+
+        """
+        Returns list of (atlas page, position, source rect) of one chunk in depth order,
+        translucent tiles are (tile image, position, None) instead.
+        Tiles of neighbouring cells that reach into the chunk are drawn too, so chunks never overlap.
+        """
+
+        start_x = chunk_x * self.chunk_size - self.margin
+        start_y = chunk_y * self.chunk_size - self.margin
+        cells = self.chunk_size + self.margin * 2
+
+        to_render = self.draw_list.query(start_x, start_y, start_x + cells, start_y + cells)
+
+        origin_x = chunk_x * self.chunk_pixels
+        origin_y = chunk_y * self.chunk_pixels
+        blits = []
+
+        tile_flags = world_data.get_tile_flags(self.tile_flags, self.tile_map.tileset_names)
+        get_source = self.atlas.rects.get
+        tilesets = self.tilesets
+
+        for image in to_render:
+
+            tileset_id = self.tile_map.tileset_names[image[3]]
+            if self.tile_filter != None and self.tile_filter(image[2], image[1], image[0], tileset_id) == False:
+                continue
+
+            flags, offset_x, offset_y = tile_flags[image[3]]
+            tile = image[4]
+
+            if tile < len(flags):
+                if flags[tile] & world_data.INVISIBLE:
+                    continue
+                offset = (offset_x[tile], offset_y[tile])
+            else:
+                offset = (0, 0)
+
+            position = (image[2] * self.tile_size - origin_x + offset[0], image[1] * self.tile_size - origin_y + offset[1])
+            source = get_source((tileset_id, tile))
+            if source == None:
+                blits.append((tilesets[tileset_id][tile], position, None))
+            else:
+                blits.append((source[0], position, source[1]))
+
+        return blits
+
+    def build_chunk(self, chunk_x, chunk_y):
+
+        """
+        Returns chunk as list of (image, position) to be drawn in order, or None for chunks without any visible tile.
+        Every run of opaque tiles is rendered into one chunk surface with a single blits call,
+        translucent tiles between them are kept as they are.
+        """
+
+        blits = self.get_chunk_blits(chunk_x, chunk_y)
+
+        if blits == []:
+            return None
+
+        chunk = []
+        baked = []
+        for source, position, area in blits:
+            if area != None:
+                baked.append((source, position, area))
+                continue
+            if baked != []:
+                chunk.append((self.bake(baked), (0, 0)))
+                baked = []
+            chunk.append((source, position))
+        if baked != []:
+            chunk.append((self.bake(baked), (0, 0)))
+
+        profiler.count("chunks.tiles", len(blits))
+        return chunk
+
+    def count_culled(self, chunk_x, chunk_y):
+
+        """
+        Returns how many hidden tiles of the chunk's own cells (margin left out, so no tile
+        is counted by two chunks) would be drawn without culling.
+        """
+
+        start_x = chunk_x * self.chunk_size
+        start_y = chunk_y * self.chunk_size
+        culled = 0
+
+        for x, y, depth, tileset in self.draw_list.query_hidden(start_x, start_y, start_x + self.chunk_size, start_y + self.chunk_size):
+            if self.tile_filter == None or self.tile_filter(x, y, depth, self.tile_map.tileset_names[tileset]) != False:
+                culled += 1
+
+        return culled
+
+    def bake(self, blits):
+        layer = pygame.Surface((self.chunk_pixels, self.chunk_pixels), pygame.SRCALPHA)
+        layer.blits(blits, False)
+        return layer
+
+    def get_chunk(self, chunk_x, chunk_y):
+
+        """
+        Returns chunk (or None) and number of tiles culled from it, building it when it isn't cached yet.
+        """
+
+        key = (chunk_x, chunk_y)
+
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+
+        start = profiler.begin()
+        chunk = self.build_chunk(chunk_x, chunk_y), self.count_culled(chunk_x, chunk_y)
+        self.chunks[key] = chunk
+        profiler.end("chunks.build", start)
+        profiler.count("chunks.built")
+
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+
+        return chunk
+
+    def invalidate(self, x, y):
+
+        """
+        Drops every chunk that the tile cell x;y can draw into,
+        they get rebuilt next time they are visible.
+        """
+
+        self.draw_list.invalidate(x, y)
+
+        for chunk_y in range((y - self.margin) // self.chunk_size, (y + self.margin) // self.chunk_size + 1):
+            for chunk_x in range((x - self.margin) // self.chunk_size, (x + self.margin) // self.chunk_size + 1):
+                self.chunks.pop((chunk_x, chunk_y), None)
+
+    def invalidate_area(self, x1, y1, x2, y2):
+
+        """
+        Drops every chunk that cells x1 <= x < x2, y1 <= y < y2 can draw into.
+        """
+
+        self.draw_list.invalidate_area(x1, y1, x2, y2)
+
+        for chunk_y in range((y1 - self.margin) // self.chunk_size, (y2 - 1 + self.margin) // self.chunk_size + 1):
+            for chunk_x in range((x1 - self.margin) // self.chunk_size, (x2 - 1 + self.margin) // self.chunk_size + 1):
+                self.chunks.pop((chunk_x, chunk_y), None)
+
+    def clear(self):
+        self.chunks.clear()
+
+    def render(self, surface, camera_offset):
+
+        """
+        Blits all chunks that are within screen borders. Drawing is clipped to the chunk,
+        as translucent tiles near its edge are part of neighbouring chunks too.
+        """
+
+        clip = surface.get_clip()
+        culled = 0
+
+        first_x = camera_offset[0] // self.chunk_pixels
+        first_y = camera_offset[1] // self.chunk_pixels
+        last_x = (camera_offset[0] + surface.get_width()) // self.chunk_pixels
+        last_y = (camera_offset[1] + surface.get_height()) // self.chunk_pixels
+
+        for chunk_y in range(first_y, last_y + 1):
+            for chunk_x in range(first_x, last_x + 1):
+
+                chunk, chunk_culled = self.get_chunk(chunk_x, chunk_y)
+                culled += chunk_culled
+                if chunk != None:
+                    profiler.count("chunks.blits", len(chunk))
+                    x = chunk_x * self.chunk_pixels - camera_offset[0]
+                    y = chunk_y * self.chunk_pixels - camera_offset[1]
+                    surface.set_clip(clip.clip((x, y, self.chunk_pixels, self.chunk_pixels)))
+                    surface.blits([(image, (x + position[0], y + position[1])) for image, position in chunk], False)
+
+        surface.set_clip(clip)
+        self.culled = culled
+        profiler.count("tiles.culled", culled)
+
+
+if __name__ == "__main__":
+
+    import os
+    import sys
+    import time
+
+    # Builds every chunk of a level from the atlas and from separate tile surfaces (how it was
+    # done before), checks both give the same pixels and reports memory and blit throughput
+    main_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    sys.path.insert(0, main_path)
+
+    import data.level_compiler as level_compiler
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    tilesets = world_data.load_tilesets(f"{main_path}/data/images/tilesets/")
+    tile_flags = world_data.compile_tileset_data(world_data.load_tileset_data(f"{main_path}/data/images/tilesets/"), tilesets)
+    tile_map = level_compiler.load_level(f"{main_path}/data/{sys.argv[1] if len(sys.argv) > 1 else 'save1.json'}")[0]
+
+    start = time.perf_counter()
+    cache = ChunkCache(tile_map, tilesets, tile_flags)
+    atlas_time = time.perf_counter() - start
+
+    separate = {key: cache.get_tile_image(*key) for key in cache.atlas.rects}
+    sources = {(id(page), tuple(area)): separate[key] for key, (page, area) in cache.atlas.rects.items()}
+
+    chunk_keys = [(chunk_x, chunk_y)
+                  for chunk_y in range(tile_map.min_y // cache.chunk_size - 1, (tile_map.min_y + tile_map.height) // cache.chunk_size + 1)
+                  for chunk_x in range(tile_map.min_x // cache.chunk_size - 1, (tile_map.min_x + tile_map.width) // cache.chunk_size + 1)]
+    chunk_blits = [cache.get_chunk_blits(*key) for key in chunk_keys]
+    tiles = sum(len(blits) for blits in chunk_blits)
+    rounds = 20
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        for blits in chunk_blits:
+            chunk = pygame.Surface((cache.chunk_pixels, cache.chunk_pixels), pygame.SRCALPHA)
+            for page, position, area in blits:
+                chunk.blit(sources[(id(page), tuple(area))] if area != None else page, position)
+    separate_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        for blits in chunk_blits:
+            chunk = pygame.Surface((cache.chunk_pixels, cache.chunk_pixels), pygame.SRCALPHA)
+            chunk.blits(blits, False)
+    batched_time = (time.perf_counter() - start) / rounds
+
+    for blits in chunk_blits:
+        old_chunk = pygame.Surface((cache.chunk_pixels, cache.chunk_pixels), pygame.SRCALPHA)
+        for page, position, area in blits:
+            old_chunk.blit(sources[(id(page), tuple(area))] if area != None else page, position)
+        new_chunk = pygame.Surface((cache.chunk_pixels, cache.chunk_pixels), pygame.SRCALPHA)
+        new_chunk.blits(blits, False)
+        if pygame.image.tobytes(old_chunk, "RGBA") != pygame.image.tobytes(new_chunk, "RGBA"):
+            raise SystemExit("atlas chunks differ from chunks drawn from separate tile surfaces")
+
+    separate_bytes = sum(image.get_width() * image.get_height() * image.get_bytesize() for image in separate.values())
+    print(f"{len(separate)} tiles, {len(chunk_keys)} chunks, {tiles} tile blits, atlas built in {atlas_time * 1000:.1f} ms")
+    print(f"separate surfaces: {len(separate):5} surfaces {separate_bytes / 1024:8.1f} KiB  {separate_time * 1000:7.2f} ms  {tiles / separate_time / 1e6:6.2f} M blits/s")
+    print(f"atlas pages:       {len(cache.atlas.pages):5} surfaces {cache.atlas.nbytes() / 1024:8.1f} KiB  {batched_time * 1000:7.2f} ms  {tiles / batched_time / 1e6:6.2f} M blits/s")
+    pygame.quit()
@@ -0,0 +1,271 @@
+"""
+Compact tile map, replacing the "x;y" string keyed dict from level files.
+Tiles are stored in flat arrays indexed by integer cell coordinates.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+from array import array
+
+
+EMPTY = -1
+
+
+class TileMap(object):
+
+    """
+    Stores up to `layers` tiles per cell, sorted by depth.
+    Tileset names are kept in sorted order, so sorting by tileset index
+    gives the same result as sorting by tileset name.
+    """
+
+    def __init__(self, min_x, min_y, width, height, layers=1, tileset_names=()):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        self.layers = max(layers, 1)
+        self.tileset_names = sorted(set(tileset_names))
+        self.tileset_ids = {name: i for i, name in enumerate(self.tileset_names)}
+
+        slots = self.width * self.height * self.layers
+        self.counts = array('B', bytes(self.width * self.height))
+        self.depths = array('h', [0]) * slots
+        self.tilesets = array('h', [EMPTY]) * slots
+        self.tiles = array('h', [EMPTY]) * slots
+
+    @classmethod
+    def from_dict(cls, tile_map):
+
+        """
+        Builds tile map from the dict saved by level editor.
+        """
+
+        cells = [cell for pos, cell in tile_map.items() if pos != ""]
+
+        if cells == []:
+            return cls(0, 0, 0, 0)
+
+        xs = [cell["pos"][0] for cell in cells]
+        ys = [cell["pos"][1] for cell in cells]
+        layers = max(len(cell["tiles"]) for cell in cells)
+        names = [tile["tileset"] for cell in cells for tile in cell["tiles"]]
+
+        new_map = cls(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1, layers, names)
+
+        for cell in cells:
+            for tile in cell["tiles"]:
+                new_map.add_tile(cell["pos"][0], cell["pos"][1], tile["depth"], tile["tileset"], tile["tile"])
+
+        return new_map
+
+    def to_dict(self):
+
+        """
+        Returns tile map in the same format level editor saves.
+        """
+
+        tile_map = {}
+
+        for x, y in self.cells():
+            tile_map[f"{x};{y}"] = {
+                "pos": [x, y],
+                "tiles": [{"depth": depth, "tileset": self.tileset_names[tileset], "tile": tile}
+                          for depth, tileset, tile in self.get_tiles(x, y)]
+            }
+
+        return tile_map
+
+    def get_region(self, x, y, width, height):
+
+        """
+        Returns new tile map with tiles of cells x <= cell x < x + width (and same for y),
+        using the same tileset indexes as this map.
+        """
+
+        tiles = self.query(x, y, x + width, y + height)
+
+        layers = 1
+        if tiles != []:
+            layers = max(self.counts[self.cell_index(tile[2], tile[1])] for tile in tiles)
+
+        region = TileMap(x, y, width, height, layers, self.tileset_names)
+
+        for depth, cell_y, cell_x, tileset, tile in tiles:
+            cell = region.cell_index(cell_x, cell_y)
+            slot = cell * layers + region.counts[cell]
+            region.depths[slot] = depth
+            region.tilesets[slot] = tileset
+            region.tiles[slot] = tile
+            region.counts[cell] += 1
+
+        return region
+
+    def is_ready(self, x, y):
+
+        """
+        Tells whether tiles of the cell are known, always true unless map is streamed.
+        """
+
+        return True
+
+    def get_pending_areas(self):
+        return []
+
+    def in_bounds(self, x, y):
+        return self.min_x <= x < self.min_x + self.width and self.min_y <= y < self.min_y + self.height
+
+    def cell_index(self, x, y):
+        return (y - self.min_y) * self.width + x - self.min_x
+
+    def cells(self):
+
+        """
+        Yields positions of all cells that have at least one tile.
+        """
+
+        for i, count in enumerate(self.counts):
+            if count:
+                yield self.min_x + i % self.width, self.min_y + i // self.width
+
+    def get_tiles(self, x, y):
+
+        """
+        Returns list of [depth, tileset index, tile] in one cell.
+        """
+
+        if not self.in_bounds(x, y):
+            return []
+
+        cell = self.cell_index(x, y)
+        start = cell * self.layers
+        return [[self.depths[slot], self.tilesets[slot], self.tiles[slot]]
+                for slot in range(start, start + self.counts[cell])]
+
+    def query(self, x1, y1, x2, y2):
+
+        """
+        Returns all tiles in cells x1 <= x < x2, y1 <= y < y2
+        as [depth, y, x, tileset index, tile] lists.
+        """
+
+        result = []
+
+        x1 = max(x1, self.min_x)
+        y1 = max(y1, self.min_y)
+        x2 = min(x2, self.min_x + self.width)
+        y2 = min(y2, self.min_y + self.height)
+
+        counts = self.counts
+        depths = self.depths
+        tilesets = self.tilesets
+        tiles = self.tiles
+        layers = self.layers
+
+        for y in range(y1, y2):
+            row = (y - self.min_y) * self.width - self.min_x
+            for x in range(x1, x2):
+                cell = row + x
+                count = counts[cell]
+                if count:
+                    start = cell * layers
+                    for slot in range(start, start + count):
+                        result.append([depths[slot], y, x, tilesets[slot], tiles[slot]])
+
+        return result
+
+    def get_tileset_id(self, name):
+
+        """
+        Returns index of tileset name, adding it when it isn't known yet.
+        """
+
+        if name not in self.tileset_ids:
+            names = sorted(self.tileset_names + [name])
+            remap = array('h', [names.index(old) for old in self.tileset_names])
+            for slot, tileset in enumerate(self.tilesets):
+                if tileset != EMPTY:
+                    self.tilesets[slot] = remap[tileset]
+            self.tileset_names = names
+            self.tileset_ids = {name: i for i, name in enumerate(names)}
+
+        return self.tileset_ids[name]
+
+    def resize(self, x, y, layers):
+
+        """
+        Grows the map so it contains cell x;y with at least `layers` slots per cell.
+        """
+
+        if self.width and self.height:
+            min_x = min(self.min_x, x)
+            min_y = min(self.min_y, y)
+            max_x = max(self.min_x + self.width - 1, x)
+            max_y = max(self.min_y + self.height - 1, y)
+        else:
+            min_x, min_y, max_x, max_y = x, y, x, y
+
+        new_map = TileMap(min_x, min_y, max_x - min_x + 1, max_y - min_y + 1, max(layers, self.layers))
+        new_map.tileset_names = self.tileset_names
+        new_map.tileset_ids = self.tileset_ids
+
+        for cell_x, cell_y in self.cells():
+            cell = new_map.cell_index(cell_x, cell_y)
+            tiles = self.get_tiles(cell_x, cell_y)
+            new_map.counts[cell] = len(tiles)
+            for i, (depth, tileset, tile) in enumerate(tiles):
+                slot = cell * new_map.layers + i
+                new_map.depths[slot] = depth
+                new_map.tilesets[slot] = tileset
+                new_map.tiles[slot] = tile
+
+        self.__dict__.update(new_map.__dict__)
+
+    def add_tile(self, x, y, depth, tileset, tile):
+
+        """
+        Adds tile to cell, keeping tiles of the cell sorted by depth.
+        """
+
+        tileset = self.get_tileset_id(tileset)
+
+        count = self.counts[self.cell_index(x, y)] if self.in_bounds(x, y) else 0
+        if not self.in_bounds(x, y) or count >= self.layers:
+            self.resize(x, y, count + 1)
+
+        cell = self.cell_index(x, y)
+        start = cell * self.layers
+        slot = start + self.counts[cell]
+
+        while slot > start and self.depths[slot - 1] > depth:
+            self.depths[slot] = self.depths[slot - 1]
+            self.tilesets[slot] = self.tilesets[slot - 1]
+            self.tiles[slot] = self.tiles[slot - 1]
+            slot -= 1
+
+        self.depths[slot] = depth
+        self.tilesets[slot] = tileset
+        self.tiles[slot] = tile
+        self.counts[cell] += 1
+
+    def clear_cell(self, x, y):
+
+        """
+        Removes all tiles from one cell.
+        """
+
+        if self.in_bounds(x, y):
+            cell = self.cell_index(x, y)
+            for slot in range(cell * self.layers, cell * self.layers + self.counts[cell]):
+                self.tilesets[slot] = EMPTY
+                self.tiles[slot] = EMPTY
+                self.depths[slot] = 0
+            self.counts[cell] = 0
+
+    def nbytes(self):
+
+        """
+        Returns memory used by tile arrays in bytes.
+        """
+
+        return sum(data.itemsize * len(data) for data in (self.counts, self.depths, self.tilesets, self.tiles))
@@ -0,0 +1,412 @@
+"""
+Game simulation without any drawing.
+World.step advances the game by one fixed tick, so it can run headless
+(SDL dummy video driver, or no images at all) much faster than real time.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+try:
+    import entities
+    import world_data
+    import level_compiler
+    import enemies
+    from collision import CollisionGrid
+    from spatial_hash import SpatialHash
+except ImportError:
+    import data.entities as entities
+    import data.world_data as world_data
+    import data.level_compiler as level_compiler
+    import data.enemies as enemies
+    from data.collision import CollisionGrid
+    from data.spatial_hash import SpatialHash
+
+
+# Movement constants (per tick) -----------------------------------------------------------------------------
+TIMESTEP = 1 / 60
+MAX_STEPS = 5
+
+TILE_SIZE = 20
+SPEED = 4
+JUMPS = 2
+JUMP_MOMENTUM = -6
+GRAVITY = 0.45
+MAX_FALL = 7
+FRICTION = 0.25
+SPIN_TICKS = 15
+SPIN_SPEED = 24
+ENEMY_SPEED = 1
+
+# Spatial hash layers ---------------------------------------------------------------------------------------
+PLAYER_LAYER = 1
+
+ACTIONS = ("right", "left", "jump")
+
+
+def normalize(num, amount):
+
+    """
+    Normalizes value to certain fixed amount.
+    """
+
+
+    if num > amount:
+        num -= amount
+    elif num < -amount:
+        num += amount
+    else:
+        num = 0
+    return num
+
+
+def lerp(start, end, alpha):
+    return start + (end - start) * alpha
+
+
+def load_world(main_path, world_save, view_size=(480, 270)):
+
+    """
+    Loads level into a World for headless simulation, no images are loaded.
+    world_save is a level file name in data/, like "save1.json".
+    """
+
+    tileset_data = world_data.load_tileset_data(f"{main_path}/data/images/tilesets/")
+    tile_flags = world_data.compile_tileset_data(tileset_data, {})
+    ramp_heights = world_data.compile_ramp_heights(tileset_data, TILE_SIZE)
+    tile_map, spawn, borders, finish = level_compiler.load_level(f"{main_path}/data/{world_save}")
+
+    return World(tile_map, spawn, borders, finish, tile_flags, view_size, ramp_heights=ramp_heights)
+
+
+class World(object):
+
+    """
+    Holds player, camera and level state. Inputs are lists of (action, pressed)
+    pairs, where action is one of ACTIONS, like key down/up events.
+    Sprites (dict of idle, run, jump, spin) and effects are optional,
+    without them the world only simulates physics.
+    Enemies are spawned from enemy markers of the level when numpy is available,
+    enemy_sizes lists box size of every enemy type (tile sized by default).
+    ramp_heights come from world_data.compile_ramp_heights, only built-in ramp types are known without them.
+    """
+
+    def __init__(self, tile_map, spawn, borders, finish, tile_flags, view_size=(480, 270), sprites=None, effects=None, enemy_sizes=None, ramp_heights=None):
+        self.tile_map = tile_map
+        self.spawn = spawn
+        self.borders = borders
+        self.finish = finish
+        self.collision_grid = CollisionGrid(tile_map, tile_flags, TILE_SIZE, ramp_heights)
+        self.view_size = view_size
+        self.effects = effects
+
+        if sprites == None:
+            sprites = {"idle": None, "run": None, "jump": None, "spin": None}
+        self.sprites = sprites
+
+        self.player = entities.entity(*self.get_spawn_pos(), 12, 15)
+        self.player.obj.setup_hitbox(4, 10, 7, 7)
+        self.player.set_animation(sprites["idle"])
+        self.player.set_animation_tags(['loop'])
+        self.player.set_image(sprites["jump"])
+
+        self.finish_entity = entities.entity(finish[0] * TILE_SIZE + 1, finish[1] * TILE_SIZE - 6, 20, 20)
+
+        # overlaps between player and triggers like the finish
+        self.spatial_hash = SpatialHash(TILE_SIZE * 4)
+        self.spatial_hash.insert("player", self.player.obj.rect, PLAYER_LAYER)
+        self.spatial_hash.add_trigger("finish", self.finish_entity.obj.rect, PLAYER_LAYER, self.reach_finish)
+
+        self.enemies = None
+        if enemies.numpy != None:
+            self.enemies = enemies.EnemyStore(speed=ENEMY_SPEED, gravity=GRAVITY, max_fall=MAX_FALL, friction=FRICTION)
+            for x, y, kind in world_data.get_enemy_spawns(tile_map):
+                width, height = (TILE_SIZE, TILE_SIZE) if enemy_sizes == None else enemy_sizes[kind]
+                self.enemies.spawn(x * TILE_SIZE + (TILE_SIZE - width) // 2, (y + 1) * TILE_SIZE - height, width, height, kind)
+
+        self.player_movement = [0, 0]
+        self.player_momentum = [0, 0]
+        self.player_collisions = None
+        self.jumps = JUMPS
+        self.air_time = 0
+        self.spin_timer = 0
+
+        self.right = False
+        self.left = False
+        self.dead = False
+        self.paused = False
+
+        self.ticks = 0
+        self.finishes = 0
+        self.accumulator = 0
+        self.alpha = 0
+        self.pending_inputs = []
+
+        self.camera_offset = list(self.get_camera_target())
+        self.previous_camera_offset = list(self.camera_offset)
+        self.previous_player_pos = [self.player.x, self.player.y]
+
+    def get_spawn_pos(self):
+        return self.spawn[0] * TILE_SIZE + 2, self.spawn[1] * TILE_SIZE - 7
+
+    def get_camera_target(self):
+
+        """
+        Returns camera position centered on player, kept inside level borders.
+        """
+
+        target_x = self.player.x - int(self.view_size[0] / 2) + 7
+        target_y = self.player.y - int(self.view_size[1] / 2) + 14
+
+        if target_x < self.borders[0]: # handle left border
+            target_x = self.borders[0]
+
+        if target_x + self.view_size[0] > self.borders[2]: # handle right border
+            target_x = self.borders[2] - self.view_size[0]
+
+        if target_y + self.view_size[1] > self.borders[1]: # handle bottom border
+            target_y = self.borders[1] - self.view_size[1]
+
+        return target_x, target_y
+
+    def spawn_effect(self, animation_id, flip=False):
+        if self.effects != None:
+            self.effects.spawn(self.player.x + 8, self.player.y + 2, animation_id, flip)
+
+    def handle_input(self, action, pressed):
+
+        """
+        Applies one key down/up event.
+        """
+
+        player = self.player
+
+        if action == "right":
+            if pressed:
+                self.spawn_effect('turn')
+            self.right = pressed
+
+        elif action == "left":
+            if pressed:
+                self.spawn_effect('turn', True)
+            self.left = pressed
+
+        elif action == "jump" and pressed:
+            if self.dead == False:
+                if self.jumps > 0:
+                    self.spawn_effect('jump')
+                    self.jumps -= 1
+                    self.player_momentum[1] = JUMP_MOMENTUM
+                    if self.jumps == 0:
+                        player.image = self.sprites["spin"]
+                        if player.flip == True:
+                            self.spin_timer = -SPIN_TICKS
+                        else:
+                            self.spin_timer = SPIN_TICKS
+
+    def advance(self, elapsed, inputs=()):
+
+        """
+        Adds real elapsed time (seconds) to accumulator and runs as many fixed
+        steps as fit into it. Inputs are applied on the next step that runs.
+        Returns number of steps, interpolation factor is stored in self.alpha.
+        """
+
+        self.pending_inputs.extend(inputs)
+        self.accumulator += elapsed
+
+        steps = 0
+        while self.accumulator >= TIMESTEP and steps < MAX_STEPS:
+            self.step(self.pending_inputs)
+            self.pending_inputs = []
+            self.accumulator -= TIMESTEP
+            steps += 1
+
+        if steps == MAX_STEPS: # too slow to keep up, drop the time instead of spiraling
+            self.accumulator = min(self.accumulator, TIMESTEP)
+
+        self.alpha = self.accumulator / TIMESTEP
+        return steps
+
+    def step(self, inputs=()):
+
+        """
+        Advances the game by one tick.
+        """
+
+        player = self.player
+
+        self.previous_camera_offset = list(self.camera_offset)
+        self.previous_player_pos = [player.x, player.y]
+
+        if self.effects != None:
+            self.effects.update(1)
+
+        for action, pressed in inputs:
+            self.handle_input(action, pressed)
+
+
+        # Move camera based on player position
+        target_x, target_y = self.get_camera_target()
+
+        if self.dead == False:
+            self.camera_offset[0] += (target_x - self.camera_offset[0]) / 13
+            self.camera_offset[1] += (target_y - self.camera_offset[1]) / 13
+
+
+        # Update player position
+        player_movement = [0, 0]
+        player_movement[0] += self.player_momentum[0]
+        player_movement[1] += self.player_momentum[1]
+
+        if self.dead == False:
+            self.player_momentum[0] = normalize(self.player_momentum[0], FRICTION)
+
+        if self.dead == False:
+            if abs(self.player_momentum[0]) < SPEED:
+                if self.right == True:
+                    player_movement[0] += SPEED
+                if self.left == True:
+                    player_movement[0] -= SPEED
+
+        self.player_momentum[1] += GRAVITY
+        if self.player_momentum[1] > MAX_FALL:
+            self.player_momentum[1] = MAX_FALL
+
+        self.player_movement = player_movement
+
+
+        # Handle collisions
+        if self.paused == False:
+
+            if self.dead == False:
+                self.player_collisions = player.move(player_movement, self.collision_grid)
+            else:
+                self.player_collisions = player.move(player_movement)
+
+            if self.player_collisions['bottom'] == True:
+                self.jumps = JUMPS
+                self.player_momentum[1] = 0
+                self.air_time = 0
+                player.rotation = 0
+
+            elif self.player_collisions['slant_bottom'] == True:
+                self.jumps = JUMPS
+                self.air_time = 0
+                player.rotation = 0
+
+            else:
+                self.air_time += 1
+
+            if self.enemies != None:
+                self.enemies.step(self.collision_grid)
+
+
+        # Handle current player image
+        if player_movement[0] != 0:
+            player.animation = self.sprites["run"]
+        else:
+            player.animation = self.sprites["idle"]
+
+        if self.air_time > 6:
+            player.animation = None
+
+        if player_movement[0] < 0:
+            player.flip = True
+        elif player_movement[0] > 0:
+            player.flip = False
+
+        if self.spin_timer > 0:
+            self.spin_timer -= 1
+            player.rotation -= SPIN_SPEED
+
+        elif self.spin_timer < 0:
+            self.spin_timer += 1
+            player.rotation += SPIN_SPEED
+        else:
+            player.image = self.sprites["jump"]
+
+        player.change_frame(1)
+
+        if self.dead == True:
+            player.rotation -= SPIN_SPEED
+
+
+        # Handle border collision
+        if player.y > self.borders[1]:
+            if self.dead == False:
+                self.dead = True
+                self.player_momentum = [3, -8]
+
+        if player.x < self.borders[0]:
+            player.set_pos(self.borders[0], player.y)
+
+        if player.x + 15 > self.borders[2]:
+            player.set_pos(self.borders[2] - 15, player.y)
+
+
+        # Triggers
+        self.spatial_hash.update("player", player.obj.rect)
+        self.spatial_hash.update_triggers()
+
+        self.ticks += 1
+
+    def reach_finish(self, trigger, key):
+
+        """
+        Reaching finish puts player back to spawn.
+        """
+
+        player = self.player
+        self.finishes += 1
+        player.set_pos(*self.get_spawn_pos())
+        self.player_momentum = [0, 0]
+        self.previous_player_pos = [player.x, player.y]
+        self.spatial_hash.update("player", player.obj.rect)
+
+    def save_state(self):
+
+        """
+        Returns copy of player state, restore_state puts the world back into it,
+        so different inputs can be tried from the same moment. Enemies aren't included.
+        """
+
+        player = self.player
+        return (player.x, player.y, player.rotation, player.flip, player.image, player.animation, player.animation_frame,
+                list(self.player_momentum), self.jumps, self.air_time, self.spin_timer,
+                self.right, self.left, self.dead, self.ticks, self.finishes, self.spatial_hash.save_triggers())
+
+    def restore_state(self, state):
+        player = self.player
+        (x, y, player.rotation, player.flip, player.image, player.animation, player.animation_frame,
+         momentum, self.jumps, self.air_time, self.spin_timer,
+         self.right, self.left, self.dead, self.ticks, self.finishes, triggers) = state
+
+        player.set_pos(x, y)
+        player.obj.rect.x = int(x)
+        player.obj.rect.y = int(y)
+        self.player_momentum = list(momentum)
+        self.previous_player_pos = [x, y]
+        self.spatial_hash.update("player", player.obj.rect)
+        self.spatial_hash.restore_triggers(triggers)
+
+    def get_camera_offset(self, alpha=None):
+
+        """
+        Returns camera position interpolated between last two ticks, as ints.
+        """
+
+        if alpha == None:
+            alpha = self.alpha
+        return [int(lerp(self.previous_camera_offset[0], self.camera_offset[0], alpha)),
+                int(lerp(self.previous_camera_offset[1], self.camera_offset[1], alpha))]
+
+    def get_player_pos(self, alpha=None):
+
+        """
+        Returns player position interpolated between last two ticks.
+        """
+
+        if alpha == None:
+            alpha = self.alpha
+        return [lerp(self.previous_player_pos[0], self.player.x, alpha),
+                lerp(self.previous_player_pos[1], self.player.y, alpha)]
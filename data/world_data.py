@@ -3,23 +3,39 @@ import pygame
 from pygame.locals import *
 import os
 import json
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 try:
     import global_functions as functions
+    import asset_cache
+    from tile_map import TileMap
 except ImportError:
     import data.global_functions as functions
+    import data.asset_cache as asset_cache
+    from data.tile_map import TileMap
 
-def load_tileset(path):
+
+# Compiled tile attribute flags -----------------------------------------------------------------------------
+NO_COLLIDE = 1
+INVISIBLE = 2
+RAMP_SHIFT = 2
+
+
+def find_tiles_scan(tileset_image):
 
     """
-    Function that gets tiles from one tileset image, 
+    Finds tile rects in tileset image pixel by pixel, 
     based on corner pixel colors
     top left is purple while top right and bottom left are cyan
     """
 
 
-    tileset_image = functions.load_image(path)
-    tileset = []
+    tiles = []
     
     for y in range(tileset_image.get_height()):
         for x in range(tileset_image.get_width()):
@@ -42,44 +58,141 @@ def load_tileset(path):
                         tile_pos[3] = current_y - tile_pos[1]
                     current_y += 1
                 
-                tileset.append(functions.clip(
-                    tileset_image, tile_pos[0], tile_pos[1], tile_pos[2], tile_pos[3]
-                ))
+                tiles.append(tile_pos)
 
-    return tileset
+    return tiles
 
 
-def load_tilesets(path):
+def find_tiles(tileset_image):
 
     """
-    Load all tilesets from certain folder.
+    Same as find_tiles_scan, but works on numpy view of the image.
+    Marker pixels are found at once and for every pixel the nearest cyan pixel
+    to the right and below is precomputed, so each tile is one array lookup.
+    Tiles are returned in the same order as find_tiles_scan returns them.
     """
 
+    if numpy == None:
+        return find_tiles_scan(tileset_image)
 
-    tilesets = {}
-    tileset_images = os.listdir(path)
+    pixels = pygame.surfarray.array3d(tileset_image)
+    red = pixels[:, :, 0]
+    green = pixels[:, :, 1]
+    blue = pixels[:, :, 2]
 
-    for image_path in tileset_images: 
+    # surfarray is indexed [x, y], transpose so argwhere walks rows like the scan does
+    purple = ((red == 255) & (green == 0) & (blue == 255)).T
+    cyan = ((red == 0) & (green == 255) & (blue == 255)).T
 
-        if image_path[-4:] == ".png": # List through all tileset images ------------------------------------
-            
-            image_id = image_path[:-4]
+    height, width = cyan.shape
+    missing = numpy.iinfo(numpy.int32).max
+
+    # nearest cyan at or after each pixel, to the right in rows and downwards in columns
+    columns = numpy.where(cyan, numpy.arange(width, dtype=numpy.int32)[None, :], missing)
+    next_right = numpy.minimum.accumulate(columns[:, ::-1], axis=1)[:, ::-1]
+    rows = numpy.where(cyan, numpy.arange(height, dtype=numpy.int32)[:, None], missing)
+    next_down = numpy.minimum.accumulate(rows[::-1, :], axis=0)[::-1, :]
+
+    tiles = []
+
+    for y, x in numpy.argwhere(purple):
+        end_x = next_right[y, x]
+        end_y = next_down[y, x]
+        if end_x == missing or end_y == missing:
+            raise ValueError(f"tile marker at {x};{y} has no cyan end marker")
+        tiles.append([int(x) + 1, int(y) + 1, int(end_x - x) - 1, int(end_y - y) - 1])
 
-            if image_path[:8] == "tileset_":
-                tilesets[image_id] = load_tileset(path + image_path)
+    return tiles
 
-                if image_id == 'tileset_muck':
-                    for image in tilesets[image_id]:
-                        image.set_alpha(190)
 
-            else:
-                image = pygame.image.load(path + image_path)
-                image.set_colorkey((255,255,255))
-                tilesets[image_id] = [image.copy()]
+def decode_tileset(path):
+
+    """
+    Decodes tileset image and slices it into tiles, based on corner pixel colors
+    top left is purple while top right and bottom left are cyan.
+    Tiles aren't converted, so it can run on loader threads.
+    """
+
+    tileset_image = pygame.image.load(path)
+    return [functions.clip(tileset_image, *tile_pos) for tile_pos in find_tiles(tileset_image)]
+
+
+def load_tileset(path):
+
+    """
+    Function that gets tiles from one tileset image, 
+    based on corner pixel colors
+    top left is purple while top right and bottom left are cyan
+    """
+
+
+    return functions.convert_images(decode_tileset(path))
+
+
+def get_tileset_job(path):
+
+    """
+    Returns (cache key, decode) for tileset or single image marker (like spawn or finish),
+    decode returns unconverted images, data and source paths like asset cache build.
+    """
+
+    if os.path.basename(path)[:8] == "tileset_":
+        return f"tileset:{path}", lambda: (decode_tileset(path), None, [path])
+
+    return f"image:{path}", lambda: ([pygame.image.load(path)], None, [path])
+
+
+def load_cached_tileset(path):
+
+    """
+    Returns sliced tileset or marker from asset cache, slicing it only when the image changed.
+    """
+
+    key, decode = get_tileset_job(path)
+
+    def build():
+        images, data, sources = decode()
+        return functions.convert_images(images), data, sources
+
+    return asset_cache.get_images(key, build)[0]
+
+
+def get_tileset_files(path):
+
+    """
+    Returns [tileset id, image path] of every tileset image in folder.
+    """
+
+    return [[image_path[:-4], path + image_path] for image_path in os.listdir(path) if image_path[-4:] == ".png"]
+
+
+def finish_tilesets(tilesets):
+
+    """
+    Applies per tileset changes after loading.
+    """
+
+    for image in tilesets.get('tileset_muck', []):
+        image.set_alpha(190)
 
     return tilesets
 
 
+def load_tilesets(path):
+
+    """
+    Load all tilesets from certain folder.
+    """
+
+
+    tilesets = {}
+
+    for image_id, image_path in get_tileset_files(path):
+        tilesets[image_id] = load_cached_tileset(image_path)
+
+    return finish_tilesets(tilesets)
+
+
 def load_tileset_data(path):
 
     """
@@ -94,29 +207,116 @@ def load_tileset_data(path):
     f.close()
     lines = data.split('\n')
 
-    for line in lines:
+    for line_number, line in enumerate(lines, 1):
 
-        if line != "":
+        if line.strip() != "":
 
-            sections = line.split("=")
-            name_data = sections[0].split(":")
-            changes = sections[1].split(";")
-            
-            change_list = {}
-            for change in changes:
-                change_data = change.split(":")
-                if change != "":
-                    change_list[change_data[0]] = int(change_data[1])
+            try:
+                name, changes = line.split("=")
+                tileset, tile = name.split(":")
+                tile = int(tile)
+
+                change_list = {}
+                for change in changes.split(";"):
+                    if change != "":
+                        key, value = change.split(":")
+                        if "," in value: # list of values, like heights of a ramp
+                            change_list[key] = [int(item) for item in value.split(",")]
+                        else:
+                            change_list[key] = int(value)
+
+            except ValueError:
+                raise ValueError(f"{path}tileset_data.txt:{line_number}: expected 'tileset:tile=key:value;...', got {line!r}")
             
-            if name_data[0] not in tileset_data:
-                tileset_data[name_data[0]] = {}
+            if tileset not in tileset_data:
+                tileset_data[tileset] = {}
 
-            tileset_data[name_data[0]][int(name_data[1])] = change_list
+            tileset_data[tileset][tile] = change_list
 
 
     return tileset_data
 
 
+def compile_tileset_data(tileset_data, tilesets):
+
+    """
+    Turns tileset data into dense arrays per tileset: [flags, offset_x, offset_y].
+    Flags hold NO_COLLIDE, INVISIBLE and ramp type (flags >> RAMP_SHIFT), 
+    so hot loops only do one indexed read per tile.
+    """
+
+    tile_flags = {}
+
+    for tileset in (set(tileset_data) | set(tilesets)) - {"ramp"}:
+
+        attributes = tileset_data.get(tileset, {})
+        size = max([len(tilesets.get(tileset, []))] + [tile + 1 for tile in attributes])
+
+        flags = array('B', bytes(size))
+        offset_x = array('b', bytes(size))
+        offset_y = array('b', bytes(size))
+
+        for tile, tile_attributes in attributes.items():
+            if 'no_collide' in tile_attributes:
+                flags[tile] |= NO_COLLIDE
+            if 'invisible' in tile_attributes:
+                flags[tile] |= INVISIBLE
+            if 'ramp' in tile_attributes:
+                flags[tile] |= tile_attributes['ramp'] << RAMP_SHIFT
+            offset_x[tile] = tile_attributes.get('offset_x', 0)
+            offset_y[tile] = tile_attributes.get('offset_y', 0)
+
+        tile_flags[tileset] = [flags, offset_x, offset_y]
+
+    return tile_flags
+
+
+def compile_ramp_heights(tileset_data, tile_size=20):
+
+    """
+    Returns height table of every ramp shape, indexed by ramp type of tile attributes.
+    Table holds surface height above bottom of the cell for every pixel column 0..tile_size.
+    Type 1 rises to the right and type 2 falls. Other types are defined in tileset data,
+    straight slopes as ramp:type=left:height;right:height; and any other shape (curves, steps)
+    as ramp:type=heights:h0,h1,...; with tile_size + 1 heights in pixels.
+    """
+
+    def straight(left, right):
+        return [left + ((right - left) * column * 2 + tile_size) // (tile_size * 2) for column in range(tile_size + 1)]
+
+    shapes = {1: straight(0, tile_size), 2: straight(tile_size, 0)}
+    for ramp, attributes in tileset_data.get("ramp", {}).items():
+        if "heights" in attributes:
+            heights = attributes["heights"]
+            if not isinstance(heights, list) or len(heights) != tile_size + 1:
+                raise ValueError(f"ramp:{ramp} needs {tile_size + 1} heights, one for every pixel column 0..{tile_size}")
+            shapes[ramp] = heights
+        else:
+            shapes[ramp] = straight(attributes.get("left", 0), attributes.get("right", 0))
+
+    for tileset, attributes in tileset_data.items():
+        for tile, tile_attributes in attributes.items():
+            if tileset != "ramp" and 'ramp' in tile_attributes and tile_attributes['ramp'] not in shapes:
+                raise ValueError(f"{tileset}:{tile} uses ramp type {tile_attributes['ramp']} that isn't defined")
+
+    ramp_heights = [array('h', bytes(2 * (tile_size + 1))) for ramp in range(max(shapes) + 1)]
+    for ramp, heights in shapes.items():
+        ramp_heights[ramp] = array('h', heights)
+
+    return ramp_heights
+
+
+def get_tile_flags(tile_flags, tileset_names):
+
+    """
+    Returns compiled arrays in order of tileset indexes of a tile map,
+    unknown tilesets get empty arrays.
+    """
+
+    empty = [array('B'), array('b'), array('b')]
+    return [tile_flags.get(name, empty) for name in tileset_names]
+
+
 def load_world_data(path, tile_size = 20):
 
     """
@@ -124,27 +324,36 @@ def load_world_data(path, tile_size = 20):
     """
 
     with open(f"{path}") as file:
-        tile_map = json.load(file)
+        tile_map = TileMap.from_dict(json.load(file))
+
+    return get_world_data(tile_map, tile_size)
+
+
+def get_world_data(tile_map, tile_size = 20):
+
+    """
+    Finds spawn, finish and borders of already loaded tile map.
+    """
 
     spawn = [0, 0]
     finish = [0, 0]
     borders = [9999, -9999, -9999]
 
-    for pos, tile_list in tile_map.items():
-        if pos != "":
-            x = tile_list["pos"][0]
-            y = tile_list["pos"][1]
-            for tile_data in tile_list["tiles"]:
-                if tile_data["tileset"] == "spawn":
-                    spawn = [x, y]
-                if tile_data["tileset"] == "finish":
-                    finish = [x, y]
-                if x < borders[0]:
-                    borders[0] = x
-                if x > borders[2]:
-                    borders[2] = x
-                if y > borders[1]:
-                    borders[1] = y
+    spawn_id = tile_map.tileset_ids.get("spawn")
+    finish_id = tile_map.tileset_ids.get("finish")
+
+    for x, y in tile_map.cells():
+        for depth, tileset, tile in tile_map.get_tiles(x, y):
+            if tileset == spawn_id:
+                spawn = [x, y]
+            if tileset == finish_id:
+                finish = [x, y]
+        if x < borders[0]:
+            borders[0] = x
+        if x > borders[2]:
+            borders[2] = x
+        if y > borders[1]:
+            borders[1] = y
 
     n = 0
     for border in borders:
@@ -153,4 +362,17 @@ def load_world_data(path, tile_size = 20):
             borders[n] += tile_size
         n += 1
 
-    return spawn, borders, finish
\ No newline at end of file
+    return spawn, borders, finish
+
+
+def get_enemy_spawns(tile_map):
+
+    """
+    Returns [x, y, enemy type] of every enemy marker (tile of tileset_enemies) in tile map.
+    """
+
+    enemies_id = tile_map.tileset_ids.get("tileset_enemies")
+    if enemies_id == None:
+        return []
+
+    return [[x, y, tile] for depth, y, x, tileset, tile in tile_map.query(tile_map.min_x, tile_map.min_y, tile_map.min_x + tile_map.width, tile_map.min_y + tile_map.height) if tileset == enemies_id]
@@ -10,427 +10,431 @@ import pygame
 import sys 
 import os
 import json
+import time
+import threading
+import tracemalloc
 
 import data.global_functions as functions
 import data.world_data as world_data
 import data.entities as entities
-from data.debug import debug
+import data.level_compiler as level_compiler
+import data.asset_cache as asset_cache
+import data.navigation as navigation
+from data.tile_cache import ChunkCache
+from data.draw_list import DrawList, get_tile_coverage
+from data.world import World, TILE_SIZE
+from data.streaming import StreamedTileMap
+from data.asset_loader import AssetLoader
+from data.effects import EffectManager
+from data.present import Presenter
+from data.render_thread import RenderThread, Snapshot
+from data.parallax import Parallax, ColorLayer, ImageLayer, TileLayer, get_background_tiles
+from data.debug import profiler, ProfilerOverlay
 
 
-def render_tiles(surface, tile_map, tilesets, tileset_dat, camera_offset):
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def render_tiles(surface, chunk_cache, camera_offset):
     
     """
-    Render all tiles that are within screen borders.
+    Render all tiles that are within screen borders, using pre-rendered chunks.
     """
 
-    tile_size = 20
-
-    to_render = []
-    render_box = [int(surface.get_width() / tile_size) + 5, int(surface.get_height() / tile_size) + 6]
-
-    for y in range(render_box[1]):
-            y += int(camera_offset[1] / tile_size) - 4
+    chunk_cache.render(surface, camera_offset)
 
-            for x in range(render_box[0]):
-                x += int(camera_offset[0] / tile_size) - 4
 
-                pos = f"{x};{y}"
+def render_background(surface, camera_offset, background):
 
-                if pos in tile_map:
-                    for tile in tile_map[pos]["tiles"]:
-                        to_render.append([tile["depth"], tile_map[pos]["pos"][1], tile_map[pos]["pos"][0], tile["tileset"], tile["tile"]])
-
-    to_render.sort()
+    """
+    Draws sky, repeating background image and background tiles, each layer with its own parallax.
+    """
 
-    for image in to_render:
-        
-        offset = [0,0]
-        try:
-            tile_attributes = tileset_dat[image[3]][image[4]]
+    background.render(surface, camera_offset)
 
-        except KeyError:
-            tile_attributes = []
 
-        if 'offset_x' in tile_attributes:
-            offset[0] = tile_attributes['offset_x']
-        if 'offset_y' in tile_attributes:
-            offset[1] = tile_attributes['offset_y']
-        if 'invisible' not in tile_attributes:
+def render_entities(surface, world, camera_offset):
 
-            surface.blit(tilesets[image[3]][image[4]], (image[2] * tile_size - camera_offset[0] + offset[0], image[1] * tile_size - camera_offset[1] + offset[1]))
+    """
+    Draws player at its interpolated position.
+    """
 
-    return to_render
+    world.player.display(surface, camera_offset, world.get_player_pos())
 
 
-def list_to_ints(list_):
+def render_enemies(surface, world, camera_offset, enemy_images):
 
     """
-    Makes all strings in list integers.
+    Draws enemies that are in view, image bottom centered on enemy box.
     """
 
-    new_list = list_.copy()
-    for i in range(len(new_list)):
-        new_list[i] = int(new_list[i])
-    return new_list
+    surface.blits(get_enemy_blits(surface.get_size(), world, camera_offset, enemy_images), False)
 
 
-def normalize(num, amount):
+def get_enemy_blits(view_size, world, camera_offset, enemy_images):
 
     """
-    Normalizes value to certain fixed amount.
+    Returns (image, position) of enemies that are in view.
     """
 
+    enemies = world.enemies
+    if enemies == None or enemy_images == []:
+        return []
 
-    if num > amount:
-        num -= amount
-    elif num < -amount:
-        num += amount
-    else:
-        num = 0
-    return num
+    get_transformed = entities.transform_cache.get
+    to_render = []
 
-animation_database = {}
-class animation_obj(object):
+    for i in enemies.get_visible(camera_offset, view_size).tolist():
+        image = get_transformed(enemy_images[enemies.kind[i]], enemies.direction[i] < 0)
+        to_render.append((image, (int(enemies.x[i]) + (int(enemies.width[i]) - image.get_width()) // 2 - camera_offset[0],
+                                  int(enemies.y[i]) + int(enemies.height[i]) - image.get_height() - camera_offset[1])))
 
-    def __init__(self, x, y, animation_id, flip=False):
-        self.id = animation_id
-        self.timer = 0
-        img = self.get_image()
-        self.x = x - int(img.get_width() / 2)
-        self.y = y - int(img.get_height() / 2)
-        self.flip = flip
+    return to_render
 
-    def get_image(self):
-        global animation_database
 
-        """
-        Returns current image in animation.
-        """
+def render_effects(surface, world, camera_offset):
+    if world.effects != None:
+        world.effects.render(surface, camera_offset)
 
-        if self.id not in animation_database:
 
-            path = f"data/images/animations/{self.id}/"
-            image_list = os.listdir(path)
-            image_list.sort()
+def render_world(surface, game):
 
-            file = open(f"{path}speed.txt")
-            speed = int(file.read())
-            file.close()
-            
-            animation_database[self.id] = [speed, []]
-            for image in image_list:
-                if image[-4:] == '.png':
-                    animation_database[self.id][1].append(functions.load_image(path + image))
+    """
+    Draws world state, interpolated between its last two ticks.
+    """
 
-        animation_data = animation_database[self.id]
-        frame_num = int(self.timer / animation_data[0])
+    world = game["world"]
+    camera_offset = world.get_camera_offset()
 
-        try:
-            return animation_data[1][frame_num]
-        except IndexError:
-            return animation_data[1][0]
+    render_background(surface, camera_offset, game["background"])
+    render_tiles(surface, game["chunk_cache"], camera_offset)
+    render_enemies(surface, world, camera_offset, game["enemy_images"])
+    render_entities(surface, world, camera_offset)
+    render_effects(surface, world, camera_offset)
 
-    def change_frame(self, amount):
 
-        """
-        Changes frame based on time elapsed.
-        """
+def take_snapshot(game, view_size, overlay=None, input_time=0):
 
-        self.timer += amount
+    """
+    Returns immutable snapshot of everything render_snapshot needs from the world,
+    so the world can keep changing while the snapshot is drawn on render thread.
+    """
 
-        if self.timer >= len(animation_database[self.id][1]) * animation_database[self.id][0]:
-            return "delete"
-        else:
-            return None
+    world = game["world"]
+    camera_offset = world.get_camera_offset()
 
-    def render(self, surface,offset):
+    sprites = get_enemy_blits(view_size, world, camera_offset, game["enemy_images"])
+    sprites.append(world.player.get_blit(camera_offset, world.get_player_pos()))
+    if world.effects != None:
+        sprites += world.effects.get_blits(camera_offset)
 
-        """
-        Renders properly fliped image on position. 
-        """
+    return Snapshot(tuple(camera_offset), tuple(sprites), overlay, input_time)
 
-        if self.flip == False:
-            surface.blit(self.get_image(), (self.x - offset[0], self.y - offset[1]))
-        else:
-            surface.blit(pygame.transform.flip(self.get_image(), True, False), (self.x - offset[0], self.y - offset[1]))
 
+def render_snapshot(surface, game, snapshot):
 
-# Main Loop ------------------------------------------------------------------------------------------------
-def main(surface):
+    """
+    Draws snapshot, same picture as render_world. Tile map is read under map_lock,
+    as streaming changes it on the main thread.
+    """
 
-    mouse_pos = (-100, -100)
+    with game["map_lock"]:
+        render_background(surface, snapshot.camera_offset, game["background"])
+        render_tiles(surface, game["chunk_cache"], snapshot.camera_offset)
+    surface.blits(snapshot.sprites, False)
 
-    tilesets = world_data.load_tilesets(f"{MAIN_PATH}/data/images/tilesets/")
-    tileset_data = world_data.load_tileset_data(f"{MAIN_PATH}/data/images/tilesets/")
 
-    world_save = "save1"
+def load_game(surface, world_save="save1.json", level=None, main_hero="player", region_budget=4 * 1024 * 1024):
 
-    spawn, borders, finish = world_data.load_world_data(f"{MAIN_PATH}/data/{world_save}.json")
+    """
+    Loads all assets and the level, returns dict with world and everything needed to draw it.
+    Level can be given directly as (tile_map, spawn, borders, finish) instead of world_save.
+    Levels compiled into regions are streamed, keeping at most region_budget bytes of regions loaded.
+    Navigation graph of level file (not of streamed or given levels) is built or loaded from its cache.
+    """
 
-    with open(f"{MAIN_PATH}/data/{world_save}.json") as file:
-        tile_map = json.load(file)
+    asset_cache.open_cache()
 
-    main_hero = "player"
+    # images are decoded on loader threads while the level loads, first screen assets go first
+    images_path = f"{MAIN_PATH}/data/images"
+    loader = AssetLoader()
 
-    player_idle_anim = entities.animation_sequence([[0, 40], [1, 20]], f"{MAIN_PATH}/data/images/{main_hero}/idle/stand_")
-    player_run_anim = entities.animation_sequence([[0, 4], [1, 4], [2, 4], [3, 4], [4, 4], [5, 4]], f"{MAIN_PATH}/data/images/{main_hero}/run/run_")
+    tileset_files = world_data.get_tileset_files(f"{images_path}/tilesets/")
+    for image_id, image_path in tileset_files:
+        loader.add_images(image_id, *world_data.get_tileset_job(image_path), functions.convert_images)
 
-    player_jump_img = functions.load_image(f"{MAIN_PATH}/data/images/{main_hero}/jump.png")
-    player_spin_img = functions.load_image(f"{MAIN_PATH}/data/images/{main_hero}/spin.png")
+    player_sequences = entities.get_player_sequences(images_path, main_hero)
+    player_frames = [path for sequence, base_path in player_sequences.values() for path in entities.get_sequence_paths(sequence, base_path)]
+    for path in player_frames:
+        loader.add_images(path, *entities.get_frame_job(path))
 
-    player = entities.entity(spawn[0] * 20 + 2, spawn[1] * 20 - 7, 12, 15)
-    player.obj.setup_hitbox(4, 10, 7, 7)
+    for path in [f"{images_path}/{main_hero}/jump.png", f"{images_path}/{main_hero}/spin.png", f"{images_path}/backgrounds/world_1.png"]:
+        loader.add(path, lambda path=path: pygame.image.load(path), lambda image: functions.convert_images([image])[0])
 
-    player.set_animation(player_idle_anim)
-    player.set_animation_tags(['loop'])
-    player.set_image(player_jump_img)
-    player.set_image(player_jump_img)
-    player_movement = [0, 0]
-    player_momentum = [0, 0]
+    animation_paths = entities.get_animation_paths(f"{images_path}/animations/")
+    for name, folder in animation_paths:
+        loader.add_images(folder, *entities.get_animation_job(folder))
 
-    finish_entity = entities.entity(finish[0] * 20 + 1, finish[1] * 20 - 6, 20, 20)
+    # effect animations are needed only after the first jump
+    loader.start([image_id for image_id, image_path in tileset_files] + player_frames + [f"{images_path}/backgrounds/world_1.png"])
 
-    speed = 4
-    jumps = 2
-    air_time = 0
-    spin_timer = 0
+    tileset_data = world_data.load_tileset_data(f"{images_path}/tilesets/")
 
-    sky_colors = {"1": (0, 230, 255)}
-    background_image = functions.load_image(f"{MAIN_PATH}/data/images/backgrounds/world_1.png")
+    streamed_map = None
+    level_path = None
 
-    world = "1"
+    if level == None:
+        level_path = f"{MAIN_PATH}/data/{world_save}"
+        region_path = level_compiler.get_region_path(level_path)
+        index = level_compiler.load_region_index(region_path, level_path)
 
-    camera_offset = [0, 0]
+        if index != None:
+            streamed_map = StreamedTileMap(region_path, index, region_budget)
+            level = streamed_map, index["spawn"], index["borders"], index["finish"]
 
-    dead = False
-    paused = False
+            # regions around spawn are needed before the first frame
+            view_width = surface.get_width() // TILE_SIZE + 1
+            view_height = surface.get_height() // TILE_SIZE + 1
+            spawn = index["spawn"]
+            streamed_map.load_area(spawn[0] - view_width, spawn[1] - view_height, spawn[0] + view_width, spawn[1] + view_height)
+        else:
+            level = level_compiler.load_level(level_path)
 
-    right, left = False, False
+    tilesets = world_data.finish_tilesets({image_id: loader.get(image_id)[0] for image_id, image_path in tileset_files})
 
-    tile_rects = None
+    tile_map, spawn, borders, finish = level
 
-    animation_objs = []
+    tile_flags = world_data.compile_tileset_data(tileset_data, tilesets)
 
-    run = True
-    while run:
+    # background tileset tiles that nothing lower lies under get their own parallax layer, only for
+    # levels loaded whole: regions of streamed levels that aren't loaded yet can't be checked, so all
+    # their tiles stay in the main layer
+    # tiles hidden under opaque tiles of the same cell are never drawn into chunks
+    draw_list = DrawList(tile_map, coverage=get_tile_coverage(tilesets, tile_flags, TILE_SIZE))
+    chunk_cache = ChunkCache(tile_map, tilesets, tile_flags, draw_list=draw_list)
+    background_tiles = set()
+    if streamed_map == None:
+        background_ids = [tileset_id for tileset_id in tilesets if tileset_id.endswith("_background")]
+        background_tiles = get_background_tiles(tile_map, background_ids, chunk_cache.margin)
+    chunk_cache.tile_filter = lambda x, y, depth, tileset_id: (x, y, depth, tileset_id) not in background_tiles
+    background_cache = ChunkCache(tile_map, tilesets, tile_flags, tile_filter=lambda x, y, depth, tileset_id: (x, y, depth, tileset_id) in background_tiles, draw_list=draw_list, atlas=chunk_cache.atlas)
 
-        # Transform mouse position according real res / visual res -----------------------------------------
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pos = (int(mouse_pos[0] * (GAME_WIDTH / SCREEN_WIDTH)),
-                     int(mouse_pos[1] * (GAME_HEIGHT / SCREEN_HEIGHT)))
+    frames = {path: loader.get(path)[0][0] for path in player_frames}
+    player_idle_anim = entities.animation_sequence(*player_sequences["idle"], frames=frames)
+    player_run_anim = entities.animation_sequence(*player_sequences["run"], frames=frames)
 
-        # Binds --------------------------------------------------------------------------------------------
-        for event in pygame.event.get():
+    player_jump_img = loader.get(f"{images_path}/{main_hero}/jump.png")
+    player_spin_img = loader.get(f"{images_path}/{main_hero}/spin.png")
 
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.display.quit()
-                sys.exit()
+    sky_colors = {"1": (0, 230, 255)}
+    background_image = loader.get(f"{images_path}/backgrounds/world_1.png")
 
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_F1:
-                    run = False
-                    pygame.display.quit()
-                    sys.exit()
-
-                if event.key == pygame.K_d:
-                    animation_objs.append(animation_obj(player.x + 8, player.y + 2, 'turn'))
-                    right = True
-
-                if event.key == pygame.K_a:
-                    animation_objs.append(animation_obj(player.x + 8, player.y + 2, 'turn', True))
-                    left = True
-
-                if event.key == pygame.K_SPACE:
-                    if dead == False:
-                        if jumps > 0:
-                            animation_objs.append(animation_obj(player.x + 8, player.y + 2, 'jump'))
-                            jumps -= 1
-                            player_momentum[1] = -6
-                            if jumps == 0:
-                                player.image = player_spin_img
-                                if player.flip == True:
-                                    spin_timer = -15
-                                else:
-                                    spin_timer = 15
-                    
-            if event.type == pygame.KEYUP:
-                if event.key == pygame.K_d:
-                    right = False
-                if event.key == pygame.K_a:
-                    left = False
+    effects = EffectManager({name: [loader.get(folder)[1], loader.get(folder)[0]] for name, folder in animation_paths})
 
+    loader.close()
+    asset_cache.save()
 
-            if event.type == pygame.MOUSEMOTION:
-                mouse_pos = pygame.mouse.get_pos()
+    world_id = "1"
 
+    # background image is anchored so that its bottom part lines up with bottom border of the level
+    background = Parallax([ColorLayer(sky_colors[world_id]),
+                           ImageLayer(background_image, 1 / 8, (0, borders[1] - 190), surface.get_width()),
+                           TileLayer(background_cache, 1)])
 
-        # Creating background
-        surface.fill(sky_colors[world])
+    sprites = {"idle": player_idle_anim, "run": player_run_anim, "jump": player_jump_img, "spin": player_spin_img}
+    enemy_images = tilesets.get("tileset_enemies", [])
+    enemy_sizes = [image.get_size() for image in enemy_images]
+    ramp_heights = world_data.compile_ramp_heights(tileset_data, TILE_SIZE)
+    world = World(tile_map, spawn, borders, finish, tile_flags, surface.get_size(), sprites, effects, enemy_sizes, ramp_heights)
 
-        background_x = -1 * ((camera_offset[0] / 8) % 400)
+    # paths for enemies, graph is loaded or built on the first path query and cached next to the level file
+    # (streamed levels have no whole collision grid)
+    nav_graph = None
+    if level_path != None and streamed_map == None:
+        nav_graph = navigation.LazyNavGraph(level_path, world.collision_grid, borders)
 
-        surface.blit(background_image, (background_x, (-camera_offset[1] + borders[1] - 190) / 8))
-        surface.blit(background_image, (background_x + 400, (-camera_offset[1] + borders[1] - 190) / 8))
+    return {"world": world,
+            "chunk_cache": chunk_cache,
+            "background_cache": background_cache,
+            "streamed_map": streamed_map,
+            "tilesets": tilesets,
+            "tile_flags": tile_flags,
+            "enemy_images": enemy_images,
+            "background": background,
+            "draw_list": draw_list,
+            "loader": loader,
+            "nav_graph": nav_graph,
+            "map_lock": threading.Lock()}
 
 
-        # Move camera based on player position
-        target_x = player.x - int(surface.get_width() / 2) + 7
-        target_y = player.y - int(surface.get_height() / 2) + 14
+def update_streaming(surface, game):
 
-        if target_x < borders[0]: # handle left border
-            target_x = borders[0]
+    """
+    Requests regions of streamed level around the camera and applies the ones
+    that finished loading or were dropped to collision grid and chunk caches.
+    """
 
-        if target_x + surface.get_width() > borders[2]: # handle right border
-            target_x = borders[2] - surface.get_width()
+    streamed_map = game["streamed_map"]
+    if streamed_map == None:
+        return
 
-        if target_y + surface.get_height() > borders[1]: # handle bottom border
-            target_y = borders[1] - surface.get_height()
+    world = game["world"]
+    camera_offset = world.get_camera_offset()
+    x1 = camera_offset[0] // TILE_SIZE
+    y1 = camera_offset[1] // TILE_SIZE
 
-        if tile_rects == None:
-            camera_offset[0] = target_x
-            camera_offset[1] = target_y
+    with game["map_lock"]:
+        for area in streamed_map.update(x1, y1, x1 + surface.get_width() // TILE_SIZE + 2, y1 + surface.get_height() // TILE_SIZE + 2):
+            world.collision_grid.update_area(*area)
+            game["chunk_cache"].invalidate_area(*area)
+            game["background_cache"].invalidate_area(*area)
 
-        if dead == False:
-            camera_offset[0] += (target_x - camera_offset[0]) / 13
-            camera_offset[1] += (target_y - camera_offset[1]) / 13
 
+def save_recording(path, world_save, frames):
 
-        # Render tiles
-        rendered = render_tiles(surface, tile_map, tilesets, tileset_data, list_to_ints(camera_offset))
-        tile_rects = []
+    """
+    Saves inputs of every frame as [elapsed time, [[action, pressed], ...]], benchmark.py replays them.
+    """
 
+    with open(path, "w") as file:
+        json.dump({"level": world_save, "frames": frames}, file)
 
-        # Get colliding tiles
-        player_speed_multiplier = 1
-        ramps = []
-        for tile in rendered:
-            collisions = True
-            ramp = 0
-            try:
-                tile_attributes = tileset_data[tile[3]][tile[4]]
-                if 'no_collide' in tile_attributes:
-                    collisions = False
-                if 'ramp' in tile_attributes:
-                    ramp = tile_attributes['ramp']
-            except KeyError:
-                pass
-            if collisions == True:
-                if ramp == 0:
-                    tile_rects.append(pygame.Rect(tile[2] * 20, tile[1] * 20, 20, 20))
-                else:
-                    ramps.append([tile[2] * 20, tile[1] * 20, ramp])
-    
 
-        # Update player position
-        player_movement = [0,0]
-        player_movement[0] += player_momentum[0] * player_speed_multiplier
-        player_movement[1] += player_momentum[1] * player_speed_multiplier
+# Main Loop ------------------------------------------------------------------------------------------------
+def draw_frame(surface, game, snapshot, overlay):
+
+    """
+    Draws snapshot and profiler overlay, runs on render thread in threaded mode.
+    """
 
-        if dead == False:
-            player_momentum[0] = normalize(player_momentum[0], 0.25)
+    render_snapshot(surface, game, snapshot)
 
-        if dead == False:
-            if abs(player_momentum[0]) < 4:
-                if right == True:
-                    player_movement[0] += speed * player_speed_multiplier
-                if left == True:
-                    player_movement[0] -= speed * player_speed_multiplier
+    if snapshot.overlay != None:
+        overlay.set_lines(snapshot.overlay)
+        overlay.update_graph(profiler)
+        overlay.draw(surface)
 
-        player_momentum[1] += 0.45
-        if player_momentum[1] > 7:
-            player_momentum[1] = 7
 
+def main(surface, world_save="save1.json", record_path=None, integer_scale=True, load_report=False, threaded=False):
 
-        # Handle collisions
-        if tile_rects != None:
-            if paused == False:
+    mouse_pos = (-100, -100)
 
-                if dead == False:
-                    player_collisions = player.move(player_movement, tile_rects, ramps)
-                else:
-                    player_collisions = player.move(player_movement, [], [])
+    load_start = time.perf_counter()
+    game = load_game(surface, world_save)
+    world = game["world"]
 
-                if player_collisions['bottom'] == True:
-                    jumps = 2
-                    player_momentum[1] = 0
-                    air_time = 0
-                    player.rotation = 0
+    key_actions = {pygame.K_d: "right", pygame.K_a: "left", pygame.K_SPACE: "jump"}
 
-                elif player_collisions['slant_bottom'] == True:
-                    jumps = 2
-                    air_time = 0
-                    player.rotation = 0
+    elapsed_time = 0
+    recording = []
 
-                else:
-                    air_time += 1
+    presenter = Presenter(pygame.display.get_surface(), surface.get_size(), integer_scale)
 
+    overlay = ProfilerOverlay(FONT)
+    overlay_timers = ["frame", "simulation", "render", "present"]
+    overlay_counters = ["chunks.blits", "tiles.culled", "physics.moves", "effects.active", "enemies.active", "present.surfaces", "alloc.kb"]
+    # present.surfaces only counts surfaces the present stage creates and alloc.kb only python memory,
+    # tracemalloc doesn't see pixels of SDL surfaces, so labels say what they cover
+    overlay_labels = {"present.surfaces": "present.surfaces (present only)", "alloc.kb": "alloc.kb (python only)"}
 
-        # Handle current player image
-        if player_movement[0] != 0:
-            player.animation = player_run_anim
-        else:
-            player.animation = player_idle_anim
-        
-        if air_time > 6:
-            player.animation = None
-        
-        if player_movement[0] < 0:
-            player.flip = True
-        elif player_movement[0] > 0:
-            player.flip = False
-    
-        if spin_timer > 0:
-            spin_timer -= 1
-            player.rotation -= 24
+    # with threaded, frames are drawn on render thread from snapshots, one frame behind simulation
+    renderer = None
+    if threaded:
+        renderer = RenderThread(surface, presenter, lambda surface, snapshot: draw_frame(surface, game, snapshot, overlay))
 
-        elif spin_timer < 0:
-            spin_timer += 1
-            player.rotation += 24
-        else:
-            player.image = player_jump_img
+    run = True
+    while run:
 
-        player.change_frame(1)
+        frame_start = profiler.begin()
 
-        if dead == True:
-            player.rotation -= 24
-        
+        # Transform mouse position according real res / visual res -----------------------------------------
+        mouse_pos = presenter.to_game_pos(pygame.mouse.get_pos())
 
-        # Handle border collision
-        if player.y > borders[1]:
-            if dead == False:
-                dead = True
-                player_momentum = [3, -8]
+        # Binds --------------------------------------------------------------------------------------------
+        inputs = []
+        for event in pygame.event.get():
 
-        if player.x < borders[0]:
-            player.x = borders[0]
-            player.obj.rect.x = borders[0]
-            player.obj.x = borders[0]
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_F1):
+                run = False
+                if record_path != None:
+                    save_recording(record_path, world_save, recording)
+                if renderer != None:
+                    renderer.close()
+                if game["streamed_map"] != None:
+                    game["streamed_map"].close()
+                pygame.display.quit()
+                sys.exit()
 
-        if player.x + 15 > borders[2]:
-            player.x = borders[2] - 15
-            player.obj.rect.x = borders[2] - 15
-            player.obj.x = borders[2] - 15
+            if event.type == pygame.KEYDOWN:
+                if event.key in key_actions:
+                    inputs.append((key_actions[event.key], True))
 
+                if event.key == pygame.K_F3: # toggle profiler overlay
+                    profiler.enabled = not profiler.enabled
+                    profiler.reset()
 
-        # Blit entities 
-        player.display(surface, list_to_ints(camera_offset))
+                if event.key == pygame.K_F4 and profiler.enabled: # dump last frames of profiler
+                    profiler.dump(f"{MAIN_PATH}/profile_{int(time.time())}.json")
 
-        if player.obj.rect.colliderect(finish_entity.obj.rect):
-            player.set_pos(spawn[0] * 20 + 2, spawn[1] * 20 - 7)
-            player_momentum = [0, 0]
+                if event.key == pygame.K_F5: # toggle allocation tracking, slows the game down
+                    profiler.track_allocations(not tracemalloc.is_tracing())
+                    
+            if event.type == pygame.KEYUP:
+                if event.key in key_actions:
+                    inputs.append((key_actions[event.key], False))
+
+            if event.type == pygame.VIDEORESIZE:
+                if renderer != None: # render thread scales into the window, let it finish first
+                    renderer.wait()
+                presenter.resize(pygame.display.get_surface())
+
+
+        # Simulate -----------------------------------------------------------------------------------------
+        if record_path != None:
+            recording.append([elapsed_time, inputs])
+        start = profiler.begin()
+        update_streaming(surface, game)
+        world.advance(elapsed_time, inputs)
+        profiler.end("simulation", start)
+
+        # Draw ---------------------------------------------------------------------------------------------
+        overlay_lines = None
+        if profiler.enabled:
+            overlay_lines = ([f"{mouse_pos}", f"{round(MAIN_CLOCK.get_fps(), 2)} fps"] +
+                             [f"{name} {profiler.get_average(name):.2f}ms" for name in overlay_timers] +
+                             [f"{overlay_labels.get(name, name)} {profiler.get_average(name):.1f}" for name in overlay_counters])
+
+        if renderer == None:
+            start = profiler.begin()
+            render_world(surface, game)
+            profiler.end("render", start)
+
+            if overlay_lines != None:
+                overlay.set_lines(overlay_lines)
+                overlay.update_graph(profiler)
+                overlay.draw(surface)
+
+            # Update ---------------------------------------------------------------------------------------
+            start = profiler.begin()
+            presenter.present(surface)
+            profiler.end("present", start)
 
-        for obj in animation_objs:
-            obj.render(surface, list_to_ints(camera_offset))
-            if obj.change_frame(1) != None:
-                animation_objs.remove(obj)
+        else:
+            snapshot = take_snapshot(game, surface.get_size(), overlay_lines)
 
+            # Update (previous frame, drawn while this one was simulated) -----------------------------------
+            start = profiler.begin()
+            if renderer.wait() != None:
+                presenter.flip()
+            renderer.submit(snapshot)
+            profiler.end("present", start)
 
-        debug(surface, FONT, mouse_pos, round(MAIN_CLOCK.get_fps(), 2))
+        if load_report: # per asset load times and time from start of loading to the first frame on screen
+            game["loader"].print_report((time.perf_counter() - load_start) * 1000)
+            load_report = False
 
-        # Update -------------------------------------------------------------------------------------------
-        SCREEN.blit(pygame.transform.scale(surface, (SCREEN_WIDTH, SCREEN_HEIGHT)), (0, 0))
-        pygame.display.update()
+        profiler.end("frame", frame_start)
+        profiler.end_frame()
         elapsed_time = MAIN_CLOCK.tick(60) / 1000
  
 
@@ -441,19 +445,42 @@ if __name__ == "__main__":
     # Setup pygame/window ----------------------------------------------------------------------------------
     GAME_NAME = "MindTaker"
     VERSION = "alpha-1.0"
-    MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
 
     pygame.init()
     pygame.font.init()
 
     MAIN_CLOCK = pygame.time.Clock()
 
+    # python main.py [level.json] [--record inputs.json] [--window 1280x720] [--fit] [--load-report] [--threaded]
+    arguments = sys.argv[1:]
+    record_path = None
+    if "--record" in arguments:
+        record_path = arguments.pop(arguments.index("--record") + 1)
+        arguments.remove("--record")
+
     SCREEN_WIDTH = 1920 // 2
     SCREEN_HEIGHT = 1080 // 2
+    if "--window" in arguments:
+        SCREEN_WIDTH, SCREEN_HEIGHT = [int(size) for size in arguments.pop(arguments.index("--window") + 1).split("x")]
+        arguments.remove("--window")
+
+    integer_scale = True
+    if "--fit" in arguments: # fill as much of the window as possible instead of whole multiples
+        integer_scale = False
+        arguments.remove("--fit")
+
+    load_report = "--load-report" in arguments
+    if load_report:
+        arguments.remove("--load-report")
+
+    threaded = "--threaded" in arguments # simulate on main thread, draw snapshots on render thread
+    if threaded:
+        arguments.remove("--threaded")
+
     GAME_WIDTH = 480
     GAME_HEIGHT = 270
 
-    SCREEN = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    SCREEN = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
     GAME_WINDOW = pygame.Surface((GAME_WIDTH, GAME_HEIGHT))
     pygame.display.set_caption(f"{GAME_NAME} v: {VERSION}")
     pygame.display.set_icon(functions.load_image(f"{MAIN_PATH}/data/images/game_icon.png"))
@@ -462,7 +489,7 @@ if __name__ == "__main__":
 
 
     # Run Game ---------------------------------------------------------------------------------------------
-    main(GAME_WINDOW)
+    main(GAME_WINDOW, *arguments[:1], record_path=record_path, integer_scale=integer_scale, load_report=load_report, threaded=threaded)
 
     # Close ------------------------------------------------------------------------------------------------
     pygame.quit()
@@ -0,0 +1,27 @@
+"""
+Vectorized tile search has to find the same tiles as the pixel scan, on tileset images
+loaded the way decode_tileset loads them (unconverted, in the file's own pixel format).
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+
+import pygame
+import pytest
+
+MAIN_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_PATH)
+
+import data.world_data as world_data
+
+
+TILESET_PATH = f"{MAIN_PATH}/data/images/tilesets/"
+
+
+@pytest.mark.skipif(world_data.numpy == None, reason="find_tiles falls back to the scan without numpy")
+@pytest.mark.parametrize("image_path", sorted(image_path for image_path in os.listdir(TILESET_PATH) if image_path[-4:] == ".png"))
+def test_find_tiles_matches_scan(image_path):
+    image = pygame.image.load(TILESET_PATH + image_path)
+    assert world_data.find_tiles(image) == world_data.find_tiles_scan(image)
@@ -0,0 +1,55 @@
+"""
+Compiled levels and regions that are cut short must not load as valid tile maps.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import shutil
+
+import pytest
+
+MAIN_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_PATH)
+
+import data.level_compiler as level_compiler
+
+
+def get_source(tmp_path):
+    path = str(tmp_path / "save1.json")
+    shutil.copy2(f"{MAIN_PATH}/data/save1.json", path)
+    return path
+
+
+def test_truncated_level_falls_back_to_source(tmp_path):
+    path = get_source(tmp_path)
+    compiled_path = level_compiler.compile_level(path)
+    assert not os.path.exists(compiled_path + ".tmp")
+
+    source_map = level_compiler.read_source_level(path)
+    assert level_compiler.load_compiled_level(compiled_path, path)[0].tiles == source_map.tiles
+
+    with open(compiled_path, "rb") as file:
+        data = file.read()
+    with open(compiled_path, "wb") as file:
+        file.write(data[:-7])
+
+    assert level_compiler.load_compiled_level(compiled_path, path) == None
+    assert level_compiler.load_level(path)[0].tiles == source_map.tiles
+
+
+def test_truncated_region_raises(tmp_path):
+    path = get_source(tmp_path)
+    region_path = level_compiler.compile_regions(path)
+    names = level_compiler.load_region_index(region_path, path)["names"]
+    region_file = os.path.join(region_path, sorted(name for name in os.listdir(region_path) if name.endswith(".bin"))[0])
+    level_compiler.load_region(region_file, names)
+
+    with open(region_file, "rb") as file:
+        data = file.read()
+    with open(region_file, "wb") as file:
+        file.write(data[:-1])
+
+    with pytest.raises(ValueError):
+        level_compiler.load_region(region_file, names)
@@ -0,0 +1,58 @@
+"""
+Ramp shapes from tileset data: straight slopes by their end heights and any other shape
+by an explicit height for every pixel column, which get_ramp_floor has to follow.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import math
+
+import pytest
+
+MAIN_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_PATH)
+
+import data.world_data as world_data
+from data.collision import CollisionGrid
+from data.tile_map import TileMap
+
+
+TILE_SIZE = 20
+
+
+def get_grid(tileset_data):
+    ramp_heights = world_data.compile_ramp_heights(tileset_data, TILE_SIZE)
+    return CollisionGrid(TileMap(0, 0, 1, 1), {}, TILE_SIZE, ramp_heights)
+
+
+def test_straight_slopes_are_default():
+    ramp_heights = world_data.compile_ramp_heights({}, TILE_SIZE)
+    assert list(ramp_heights[1]) == list(range(TILE_SIZE + 1))
+    assert list(ramp_heights[2]) == list(range(TILE_SIZE, -1, -1))
+
+
+def test_floor_follows_curved_ramp():
+    # quarter circle, rises steeply first and then flattens out
+    heights = [round(TILE_SIZE * math.sqrt(1 - (1 - column / TILE_SIZE) ** 2)) for column in range(TILE_SIZE + 1)]
+    grid = get_grid({"ramp": {3: {"heights": heights}}})
+
+    for column in range(TILE_SIZE + 1):
+        assert grid.get_ramp_floor(3, 0, 0, column, column) == TILE_SIZE - heights[column]
+    for left in range(TILE_SIZE + 1):
+        for right in range(left, TILE_SIZE + 1):
+            assert grid.get_ramp_floor(3, 0, 0, left, right) == TILE_SIZE - max(heights[left:right + 1])
+
+
+def test_floor_under_bump_is_its_top():
+    heights = [0] * 5 + [12] * 3 + [0] * 13
+    grid = get_grid({"ramp": {3: {"heights": heights}}})
+    # box standing over the bump, but with both edges on the flat part, still rests on top of it
+    assert grid.get_ramp_floor(3, 0, 0, 2, 14) == TILE_SIZE - 12
+    assert grid.get_ramp_floor(3, 0, 0, 9, 14) == TILE_SIZE
+
+
+def test_heights_need_every_column():
+    with pytest.raises(ValueError):
+        world_data.compile_ramp_heights({"ramp": {3: {"heights": [0, 1, 2]}}}, TILE_SIZE)
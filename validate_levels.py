@@ -0,0 +1,284 @@
+"""
+Headless level validation. A bot searches every level for a way from spawn to finish
+using the game physics (World.step), one level per process on all CPU cores.
+Run:  python validate_levels.py [level.json ...] [--workers N] [--output report.json]
+Without levels every level in data/ is checked. Each level passes when it has spawn and
+finish markers, spawn lies inside the level borders, the bot reaches the finish and there is
+no pit: a place the bot can get to where it can't die and can't reach the finish from.
+"""
+
+
+# ALL IMPORTS ----------------------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import data.world as world_module
+from data.world import TILE_SIZE
+
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Bot moves, every move starts standing on ground and ends when player lands again -------------------------
+WALK_TICKS = 8
+DOUBLE_JUMP_DELAYS = (6, 12, 18)
+MAX_MOVE_TICKS = 300
+POSITION_STEP = 2 # standing positions closer than this many pixels count as the same
+
+
+def get_moves():
+
+    """
+    Returns moves as (direction, ticks of second jump press): None is walking
+    for WALK_TICKS, 0 a single jump, other values a double jump after that many ticks.
+    """
+
+    return [(direction, jump) for direction in (-1, 0, 1) for jump in (None, 0) + DOUBLE_JUMP_DELAYS
+            if not (direction == 0 and jump == None)]
+
+
+def set_direction(world, direction):
+    world.handle_input("right", direction > 0)
+    world.handle_input("left", direction < 0)
+
+
+def run_move(world, move):
+
+    """
+    Plays one move from current state. Returns ("finish" | "dead" | "landed" | "timeout", ticks).
+    """
+
+    direction, jump = move
+    finishes = world.finishes
+    set_direction(world, direction)
+
+    if jump != None:
+        world.handle_input("jump", True)
+
+    for tick in range(1, MAX_MOVE_TICKS + 1):
+
+        if jump != None and jump > 0 and tick == jump:
+            world.handle_input("jump", True)
+        if jump == None and tick == WALK_TICKS:
+            set_direction(world, 0)
+
+        world.step()
+
+        if world.finishes != finishes:
+            return "finish", tick
+        if world.dead:
+            return "dead", tick
+        if world.air_time == 0 and tick >= WALK_TICKS:
+            return "landed", tick
+
+    return "timeout", MAX_MOVE_TICKS
+
+
+def get_position_key(world):
+    return int(world.player.x) // POSITION_STEP, int(world.player.y) // POSITION_STEP
+
+
+def check_spawn(world):
+
+    """
+    Tells whether spawn position lies inside level borders.
+    """
+
+    x, y = world.get_spawn_pos()
+    return world.borders[0] <= x <= world.borders[2] - 15 and y < world.borders[1]
+
+
+def search_level(world, max_positions):
+
+    """
+    Breadth first search over standing positions reachable from spawn.
+    Returns dict with finish ticks (shortest found, None when unreachable), explored
+    positions, pit cells and number of simulated ticks.
+    """
+
+    # let the player fall onto the ground below spawn first
+    state = world.save_state()
+    result, ticks = run_move(world, (0, None))
+    simulated = ticks
+
+    start = get_position_key(world)
+    states = {start: world.save_state()}
+    distance = {start: ticks}
+    edges = {start: set()}
+    reaches_finish = set()
+    deadly = set()
+    finish_ticks = None
+    complete = True
+
+    queue = deque([start])
+    if result != "landed":
+        queue.clear()
+        if result == "finish":
+            reaches_finish.add(start)
+            finish_ticks = ticks
+
+    while queue:
+        position = queue.popleft()
+
+        for move in get_moves():
+            world.restore_state(states[position])
+            result, ticks = run_move(world, move)
+            simulated += ticks
+
+            if result == "finish":
+                reaches_finish.add(position)
+                if finish_ticks == None or distance[position] + ticks < finish_ticks:
+                    finish_ticks = distance[position] + ticks
+
+            if result == "dead":
+                deadly.add(position)
+
+            if result != "landed":
+                continue
+
+            landed = get_position_key(world)
+            edges[position].add(landed)
+            if landed in states:
+                continue
+
+            if len(states) >= max_positions:
+                complete = False
+                continue
+
+            states[landed] = world.save_state()
+            distance[landed] = distance[position] + ticks
+            edges[landed] = set()
+            queue.append(landed)
+
+    world.restore_state(state)
+
+    # positions leading to finish, walking edges backwards from the ones that reach it directly
+    incoming = {position: [] for position in states}
+    for position, targets in edges.items():
+        for target in targets:
+            incoming[target].append(position)
+
+    winnable = set(reaches_finish)
+    stack = list(reaches_finish)
+    while stack:
+        for position in incoming[stack.pop()]:
+            if position not in winnable:
+                winnable.add(position)
+                stack.append(position)
+
+    # positions player can neither win nor die from, same walk backwards from deadly ones
+    escapable = set(deadly)
+    stack = list(deadly)
+    while stack:
+        for position in incoming[stack.pop()]:
+            if position not in escapable:
+                escapable.add(position)
+                stack.append(position)
+
+    pits = set()
+    if complete and finish_ticks != None:
+        pits = {(x * POSITION_STEP // TILE_SIZE, y * POSITION_STEP // TILE_SIZE) for x, y in states
+                if (x, y) not in winnable and (x, y) not in escapable}
+
+    return {"finish_ticks": finish_ticks,
+            "positions": len(states),
+            "complete": complete,
+            "pits": sorted(pits),
+            "ticks": simulated}
+
+
+def validate_level(level_name, max_positions=3000):
+
+    """
+    Loads level and runs every check on it, runs in a worker process.
+    """
+
+    start = time.perf_counter()
+    world = world_module.load_world(MAIN_PATH, level_name)
+    world.enemies = None
+    load_time = time.perf_counter() - start
+
+    markers = world.tile_map.tileset_ids.get("spawn") != None and world.tile_map.tileset_ids.get("finish") != None
+    spawn_inside = check_spawn(world)
+
+    start = time.perf_counter()
+    search = search_level(world, max_positions)
+    search_time = time.perf_counter() - start
+
+    checks = {"markers": markers,
+              "spawn_inside_borders": spawn_inside,
+              "finish_reachable": search["finish_ticks"] != None,
+              "no_pits": search["pits"] == []}
+
+    return {"level": level_name,
+            "passed": all(checks.values()),
+            "checks": checks,
+            "finish_ticks": search["finish_ticks"],
+            "positions": search["positions"],
+            "search_complete": search["complete"],
+            "pits": search["pits"],
+            "simulated_frames": search["ticks"],
+            "load_time_ms": load_time * 1000,
+            "frames_per_second": search["ticks"] / max(search_time, 1e-9)}
+
+
+def get_levels():
+    return sorted(name for name in os.listdir(f"{MAIN_PATH}/data") if name[-5:] == ".json")
+
+
+def validate_levels(levels, workers=None, max_positions=3000):
+
+    """
+    Validates levels in parallel, every worker process loads its own level and shares nothing.
+    Returns report dict with per level results and total throughput.
+    """
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(validate_level, levels, [max_positions] * len(levels)))
+    elapsed = time.perf_counter() - start
+
+    frames = sum(result["simulated_frames"] for result in results)
+    return {"levels": results,
+            "passed": all(result["passed"] for result in results),
+            "workers": workers or os.cpu_count(),
+            "simulated_frames": frames,
+            "time_s": elapsed,
+            "frames_per_second": frames / max(elapsed, 1e-9)}
+
+
+def print_report(report):
+    print(f"{'level':<20}{'result':>8}{'finish':>9}{'positions':>11}{'frames':>10}{'frames/s':>11}  failed checks")
+    for result in report["levels"]:
+        finish = "-" if result["finish_ticks"] == None else str(result["finish_ticks"])
+        failed = ", ".join(check for check, passed in result["checks"].items() if passed == False)
+        if result["pits"] != []:
+            failed += f" {result['pits'][:5]}"
+        print(f"{result['level']:<20}{'pass' if result['passed'] else 'FAIL':>8}{finish:>9}{result['positions']:>11}"
+              f"{result['simulated_frames']:>10}{result['frames_per_second']:>11.0f}  {failed}")
+    print(f"{report['simulated_frames']} frames in {report['time_s']:.2f} s on {report['workers']} workers: {report['frames_per_second']:.0f} simulated frames/s")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check levels headlessly with a bot searching for the finish.")
+    parser.add_argument("levels", nargs="*", help="level files in data/, all of them by default")
+    parser.add_argument("--workers", type=int, help="worker processes, all CPU cores by default")
+    parser.add_argument("--max-positions", type=int, default=3000, help="standing positions the bot explores per level")
+    parser.add_argument("--output", default="level_report.json", help="where to write the report")
+    arguments = parser.parse_args()
+
+    report = validate_levels(arguments.levels or get_levels(), arguments.workers, arguments.max_positions)
+    print_report(report)
+
+    with open(arguments.output, "w") as file:
+        json.dump(report, file, indent=4)
+
+    sys.exit(0 if report["passed"] else 1)